@@ -1,37 +1,40 @@
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
-from sqlalchemy import inspect, text
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+import asyncio
+import re
+import time
+from sqlalchemy import text
 from config import settings
-from database import get_db
-from datetime import date
-# Configure Gemini
-genai.configure(api_key=settings.GOOGLE_API_KEY)
-
-def serialize_date(obj):
-    """Convert date objects to ISO format strings."""
-    if isinstance(obj, date):
-        return obj.isoformat()
-    return obj
+from database import engine, AsyncSessionLocal
+from schema_catalog import SchemaCatalog
+from query_cache import QueryCache, normalize_question
+from table_router import TableRouter, RoutingDecision
+from result_cache import ResultCache, TableVersions, TableChangeMonitor
+from prompt_builder import SchemaPromptBuilder, ColumnProfiler, estimate_tokens
+from llm_backends import LLMBackend, create_backend
+from llm_gateway import LLMGateway, LLMError, LLMQuotaError, INTERACTIVE, BATCH
+from telemetry import Telemetry, Span
+from sql_guard import SQLGuard, SQLRejected, GuardDecision
+from result_set import ResultSet
+from result_summary import ResultSummarizer, ResultSummary
+from answer_formatter import AnswerFormatter
+from single_flight import SingleFlight
+from index_advisor import SQLWorkload, IndexAdvisor
+from rollups import RollupManager, ROLLUP_PREFIX
+from value_index import ValueIndex, ValueMatch
+from sql_utils import canonicalize_sql
 
 
 class SchemaAgent:
-    def __init__(self) -> None:
-        self.model = genai.GenerativeModel(settings.MODEL_NAME)
+    def __init__(self, catalog: SchemaCatalog, llm: LLMGateway) -> None:
+        self.llm = llm
+        self.catalog = catalog
+        self.router = TableRouter(catalog)
     
     def get_schema_info(self) -> str:
-        """Get database schema information."""
-        db = next(get_db())
-        inspector = inspect(db.bind)
-        schema_info = []
-        
-        for table_name in inspector.get_table_names():
-            columns = inspector.get_columns(table_name)
-            col_info = [f"{col['name']} ({col['type'].__class__.__name__})" for col in columns]
-            schema_info.append(f"Table: {table_name}\nColumns: {', '.join(col_info)}")
-        
-        return "\n\n".join(schema_info)
+        """Get database schema information from the schema catalog."""
+        return self.catalog.describe()
     
-    def identify_relevant_tables(self, query: str) -> List[str]:
+    async def identify_relevant_tables(self, query: str, priority: int = INTERACTIVE) -> List[str]:
         """Identify relevant tables for the query."""
         schema_info = self.get_schema_info()
         prompt = f"""You are a database expert. Given a schema and a natural language query,
@@ -42,18 +45,39 @@ class SchemaAgent:
             
             Query: {query}"""
         
-        response = self.model.generate_content(prompt)
-        return [table.strip() for table in response.text.split(",")]
+        response = await self.llm.generate(prompt, priority, stage="tables", question=query)
+        # Accept comma- or newline-separated replies and keep only tables that exist
+        names = re.split(r"[,\n]", response.text.replace("```", ""))
+        return self.router.validate(names)
+    
+    async def route_tables(self, query: str, priority: int = INTERACTIVE) -> RoutingDecision:
+        """Pick relevant tables locally, falling back to the LLM when routing confidence is low."""
+        decision = self.router.route(query)
+        if decision.tables and decision.confidence >= settings.TABLE_ROUTER_MIN_CONFIDENCE:
+            return decision
+        
+        decision.fallback_reason = "no table matched" if not decision.tables else "low confidence"
+        llm_tables = await self.identify_relevant_tables(query, priority)
+        if llm_tables:
+            decision.tables, decision.join_tables = self.router.expand(llm_tables)
+            decision.method = "llm"
+        elif not decision.tables:
+            # Nothing usable from either side; let the SQL generator see every table
+            decision.tables = self.catalog.table_names()
+            decision.method = "all_tables"
+        return decision
         
 
 class SQLGeneratorAgent:
-    def __init__(self) -> None:
-        self.model = genai.GenerativeModel(settings.MODEL_NAME)
+    def __init__(self, llm: LLMGateway) -> None:
+        self.llm = llm
     
-    def generate_sql(self, query: str, schema_info: str, relevant_tables: List[str]) -> str:
-        """Generate SQL query from natural language."""
-        prompt = f"""You are an SQL expert. Given a schema and a natural language query,
+    def build_prompt(self, query: str, schema_info: str, relevant_tables: List[str], value_hints: str = "") -> str:
+        if value_hints:
+            schema_info += f"\n\nStored values similar to words in the query (use these exact literals):\n{value_hints}"
+        return f"""You are an SQL expert. Given a schema and a natural language query,
             generate a valid PostgreSQL query. The query should be efficient and use appropriate joins.
+            Use the listed join paths to join tables and the listed column values for literals.
             Return only the SQL query, nothing else.
             
             Schema:
@@ -61,8 +85,13 @@ class SQLGeneratorAgent:
             
             Relevant tables: {', '.join(relevant_tables)}
             Query: {query}"""
+    
+    async def generate_sql(self, query: str, schema_info: str, relevant_tables: List[str],
+                           priority: int = INTERACTIVE, value_hints: str = "") -> str:
+        """Generate SQL query from natural language."""
+        prompt = self.build_prompt(query, schema_info, relevant_tables, value_hints)
         
-        response = self.model.generate_content(prompt)
+        response = await self.llm.generate(prompt, priority, stage="sql", question=query)
         # return response.text.strip()
         sql = response.text.strip()
         
@@ -72,131 +101,625 @@ class SQLGeneratorAgent:
         return sql
 
 class RetrieverAgent:
-    def execute_query(self, sql_query: str) -> List[Dict[str, Any]]:
-        """Execute SQL query and return results."""
-        db = next(get_db())
+    def __init__(self, guard: SQLGuard, chunk_rows: int = 1000, max_bytes: int = 0) -> None:
+        self.guard = guard
+        self.chunk_rows = chunk_rows
+        self.max_bytes = max_bytes
+    
+    async def iter_results(self, decision: GuardDecision, keep_rows: bool = True,
+                           sql: Optional[str] = None) -> AsyncIterator[Tuple[ResultSet, List[Tuple]]]:
+        """Stream a statement prepared by the SQL guard through a server-side cursor.
+        
+        First yields the empty result set (columns known), then each chunk of
+        accepted rows. Reading stops at the guard's row cap or the byte cap.
+        Runs in a read-only transaction; the guard may lower the statement's
+        LIMIT (updating `decision`) or raise SQLRejected after planning it.
+        `sql` runs an equivalent statement (a rollup rewrite) in place of
+        `decision.sql`.
+        """
         try:
-            result = db.execute(text(sql_query))
-            columns = result.keys()
-            rows = result.fetchall()
-            # return [dict(zip(columns, row)) for row in rows]
-            return [{col: serialize_date(val) for col, val in zip(columns, row)} for row in rows]
-
+            # Closing the session rolls back the (read-only) transaction and the cursor
+            async with AsyncSessionLocal() as db:
+                sql = await self.guard.review(db, decision, sql)
+                result = await db.stream(text(sql))
+                results = ResultSet(result.keys(), max_rows=decision.limit or 0, max_bytes=self.max_bytes,
+                                    keep_rows=keep_rows)
+                yield results, []
+                async for partition in result.partitions(self.chunk_rows):
+                    chunk = results.add_chunk(partition)
+                    if chunk:
+                        yield results, chunk
+                    if results.truncated:
+                        break
+        except SQLRejected:
+            raise
         except Exception as e:
             raise Exception(f"Query execution failed: {str(e)}")
+    
+    async def execute_query(self, decision: GuardDecision, sql: Optional[str] = None) -> ResultSet:
+        """Execute a statement prepared by the SQL guard (or `sql` in its place) and return its (capped) result set."""
+        results = None
+        async for results, _ in self.iter_results(decision, sql=sql):
+            pass
+        return results
 
 class SynthesizerAgent:
-    def __init__(self) -> None:
-        self.model = genai.GenerativeModel(settings.MODEL_NAME)
+    def __init__(self, llm: LLMGateway, summarizer: ResultSummarizer) -> None:
+        self.llm = llm
+        self.summarizer = summarizer
     
-    def synthesize_answer(self, query: str, sql_query: str, results: List[Dict[str, Any]]) -> str:
-        """Generate natural language answer from query results."""
-        prompt = f"""You are a helpful assistant that explains database query results in natural language.
+    def summarize(self, results: ResultSet) -> ResultSummary:
+        """Digest of the results that fits the synthesis prompt's token budget."""
+        return self.summarizer.summarize(results)
+    
+    def build_prompt(self, query: str, sql_query: str, summary: ResultSummary) -> str:
+        return f"""You are a helpful assistant that explains database query results in natural language.
             Provide a clear and concise answer based on the query results.
+            Large results are described by column statistics and sample rows; rely on the statistics for totals and ranges.
             
             Original question: {query}
             SQL Query used: {sql_query}
-            Query results: {results}
+            Query results:
+{summary.text}
             
             Please provide a natural language answer to the original question."""
-        
-        response = self.model.generate_content(prompt)
+    
+    async def synthesize_answer(self, query: str, sql_query: str, summary: ResultSummary,
+                                priority: int = INTERACTIVE) -> str:
+        """Generate natural language answer from a summary of the query results."""
+        prompt = self.build_prompt(query, sql_query, summary)
+        response = await self.llm.generate(prompt, priority, stage="answer", question=query)
         return response.text.strip()
+    
+    async def stream_answer(self, query: str, sql_query: str, summary: ResultSummary,
+                            priority: int = INTERACTIVE) -> AsyncIterator[str]:
+        """Generate the answer incrementally, yielding text chunks as Gemini produces them."""
+        prompt = self.build_prompt(query, sql_query, summary)
+        async for chunk in self.llm.generate_stream(prompt, priority, stage="answer", question=query):
+            yield chunk
+
+def llm_error_result(e: LLMError, quota_message: str, intermediate_steps: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the error result for an LLM stage that failed after the gateway's retries."""
+    if isinstance(e, LLMQuotaError):
+        error, error_type = quota_message, "api_quota"
+    else:
+        error, error_type = "Google API is currently unavailable. Please try again later.", "api_unavailable"
+    return {
+        "error": error,
+        "error_type": error_type,
+        "original_error": str(e),
+        "intermediate_steps": intermediate_steps
+    }
+
+def sql_rejected_result(e: SQLRejected, intermediate_steps: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the error result for generated SQL refused by the guard; the plan is in `intermediate_steps.guard`."""
+    return {
+        "error": f"Generated SQL was rejected: {e.decision.reason}",
+        "error_type": "sql_rejected",
+        "original_error": str(e),
+        "intermediate_steps": intermediate_steps
+    }
 
 class MultiAgentSystem:
-    def __init__(self) -> None:
-        self.schema_agent = SchemaAgent()
-        self.sql_generator = SQLGeneratorAgent()
-        self.retriever = RetrieverAgent()
-        self.synthesizer = SynthesizerAgent()
+    def __init__(self, llm_backend: Optional[LLMBackend] = None) -> None:
+        # Build the schema catalog once; agents read schema from it instead of re-inspecting
+        self.catalog = SchemaCatalog(engine, refresh_interval=settings.SCHEMA_REFRESH_INTERVAL,
+                                     exclude_prefixes=(ROLLUP_PREFIX,))
+        self.catalog.load()
+        self.query_cache = QueryCache(
+            max_entries=settings.QUERY_CACHE_SIZE,
+            ttl=settings.QUERY_CACHE_TTL,
+            path=settings.QUERY_CACHE_PATH,
+            save_interval=settings.QUERY_CACHE_SAVE_INTERVAL,
+        )
+        self.table_versions = TableVersions()
+        self.result_cache = ResultCache(
+            self.table_versions,
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            ttl=settings.RESULT_CACHE_TTL,
+        )
+        self.change_monitor = TableChangeMonitor(
+            self.table_versions,
+            engine,
+            self.catalog.table_names(),
+            mode=settings.TABLE_CHANGE_DETECTION,
+            poll_interval=settings.TABLE_CHANGE_POLL_INTERVAL,
+        )
+        self.telemetry = Telemetry(
+            trace_endpoint=settings.TRACE_EXPORT_ENDPOINT,
+            service_name=settings.TRACE_SERVICE_NAME,
+        )
+        # One gateway shared by every agent, so rate limits and the circuit breaker are global
+        self.llm = LLMGateway(
+            llm_backend or create_backend(settings),
+            requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff_base=settings.LLM_BACKOFF_BASE,
+            backoff_max=settings.LLM_BACKOFF_MAX,
+            breaker_threshold=settings.LLM_BREAKER_THRESHOLD,
+            breaker_cooldown=settings.LLM_BREAKER_COOLDOWN,
+            telemetry=self.telemetry,
+        )
+        self.telemetry.track_gateway(self.llm)
+        self.schema_agent = SchemaAgent(self.catalog, self.llm)
+        # One column profiler feeds both the schema prompt's value hints and the value index
+        self.profiler = ColumnProfiler(
+            engine,
+            max_values=max(settings.COLUMN_HINT_MAX_VALUES,
+                           settings.VALUE_INDEX_MAX_VALUES if settings.VALUE_INDEX_ENABLED else 0),
+            ttl=settings.COLUMN_HINTS_TTL,
+        )
+        self.prompt_builder = SchemaPromptBuilder(
+            self.catalog,
+            self.schema_agent.router,
+            profiler=self.profiler if settings.COLUMN_HINTS_ENABLED else None,
+            token_budget=settings.SCHEMA_PROMPT_TOKEN_BUDGET,
+            max_hint_values=settings.COLUMN_HINT_MAX_VALUES,
+        )
+        self.sql_generator = SQLGeneratorAgent(self.llm)
+        self.sql_guard = SQLGuard(
+            max_rows=settings.SQL_MAX_ROWS,
+            statement_timeout_ms=settings.SQL_STATEMENT_TIMEOUT_MS,
+            max_cost=settings.SQL_MAX_COST,
+            max_plan_rows=settings.SQL_MAX_PLAN_ROWS,
+            downgrade_rows=settings.SQL_DOWNGRADE_ROWS,
+        )
+        self.retriever = RetrieverAgent(
+            self.sql_guard,
+            chunk_rows=settings.RESULT_CHUNK_ROWS,
+            max_bytes=settings.RESULT_MAX_BYTES,
+        )
+        self.synthesizer = SynthesizerAgent(
+            self.llm,
+            ResultSummarizer(
+                token_budget=settings.RESULT_SUMMARY_TOKEN_BUDGET,
+                sample_rows=settings.RESULT_SUMMARY_SAMPLE_ROWS,
+                top_k=settings.RESULT_SUMMARY_TOP_K,
+            ),
+        )
+        self.answer_formatter = AnswerFormatter(
+            max_rows=settings.ANSWER_FORMATTER_MAX_ROWS,
+            max_columns=settings.ANSWER_FORMATTER_MAX_COLUMNS,
+        ) if settings.ANSWER_FORMATTER_ENABLED else None
+        # Concurrent identical requests and stages share one in-flight execution
+        self.flights = SingleFlight(enabled=settings.SINGLE_FLIGHT_ENABLED)
+        # Executed SQL and its database time, for index advice
+        self.workload = SQLWorkload(
+            max_entries=settings.INDEX_ADVISOR_MAX_STATEMENTS,
+            path=settings.INDEX_ADVISOR_WORKLOAD_PATH,
+            flush_interval=settings.INDEX_ADVISOR_FLUSH_INTERVAL,
+        )
+        self.index_advisor = IndexAdvisor(engine, self.catalog, self.workload)
+        # Aggregates over sales answered from precomputed rollups
+        self.rollups = RollupManager(
+            engine,
+            enabled=settings.ROLLUPS_ENABLED,
+            refresh_interval=settings.ROLLUP_REFRESH_INTERVAL,
+            gap_retention=settings.ROLLUP_GAP_RETENTION,
+        )
+        # Stored values of enum-like text columns, for literals in generated SQL
+        self.value_index = ValueIndex(
+            self.catalog,
+            self.profiler,
+            versions=self.table_versions,
+            columns=settings.VALUE_INDEX_COLUMNS.split(","),
+            refresh_interval=settings.VALUE_INDEX_REFRESH_INTERVAL,
+            min_similarity=settings.VALUE_INDEX_MIN_SIMILARITY,
+            repair_similarity=settings.VALUE_INDEX_REPAIR_SIMILARITY,
+            repair_margin=settings.VALUE_INDEX_REPAIR_MARGIN,
+            enabled=settings.VALUE_INDEX_ENABLED,
+        )
     
-    def process_query(self, query: str) -> Dict[str, Any]:
-        try:
-            # Step 1: Identify relevant tables
-            try:
-                relevant_tables = self.schema_agent.identify_relevant_tables(query)
-                schema_info = self.schema_agent.get_schema_info()
-            except Exception as e:
-                if "quota" in str(e).lower() or "429" in str(e):
-                    return {
-                        "error": "Google API quota exceeded. Please check your API key and billing status.",
-                        "error_type": "api_quota",
+    async def start(self) -> None:
+        """Warm per-table state and start background work (table change detection, rollup refresh, cache and workload writes)."""
+        # Profiles the value index's tables; the column hints below reuse those profiles
+        await asyncio.to_thread(self.value_index.ensure_fresh)
+        if self.prompt_builder.profiler is not None:
+            # Column hints are otherwise collected by the first question that touches each table
+            await asyncio.to_thread(self._warm_column_hints)
+        await self.change_monitor.start()
+        if self.change_monitor.active:
+            # Rollups then re-read employees and customers only after a write to them
+            self.rollups.versions = self.table_versions
+        await self.rollups.start()
+        await self.query_cache.start()
+        await self.workload.start()
+    
+    def _suggest_values(self, query: str, tables: List[str]) -> List[ValueMatch]:
+        self.value_index.ensure_fresh()
+        return self.value_index.suggest(query, tables, limit=settings.VALUE_INDEX_PROMPT_VALUES)
+    
+    def _warm_column_hints(self) -> None:
+        for name in self.catalog.table_names():
+            self.prompt_builder.profiler.profile(self.catalog.table(name))
+    
+    async def stop(self) -> None:
+        await self.rollups.stop()
+        await self.change_monitor.stop()
+        await self.query_cache.stop()
+        await self.workload.stop()
+        self.llm.backend.close()
+        self.telemetry.shutdown()
+    
+    async def process_query(self, query: str, priority: int = INTERACTIVE, narrative: bool = False) -> Dict[str, Any]:
+        """Run the full pipeline and return the final result.
+        
+        Concurrent calls for the same normalized question share one run.
+        """
+        result, shared = await self.flights.do(
+            ("ask", normalize_question(query), narrative),
+            lambda: self._process_query(query, priority, narrative),
+        )
+        if shared and result.get("intermediate_steps") is not None:
+            self.telemetry.count_coalesced("ask")
+            steps = result["intermediate_steps"]
+            result = {**result, "intermediate_steps": {**steps, "coalesced": steps.get("coalesced", []) + ["ask"]}}
+        return result
+    
+    async def _process_query(self, query: str, priority: int, narrative: bool) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        async for event in self.stream_query(query, stream_answer=False, priority=priority, narrative=narrative):
+            if event["event"] == "result":
+                result = event["data"]
+        return result
+    
+    def _note_coalesced(self, intermediate_steps: Dict[str, Any], stage: str, shared: bool) -> None:
+        if shared:
+            intermediate_steps["coalesced"].append(stage)
+            self.telemetry.count_coalesced(stage)
+    
+    async def _execute(self, decision: GuardDecision,
+                       sql: Optional[str] = None) -> Tuple[ResultSet, GuardDecision, float]:
+        """Run a guarded statement; returns the result, the (possibly downgraded) decision and DB seconds."""
+        started = time.perf_counter()
+        results = await self.retriever.execute_query(decision, sql)
+        return results, decision, time.perf_counter() - started
+    
+    async def process_batch(self, queries: List[str], max_concurrency: int,
+                            narrative: bool = False) -> List[Dict[str, Any]]:
+        """Run many questions, deduplicating normalized duplicates and running distinct ones concurrently.
+        
+        Returns one item per input question, in order, with `result`, `elapsed_ms` and
+        `duplicate_of` (index of the question whose result was reused). A failing
+        question never fails the batch.
+        """
+        # Shared schema work: refresh the catalog once for the whole batch
+        if await asyncio.to_thread(self.catalog.ensure_fresh):
+            self.query_cache.purge_stale(self.catalog.fingerprint)
+        
+        first_index: Dict[str, int] = {}
+        duplicate_of: List[Optional[int]] = []
+        for i, query in enumerate(queries):
+            key = normalize_question(query)
+            duplicate_of.append(first_index.get(key))
+            first_index.setdefault(key, i)
+        
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def run(query: str) -> Dict[str, Any]:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    result = await self.process_query(query, priority=BATCH, narrative=narrative)
+                except Exception as e:
+                    result = {
+                        "error": str(e),
+                        "error_type": "unknown",
                         "original_error": str(e),
-                        "intermediate_steps": {
-                            "relevant_tables": None,
-                            "generated_sql": None,
-                            "query_results": None
+                        "intermediate_steps": {}
+                    }
+                return {"result": result, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+        
+        distinct = sorted(first_index.values())
+        outcomes = dict(zip(distinct, await asyncio.gather(*(run(queries[i]) for i in distinct))))
+        
+        items = []
+        for i, original in enumerate(duplicate_of):
+            outcome = outcomes[i if original is None else original]
+            items.append({**outcome, "duplicate_of": original})
+        return items
+    
+    async def stream_query(self, query: str, stream_answer: bool = True, priority: int = INTERACTIVE,
+                           rows_only: bool = False, narrative: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Run the pipeline, yielding each stage's output as soon as it is ready.
+        
+        Events are `tables`, `sql`, `rows`, `token` (answer chunks, only when
+        `stream_answer` is set) and finally `result`, whose data has the same
+        shape as the `/ask` response. Stage durations (ms) are added to its
+        `intermediate_steps.timings` and exported as metrics.
+        
+        With `rows_only` there is no synthesis and rows are not held: after
+        `sql`, a `columns` event is followed by one `chunk` event per batch
+        read from the cursor, and `result` carries no answer or rows.
+        
+        Simple results (empty, a single value or row, small tables) are
+        answered from templates without the synthesis LLM call unless
+        `narrative` is set; `intermediate_steps.answer` records the path.
+        """
+        trace = self.telemetry.request(stream_answer=stream_answer, priority=priority, rows_only=rows_only,
+                                       narrative=narrative)
+        outcome = "cancelled"
+        try:
+            async for event in self._run_pipeline(query, stream_answer, priority, rows_only, narrative, trace):
+                if event["event"] == "result":
+                    outcome = event["data"].get("error_type") or "ok"
+                    trace.set(outcome=outcome)
+                    trace.end(error=event["data"].get("error"))
+                    if event["data"].get("intermediate_steps") is not None:
+                        event["data"]["intermediate_steps"]["timings"] = {
+                            **trace.timings, "total": round(trace.duration * 1000, 2)
                         }
+                yield event
+        finally:
+            # Also reached when the consumer stops early (client disconnect)
+            trace.end(error=None if outcome != "cancelled" else "cancelled")
+            self.telemetry.observe_request(trace.duration, outcome)
+    
+    async def _run_pipeline(self, query: str, stream_answer: bool, priority: int, rows_only: bool,
+                            narrative: bool, trace: Span) -> AsyncIterator[Dict[str, Any]]:
+        intermediate_steps: Dict[str, Any] = {
+            "relevant_tables": None,
+            "generated_sql": None,
+            "query_results": None,
+            "cache": {
+                "query": "disabled" if not self.query_cache.enabled else "miss",
+                "result": "disabled" if not self.result_cache.enabled else "miss",
+            },
+            "routing": None,
+            "prompt": None,
+            "guard": None,
+            "literals": None,
+            "rollup": None,
+            "execution": None,
+            "summary": None,
+            "answer": None,
+            "coalesced": [],
+        }
+        try:
+            # Step 1 & 2: Identify relevant tables and generate SQL, unless a cached translation exists
+            if await asyncio.to_thread(self.catalog.ensure_fresh):
+                self.query_cache.purge_stale(self.catalog.fingerprint)
+            fingerprint = self.catalog.fingerprint
+            cached = self.query_cache.get(query, fingerprint)
+            if self.query_cache.enabled:
+                self.telemetry.count_cache("query", "hit" if cached is not None else "miss")
+            if cached is not None:
+                intermediate_steps["cache"]["query"] = "hit"
+                relevant_tables = cached.relevant_tables
+                sql_query = cached.sql
+                intermediate_steps["relevant_tables"] = relevant_tables
+                yield {"event": "tables", "data": {"relevant_tables": relevant_tables, "cache": intermediate_steps["cache"]}}
+                intermediate_steps["generated_sql"] = sql_query
+                yield {"event": "sql", "data": {"generated_sql": sql_query}}
+            else:
+                # Step 1: Identify relevant tables
+                try:
+                    with self.telemetry.stage("routing", trace) as span:
+                        routing, shared = await self.flights.do(
+                            ("routing", normalize_question(query), fingerprint),
+                            lambda: self.schema_agent.route_tables(query, priority),
+                        )
+                        self._note_coalesced(intermediate_steps, "routing", shared)
+                        span.set(method=routing.method, confidence=routing.confidence, tables=len(routing.tables))
+                    relevant_tables = routing.tables
+                    intermediate_steps["routing"] = routing.to_dict()
+                except LLMError as e:
+                    yield {"event": "result", "data": llm_error_result(
+                        e, "Google API quota exceeded. Please check your API key and billing status.", intermediate_steps
+                    )}
+                    return
+                intermediate_steps["relevant_tables"] = relevant_tables
+                yield {"event": "tables", "data": {
+                    "relevant_tables": relevant_tables,
+                    "cache": intermediate_steps["cache"],
+                    "routing": intermediate_steps["routing"],
+                }}
+                
+                # Step 2: Generate SQL from a schema pruned to the relevant tables and their join paths
+                try:
+                    with self.telemetry.stage("prompt", trace) as span:
+                        schema_prompt = await asyncio.to_thread(self.prompt_builder.build, relevant_tables)
+                        value_matches = await asyncio.to_thread(self._suggest_values, query, schema_prompt.tables)
+                        value_hints = ValueIndex.render_hints(value_matches)
+                        span.set(schema_tokens=schema_prompt.tokens, detail=schema_prompt.detail,
+                                 value_hints=len(value_matches))
+                    intermediate_steps["prompt"] = {
+                        **schema_prompt.stats(),
+                        "prompt_tokens": estimate_tokens(
+                            self.sql_generator.build_prompt(query, schema_prompt.text, relevant_tables, value_hints)
+                        ),
+                        "full_schema_tokens": estimate_tokens(self.schema_agent.get_schema_info()),
+                    }
+                    with self.telemetry.stage("sql_generation", trace):
+                        sql_query, shared = await self.flights.do(
+                            ("sql", normalize_question(query), fingerprint, schema_prompt.text, value_hints),
+                            lambda: self.sql_generator.generate_sql(query, schema_prompt.text, relevant_tables,
+                                                                    priority, value_hints),
+                        )
+                        self._note_coalesced(intermediate_steps, "sql_generation", shared)
+                except LLMError as e:
+                    yield {"event": "result", "data": llm_error_result(
+                        e, "Google API quota exceeded while generating SQL.", intermediate_steps
+                    )}
+                    return
+                if self.value_index.enabled:
+                    # Literals that only differ from a stored value in spelling are fixed; near misses are reported
+                    repaired_sql, repairs, suggestions = self.value_index.repair(sql_query)
+                    intermediate_steps["literals"] = {
+                        "hints": [match.to_dict() for match in value_matches],
+                        "repaired": [repair.to_dict() for repair in repairs],
+                        "suggestions": [suggestion.to_dict() for suggestion in suggestions],
+                        "original_sql": sql_query if repairs else None,
                     }
-                raise
+                    for repair in repairs:
+                        self.telemetry.count_literal_repair(f"{repair.table}.{repair.column}")
+                    sql_query = repaired_sql
+                intermediate_steps["generated_sql"] = sql_query
+                yield {"event": "sql", "data": {"generated_sql": sql_query}}
             
-            # Step 2: Generate SQL
+            # Step 3: Check the SQL, then execute it unless an up-to-date result for the same canonical SQL is cached
             try:
-                sql_query = self.sql_generator.generate_sql(query, schema_info, relevant_tables)
-            except Exception as e:
-                if "quota" in str(e).lower() or "429" in str(e):
-                    return {
-                        "error": "Google API quota exceeded while generating SQL.",
-                        "error_type": "api_quota",
+                decision = self.sql_guard.prepare(sql_query)
+            except SQLRejected as e:
+                intermediate_steps["guard"] = e.decision.to_dict()
+                yield {"event": "result", "data": sql_rejected_result(e, intermediate_steps)}
+                return
+            intermediate_steps["guard"] = decision.to_dict()
+            if rows_only:
+                # Rows go straight from the cursor to the client; nothing to cache
+                results = None
+                if self.result_cache.enabled:
+                    intermediate_steps["cache"]["result"] = "bypass"
+            else:
+                results = self.result_cache.get(decision.sql)
+            if results is not None:
+                intermediate_steps["cache"]["result"] = "hit"
+            else:
+                # Table versions as of now: a write that lands while the query runs keeps its result out of the cache
+                cache_versions = None if rows_only else self.result_cache.snapshot(decision.sql)
+                # Aggregates over sales run against a rollup when one gives the same result. Only the
+                # executed text changes: decision.sql stays the statement the model produced, which is
+                # what is reported, coalesced on, cached and recorded for index advice
+                run_sql = None
+                if self.rollups.enabled:
+                    with self.telemetry.stage("rollup", trace) as span:
+                        rewrite = await asyncio.to_thread(self.rollups.rewrite, decision.sql)
+                        span.set(rollup=rewrite.rollup or "none")
+                    intermediate_steps["rollup"] = rewrite.to_dict()
+                    self.telemetry.count_rollup(rewrite.rollup or "none")
+                    if rewrite.rollup is not None:
+                        run_sql = rewrite.sql
+                try:
+                    with self.telemetry.stage("execution", trace) as span:
+                        shared = False
+                        if rows_only:
+                            started = time.perf_counter()
+                            async for results, chunk in self.retriever.iter_results(decision, keep_rows=False,
+                                                                                    sql=run_sql):
+                                if chunk:
+                                    yield {"event": "chunk", "data": {"rows": chunk}}
+                                else:
+                                    yield {"event": "columns", "data": {"columns": results.columns}}
+                            db_seconds = time.perf_counter() - started
+                        else:
+                            # Waiters adopt the leader's decision, whose LIMIT the guard may have lowered
+                            (results, decision, db_seconds), shared = await self.flights.do(
+                                ("execution", canonicalize_sql(decision.sql) or decision.sql),
+                                lambda: self._execute(decision, run_sql),
+                            )
+                            self._note_coalesced(intermediate_steps, "execution", shared)
+                        span.set(rows=results.row_count, result_bytes=results.bytes, truncated=results.truncated,
+                                 guard=decision.action)
+                except SQLRejected as e:
+                    intermediate_steps["guard"] = e.decision.to_dict()
+                    yield {"event": "result", "data": sql_rejected_result(e, intermediate_steps)}
+                    return
+                except Exception as e:
+                    yield {"event": "result", "data": {
+                        "error": f"Database query execution failed: {str(e)}",
+                        "error_type": "database",
                         "original_error": str(e),
-                        "intermediate_steps": {
-                            "relevant_tables": relevant_tables,
-                            "generated_sql": None,
-                            "query_results": None
-                        }
-                    }
-                raise
+                        "intermediate_steps": intermediate_steps
+                    }}
+                    return
+                if not shared:
+                    self.telemetry.observe_db(db_seconds, results.row_count, results.bytes)
+                    self.workload.record(decision.sql, db_seconds)
+                intermediate_steps["execution"] = {"db_ms": round(db_seconds * 1000, 2), **results.stats()}
+                # The guard may have lowered the LIMIT while planning
+                intermediate_steps["guard"] = decision.to_dict()
+                # Only the call that ran the query caches its result
+                if not (rows_only or shared) \
+                        and not self.result_cache.put(decision.sql, results, cache_versions) \
+                        and self.result_cache.enabled:
+                    intermediate_steps["cache"]["result"] = "uncacheable"
+            if self.result_cache.enabled and not rows_only:
+                self.telemetry.count_cache("result", intermediate_steps["cache"]["result"])
             
-            # Step 3: Execute query
-            try:
-                results = self.retriever.execute_query(sql_query)
-            except Exception as e:
-                return {
-                    "error": f"Database query execution failed: {str(e)}",
-                    "error_type": "database",
-                    "original_error": str(e),
-                    "intermediate_steps": {
-                        "relevant_tables": relevant_tables,
-                        "generated_sql": sql_query,
-                        "query_results": None
-                    }
-                }
+            # Only cache translations whose SQL actually ran
+            if cached is None:
+                self.query_cache.put(query, fingerprint, relevant_tables, sql_query)
+            
+            if rows_only:
+                yield {"event": "result", "data": {
+                    "answer": None,
+                    "error_type": None,
+                    "intermediate_steps": intermediate_steps
+                }}
+                return
             
-            # Step 4: Synthesize answer
+            intermediate_steps["query_results"] = results.to_columns()
+            yield {"event": "rows", "data": {
+                "rows": results.to_records(settings.STREAM_PREVIEW_ROWS),
+                "row_count": results.row_count,
+                "truncated": results.truncated,
+            }}
+            
+            # Step 4: Answer simple result shapes from templates, skipping the synthesis LLM call
+            if self.answer_formatter is not None:
+                with self.telemetry.stage("formatting", trace) as span:
+                    shape = self.answer_formatter.classify(results)
+                    formatted = None if narrative else self.answer_formatter.format(query, results)
+                    span.set(shape=shape, path="template" if formatted else "llm")
+            else:
+                shape, formatted = None, None
+            if formatted is not None:
+                intermediate_steps["answer"] = {"path": "template", "shape": shape}
+                self.telemetry.count_answer("template", shape)
+                if stream_answer:
+                    yield {"event": "token", "data": {"text": formatted.text}}
+                yield {"event": "result", "data": {
+                    "answer": formatted.text,
+                    "error_type": None,
+                    "intermediate_steps": intermediate_steps
+                }}
+                return
+            intermediate_steps["answer"] = {
+                "path": "llm",
+                "shape": shape,
+                "reason": "narrative" if narrative else "disabled" if shape is None else "complex",
+            }
+            self.telemetry.count_answer("llm", shape or "unknown")
+            
+            # Step 5: Summarize the rows into a bounded digest, then synthesize the answer from it
+            with self.telemetry.stage("summary", trace) as span:
+                summary = await asyncio.to_thread(self.synthesizer.summarize, results)
+                span.set(summary_tokens=summary.tokens, detail=summary.detail)
+            intermediate_steps["summary"] = summary.stats()
             try:
-                answer = self.synthesizer.synthesize_answer(query, sql_query, results)
-            except Exception as e:
-                if "quota" in str(e).lower() or "429" in str(e):
-                    # If synthesis fails but we have results, return them directly
-                    return {
-                        "answer": f"Raw Query Results (AI synthesis unavailable): {results}",
-                        "error_type": "api_quota_partial",
-                        "original_error": str(e),
-                        "intermediate_steps": {
-                            "relevant_tables": relevant_tables,
-                            "generated_sql": sql_query,
-                            "query_results": results
-                        }
-                    }
-                raise
+                with self.telemetry.stage("synthesis", trace):
+                    if stream_answer:
+                        chunks = []
+                        async for chunk in self.synthesizer.stream_answer(query, sql_query, summary, priority):
+                            chunks.append(chunk)
+                            yield {"event": "token", "data": {"text": chunk}}
+                        answer = "".join(chunks).strip()
+                    else:
+                        answer, shared = await self.flights.do(
+                            ("synthesis", normalize_question(query), sql_query, summary.text),
+                            lambda: self.synthesizer.synthesize_answer(query, sql_query, summary, priority),
+                        )
+                        self._note_coalesced(intermediate_steps, "synthesis", shared)
+            except LLMError as e:
+                # If synthesis fails but we have results, return them directly
+                yield {"event": "result", "data": {
+                    "answer": f"Raw Query Results (AI synthesis unavailable): {results.to_records()}",
+                    "error_type": "api_quota_partial" if isinstance(e, LLMQuotaError) else "api_unavailable_partial",
+                    "original_error": str(e),
+                    "intermediate_steps": intermediate_steps
+                }}
+                return
             
-            return {
+            yield {"event": "result", "data": {
                 "answer": answer,
                 "error_type": None,
-                "intermediate_steps": {
-                    "relevant_tables": relevant_tables,
-                    "generated_sql": sql_query,
-                    "query_results": results
-                }
-            }
+                "intermediate_steps": intermediate_steps
+            }}
         except Exception as e:
-            return {
+            yield {"event": "result", "data": {
                 "error": str(e),
                 "error_type": "unknown",
                 "original_error": str(e),
-                "intermediate_steps": {
-                    "relevant_tables": relevant_tables if 'relevant_tables' in locals() else None,
-                    "generated_sql": sql_query if 'sql_query' in locals() else None,
-                    "query_results": None
-                }
-            }
\ No newline at end of file
+                "intermediate_steps": {**intermediate_steps, "query_results": None}
+            }}
@@ -0,0 +1,107 @@
+from typing import List, Any, Optional
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from result_set import ResultSet
+import math
+import re
+
+# Column labels that say nothing on their own (unaliased aggregates, PostgreSQL's ?column?)
+GENERIC_LABELS = {"count", "sum", "avg", "min", "max", "coalesce", "round", "?column?", "value", "result", "total"}
+
+
+@dataclass
+class FormattedAnswer:
+    text: str
+    shape: str
+
+
+def humanize(column: str) -> str:
+    """`customer_count` -> `customer count`, `totalSales` -> `total sales`."""
+    words = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", column).replace("_", " ").split()
+    return " ".join(words).lower() or column
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return "no value"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, (float, Decimal)):
+        if not math.isfinite(value):
+            return str(value)
+        if value == int(value) and abs(value) < 1e15:
+            return f"{int(value):,}"
+        if abs(value) < 1:
+            # Rates and ratios: two decimals would turn 0.0034 into 0.00
+            return f"{value:.3g}"
+        return f"{value:,.2f}"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+class AnswerFormatter:
+    """Writes answers for simple result shapes from templates, without an LLM call.
+
+    Handles empty results, a single value, a single row and small tables
+    (at most `max_rows` rows of at most `max_columns` columns). Anything
+    else, including results cut off by a row or size cap, returns None and
+    is left to the synthesizer.
+    """
+
+    def __init__(self, max_rows: int = 10, max_columns: int = 4) -> None:
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+
+    def classify(self, results: ResultSet) -> str:
+        if results.truncated:
+            return "complex"
+        if results.row_count == 0:
+            return "empty"
+        if len(results.columns) > self.max_columns and results.row_count > 1:
+            return "complex"
+        if results.row_count == 1:
+            return "scalar" if len(results.columns) == 1 else "single_row"
+        if results.row_count <= self.max_rows:
+            return "table"
+        return "complex"
+
+    def format(self, query: str, results: ResultSet) -> Optional[FormattedAnswer]:
+        shape = self.classify(results)
+        if shape == "complex":
+            return None
+        if shape == "empty":
+            text = "No matching records were found."
+        elif shape == "scalar":
+            text = self._scalar(query, results.columns[0], results.data[0][0])
+        elif shape == "single_row":
+            row = next(results.rows())
+            fields = [f"{humanize(c)}: {format_value(v)}" for c, v in zip(results.columns, row)]
+            text = "The result is " + ", ".join(fields) + "."
+        else:
+            text = self._table(results)
+        return FormattedAnswer(text=text, shape=shape)
+
+    @staticmethod
+    def _scalar(query: str, column: str, value: Any) -> str:
+        if column.lower() in GENERIC_LABELS:
+            return f"The answer to \"{query.strip()}\" is {format_value(value)}."
+        return f"The {humanize(column)} is {format_value(value)}."
+
+    @staticmethod
+    def _table(results: ResultSet) -> str:
+        lines: List[str] = [f"There are {results.row_count} results:"]
+        columns = results.columns
+        for row in results.rows():
+            if len(columns) == 1:
+                lines.append(f"- {format_value(row[0])}")
+            elif len(columns) == 2:
+                # Typical GROUP BY shape: label and value
+                lines.append(f"- {format_value(row[0])}: {format_value(row[1])}")
+            else:
+                lines.append("- " + ", ".join(f"{humanize(c)}: {format_value(v)}" for c, v in zip(columns, row)))
+        return "\n".join(lines)
+
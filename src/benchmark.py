@@ -0,0 +1,291 @@
+"""Offline end-to-end benchmark.
+
+Drives MultiAgentSystem (or the FastAPI app in-process) with a replay LLM
+backend against a local database seeded by database.py, and reports
+per-stage latency percentiles, throughput at each client concurrency and
+memory use. Example:
+
+    DATABASE_URL=sqlite:///bench.db python src/benchmark.py --seed-db \
+        --fixtures benchmarks/replay_fixtures.json --concurrency 1,4,16
+"""
+from typing import List, Dict, Any, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from sqlalchemy import inspect
+from config import settings
+from database import engine, create_tables, generate_synthetic_data, warm_pools, dispose_engines
+from llm_backends import ReplayBackend
+from rollups import create_tables as create_rollup_tables
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages, named after the stream_query event that ends each one
+STAGE_EVENTS = {"tables": "routing", "sql": "sql_generation", "rows": "execution", "result": "synthesis"}
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def seed_database(seed: int, scale: float) -> None:
+    """Create and populate the schema unless the database already has data."""
+    if "sales" in inspect(engine).get_table_names():
+        logger.info("Benchmark database already seeded")
+        return
+    create_tables()
+    # The benchmark database is its own; --caches measures rollup rewrites too
+    create_rollup_tables(engine)
+    generate_synthetic_data(scale=scale, seed=seed, workers=max(1, os.cpu_count() - 1) if scale > 10 else 1)
+
+
+def configure_settings(use_caches: bool) -> None:
+    """Benchmark the full pipeline: no rate limits and, by default, no caches.
+
+    Without `--caches` every optimization that can answer a request from earlier
+    work is off too: request coalescing, rollup rewrites and the value index.
+    """
+    settings.LLM_REQUESTS_PER_MINUTE = 0
+    settings.LLM_TOKENS_PER_MINUTE = 0
+    settings.TABLE_CHANGE_DETECTION = "off"
+    if not use_caches:
+        settings.QUERY_CACHE_SIZE = 0
+        settings.QUERY_CACHE_PATH = None
+        settings.RESULT_CACHE_MAX_BYTES = 0
+        settings.SINGLE_FLIGHT_ENABLED = False
+        settings.ROLLUPS_ENABLED = False
+        settings.VALUE_INDEX_ENABLED = False
+
+
+def active_optimizations() -> Dict[str, bool]:
+    """Which optional pipeline features were on, so reports can be compared."""
+    return {
+        "query_cache": settings.QUERY_CACHE_SIZE > 0,
+        "result_cache": settings.RESULT_CACHE_MAX_BYTES > 0,
+        "single_flight": settings.SINGLE_FLIGHT_ENABLED,
+        "rollups": settings.ROLLUPS_ENABLED,
+        "value_index": settings.VALUE_INDEX_ENABLED,
+        "column_hints": settings.COLUMN_HINTS_ENABLED,
+        "answer_formatter": settings.ANSWER_FORMATTER_ENABLED,
+    }
+
+
+class Recorder:
+    """Collects latency samples per stage for one concurrency level."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.requests = 0
+
+    def add(self, stage: str, ms: float) -> None:
+        self.samples.setdefault(stage, []).append(ms)
+
+    def finish(self, error_type: Optional[str]) -> None:
+        self.requests += 1
+        if error_type:
+            self.errors[error_type] = self.errors.get(error_type, 0) + 1
+
+
+async def run_system_request(system: Any, question: str, recorder: Recorder, narrative: bool = False) -> None:
+    started = last = time.perf_counter()
+    error_type = None
+    async for event in system.stream_query(question, stream_answer=False, narrative=narrative):
+        now = time.perf_counter()
+        stage = STAGE_EVENTS.get(event["event"])
+        if stage:
+            recorder.add(stage, (now - last) * 1000)
+            last = now
+        if event["event"] == "result":
+            error_type = event["data"].get("error_type")
+    recorder.add("total", (time.perf_counter() - started) * 1000)
+    recorder.finish(error_type)
+
+
+async def run_http_request(client: Any, question: str, recorder: Recorder, narrative: bool = False) -> None:
+    started = time.perf_counter()
+    response = await client.post("/ask", json={"question": question, "narrative": narrative})
+    recorder.add("total", (time.perf_counter() - started) * 1000)
+    error_type = None
+    if response.status_code != 200:
+        try:
+            error_type = response.json().get("error_type") or f"http_{response.status_code}"
+        except ValueError:
+            error_type = f"http_{response.status_code}"
+    recorder.finish(error_type)
+
+
+async def run_level(request_fn: Any, questions: List[str], clients: int, total: int) -> Dict[str, Any]:
+    """Closed loop: `clients` workers each send their next request as soon as the previous one returns."""
+    recorder = Recorder()
+    schedule = iter([questions[i % len(questions)] for i in range(total)])
+
+    async def client() -> None:
+        for question in schedule:
+            await request_fn(question, recorder)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "requests": recorder.requests,
+        "errors": recorder.errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(recorder.requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {stage: summarize(values) for stage, values in recorder.samples.items()},
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    from agents import MultiAgentSystem
+
+    backend = ReplayBackend.from_file(
+        args.fixtures, latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, seed=args.seed
+    )
+    questions = [fixture["question"] for fixture in backend.fixtures.values()]
+    # Same startup as the app's lifespan
+    await warm_pools(settings.DB_POOL_WARM)
+    system = MultiAgentSystem(llm_backend=backend)
+    await system.start()
+
+    client = None
+    if args.mode == "http":
+        import httpx
+        import main
+
+        # The app's startup hook would build its own system; hand it ours instead
+        main.app.agent_system = system
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=None)
+        else:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark",
+                                       timeout=None)
+
+        async def request_fn(question: str, recorder: Recorder) -> None:
+            await run_http_request(client, question, recorder, args.narrative)
+    else:
+        async def request_fn(question: str, recorder: Recorder) -> None:
+            await run_system_request(system, question, recorder, args.narrative)
+
+    try:
+        # Warm-up: load column profiles, open pooled connections, compile regexes
+        await run_level(request_fn, questions, 1, len(questions))
+        if args.tracemalloc:
+            tracemalloc.start()
+        levels = []
+        for clients in args.concurrency:
+            if args.tracemalloc:
+                tracemalloc.reset_peak()
+            level = await run_level(request_fn, questions, clients, args.requests)
+            if args.tracemalloc:
+                level["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            levels.append(level)
+            logger.info(f"{clients} clients: {level['throughput_rps']} req/s")
+    finally:
+        if client is not None:
+            await client.aclose()
+        await system.stop()
+        await dispose_engines()
+
+    return {
+        "mode": args.mode,
+        "database": engine.dialect.name,
+        "fixtures": len(questions),
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_jitter_ms": args.llm_jitter_ms,
+        "caches": args.caches,
+        "optimizations": active_optimizations(),
+        "narrative": args.narrative,
+        "levels": levels,
+        "llm": system.llm.stats(),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\nmode={report['mode']} database={report['database']} fixtures={report['fixtures']} "
+          f"llm_latency={report['llm_latency_ms']}ms caches={'on' if report['caches'] else 'off'} "
+          f"answers={'llm' if report['narrative'] else 'template when possible'}")
+    enabled = [name for name, on in report["optimizations"].items() if on]
+    print(f"optimizations: {', '.join(enabled) or 'none'}")
+    for level in report["levels"]:
+        errors = sum(level["errors"].values())
+        print(f"\n{level['clients']} clients: {level['requests']} requests in {level['elapsed_s']}s, "
+              f"{level['throughput_rps']} req/s, {errors} errors, max RSS {level['max_rss_mb']} MB"
+              + (f", heap peak {level['python_heap_peak_mb']} MB" if "python_heap_peak_mb" in level else ""))
+        print(f"  {'stage':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for stage, stats in level["latency_ms"].items():
+            print(f"  {stage:<16}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with a replay LLM backend")
+    parser.add_argument("--fixtures", default="benchmarks/replay_fixtures.json",
+                        help="Replay fixtures (question, tables, sql, answer)")
+    parser.add_argument("--mode", choices=("system", "http"), default="system",
+                        help="Call MultiAgentSystem directly or go through the FastAPI app")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app (http mode)")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        type=lambda value: [int(v) for v in value.split(",")],
+                        help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Simulated latency per LLM call")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0, help="Extra uniform random LLM latency")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for data generation and latency jitter")
+    parser.add_argument("--seed-db", action="store_true", help="Create and populate the database if it is empty")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Dataset scale factor used by --seed-db (1 is the demo dataset)")
+    parser.add_argument("--caches", action="store_true", help="Keep the caches, request coalescing, rollups and value index enabled")
+    parser.add_argument("--narrative", action="store_true",
+                        help="Always synthesize answers with the LLM instead of templating simple results")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the Python heap peak (slower)")
+    parser.add_argument("--output", help="Write the full report as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    # SQL echo (DB_ECHO) and per-request logs would dominate the measurements
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    logging.getLogger("agents").setLevel(logging.WARNING)
+    logging.getLogger("main").setLevel(logging.WARNING)
+    engine.echo = False
+
+    if args.seed_db:
+        seed_database(args.seed, args.scale)
+    configure_settings(args.caches)
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,10 +18,134 @@ class Settings(BaseModel):
     
     # Database settings
     DATABASE_URL: str = Field(default_factory=lambda: get_env_variable("DATABASE_URL"))
+    # Optional override for the async engine; derived from DATABASE_URL when unset
+    ASYNC_DATABASE_URL: Optional[str] = Field(default_factory=lambda: os.getenv("ASYNC_DATABASE_URL"))
+    # Connection pool, per engine and per worker process; recycle is in seconds (-1 disables)
+    DB_POOL_SIZE: int = Field(default_factory=lambda: int(os.getenv("DB_POOL_SIZE", "5")))
+    DB_MAX_OVERFLOW: int = Field(default_factory=lambda: int(os.getenv("DB_MAX_OVERFLOW", "10")))
+    DB_POOL_TIMEOUT: float = Field(default_factory=lambda: float(os.getenv("DB_POOL_TIMEOUT", "30")))
+    DB_POOL_RECYCLE: int = Field(default_factory=lambda: int(os.getenv("DB_POOL_RECYCLE", "1800")))
+    DB_POOL_PRE_PING: bool = Field(default_factory=lambda: os.getenv("DB_POOL_PRE_PING", "true").lower() == "true")
+    # Async connections opened at startup so the first requests don't pay for connecting
+    DB_POOL_WARM: int = Field(default_factory=lambda: int(os.getenv("DB_POOL_WARM", "2")))
+    # Log every SQL statement
+    DB_ECHO: bool = Field(default_factory=lambda: os.getenv("DB_ECHO", "false").lower() == "true")
+
+    # Server: worker processes started by `python main.py` (each has its own pools and caches)
+    APP_WORKERS: int = Field(default_factory=lambda: int(os.getenv("APP_WORKERS", "1")))
     
     # Google AI settings
-    GOOGLE_API_KEY: str = Field(default_factory=lambda: get_env_variable("GOOGLE_API_KEY"))
+    # Only required by the Gemini backend
+    GOOGLE_API_KEY: Optional[str] = Field(default_factory=lambda: os.getenv("GOOGLE_API_KEY"))
     MODEL_NAME: str = "gemini-2.0-flash"  # Using Gemini 2.0 Flash
+
+    # LLM backend: "gemini", or "replay" to serve recorded fixtures offline
+    LLM_BACKEND: str = Field(default_factory=lambda: os.getenv("LLM_BACKEND", "gemini"))
+    LLM_REPLAY_FIXTURES: Optional[str] = Field(default_factory=lambda: os.getenv("LLM_REPLAY_FIXTURES"))
+    LLM_REPLAY_LATENCY_MS: float = Field(default_factory=lambda: float(os.getenv("LLM_REPLAY_LATENCY_MS", "0")))
+    LLM_REPLAY_JITTER_MS: float = Field(default_factory=lambda: float(os.getenv("LLM_REPLAY_JITTER_MS", "0")))
+    # Where the `record` backend writes the fixtures it captured, on shutdown
+    LLM_RECORD_FIXTURES: Optional[str] = Field(default_factory=lambda: os.getenv("LLM_RECORD_FIXTURES"))
+
+    # LLM gateway: provider quota, retries and circuit breaker (0 disables a rate limit)
+    LLM_REQUESTS_PER_MINUTE: float = Field(default_factory=lambda: float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")))
+    LLM_TOKENS_PER_MINUTE: float = Field(default_factory=lambda: float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")))
+    LLM_MAX_RETRIES: int = Field(default_factory=lambda: int(os.getenv("LLM_MAX_RETRIES", "4")))
+    LLM_BACKOFF_BASE: float = Field(default_factory=lambda: float(os.getenv("LLM_BACKOFF_BASE", "1.0")))
+    LLM_BACKOFF_MAX: float = Field(default_factory=lambda: float(os.getenv("LLM_BACKOFF_MAX", "30")))
+    LLM_BREAKER_THRESHOLD: int = Field(default_factory=lambda: int(os.getenv("LLM_BREAKER_THRESHOLD", "5")))
+    LLM_BREAKER_COOLDOWN: float = Field(default_factory=lambda: float(os.getenv("LLM_BREAKER_COOLDOWN", "30")))
+
+    # Tracing: OTLP/HTTP endpoint of a local collector (e.g. http://localhost:4318/v1/traces); unset disables export
+    TRACE_EXPORT_ENDPOINT: Optional[str] = Field(default_factory=lambda: os.getenv("TRACE_EXPORT_ENDPOINT"))
+    TRACE_SERVICE_NAME: str = Field(default_factory=lambda: os.getenv("TRACE_SERVICE_NAME", "multi-agent-rag"))
+
+    # Schema catalog settings
+    # Minimum number of seconds between schema fingerprint checks
+    SCHEMA_REFRESH_INTERVAL: float = Field(default_factory=lambda: float(os.getenv("SCHEMA_REFRESH_INTERVAL", "60")))
+
+    # Local table routing: below this confidence SchemaAgent asks the LLM instead
+    TABLE_ROUTER_MIN_CONFIDENCE: float = Field(default_factory=lambda: float(os.getenv("TABLE_ROUTER_MIN_CONFIDENCE", "0.6")))
+
+    # SQL generation prompt: token budget for the schema section and per-column hints
+    SCHEMA_PROMPT_TOKEN_BUDGET: int = Field(default_factory=lambda: int(os.getenv("SCHEMA_PROMPT_TOKEN_BUDGET", "2000")))
+    COLUMN_HINTS_ENABLED: bool = Field(default_factory=lambda: os.getenv("COLUMN_HINTS_ENABLED", "true").lower() == "true")
+    COLUMN_HINT_MAX_VALUES: int = Field(default_factory=lambda: int(os.getenv("COLUMN_HINT_MAX_VALUES", "12")))
+    COLUMN_HINTS_TTL: float = Field(default_factory=lambda: float(os.getenv("COLUMN_HINTS_TTL", "3600")))
+
+    # Result-set cache: memory bound (0 disables), TTL, and how table writes are detected (notify, poll or off)
+    RESULT_CACHE_MAX_BYTES: int = Field(default_factory=lambda: int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+    RESULT_CACHE_TTL: float = Field(default_factory=lambda: float(os.getenv("RESULT_CACHE_TTL", "300")))
+    TABLE_CHANGE_DETECTION: str = Field(default_factory=lambda: os.getenv("TABLE_CHANGE_DETECTION", "poll"))
+    TABLE_CHANGE_POLL_INTERVAL: float = Field(default_factory=lambda: float(os.getenv("TABLE_CHANGE_POLL_INTERVAL", "5")))
+
+    # SQL guard: row cap (LIMIT injected or clamped), statement timeout, and EXPLAIN thresholds (0 disables)
+    SQL_MAX_ROWS: int = Field(default_factory=lambda: int(os.getenv("SQL_MAX_ROWS", "1000")))
+    SQL_STATEMENT_TIMEOUT_MS: int = Field(default_factory=lambda: int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "15000")))
+    SQL_MAX_COST: float = Field(default_factory=lambda: float(os.getenv("SQL_MAX_COST", "1000000")))
+    SQL_MAX_PLAN_ROWS: float = Field(default_factory=lambda: float(os.getenv("SQL_MAX_PLAN_ROWS", "10000000")))
+    # Row limit tried before refusing a query whose plan cost is above SQL_MAX_COST
+    SQL_DOWNGRADE_ROWS: int = Field(default_factory=lambda: int(os.getenv("SQL_DOWNGRADE_ROWS", "100")))
+
+    # Retrieval: rows fetched per server-side cursor round trip and the result size cap (0 disables)
+    RESULT_CHUNK_ROWS: int = Field(default_factory=lambda: int(os.getenv("RESULT_CHUNK_ROWS", "1000")))
+    RESULT_MAX_BYTES: int = Field(default_factory=lambda: int(os.getenv("RESULT_MAX_BYTES", str(16 * 1024 * 1024))))
+
+    # Result digest sent to the synthesis prompt: token budget, sample rows and top categories per column
+    RESULT_SUMMARY_TOKEN_BUDGET: int = Field(default_factory=lambda: int(os.getenv("RESULT_SUMMARY_TOKEN_BUDGET", "1500")))
+    RESULT_SUMMARY_SAMPLE_ROWS: int = Field(default_factory=lambda: int(os.getenv("RESULT_SUMMARY_SAMPLE_ROWS", "20")))
+    RESULT_SUMMARY_TOP_K: int = Field(default_factory=lambda: int(os.getenv("RESULT_SUMMARY_TOP_K", "5")))
+
+    # Template answers for simple results (no synthesis LLM call): largest table answered from a template
+    ANSWER_FORMATTER_ENABLED: bool = Field(default_factory=lambda: os.getenv("ANSWER_FORMATTER_ENABLED", "true").lower() == "true")
+    ANSWER_FORMATTER_MAX_ROWS: int = Field(default_factory=lambda: int(os.getenv("ANSWER_FORMATTER_MAX_ROWS", "10")))
+    ANSWER_FORMATTER_MAX_COLUMNS: int = Field(default_factory=lambda: int(os.getenv("ANSWER_FORMATTER_MAX_COLUMNS", "4")))
+
+    # Share one in-flight execution between concurrent identical requests and pipeline stages
+    SINGLE_FLIGHT_ENABLED: bool = Field(default_factory=lambda: os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true")
+
+    # Index advisor: distinct executed statements kept in memory (0 disables) and an optional JSON lines log
+    INDEX_ADVISOR_MAX_STATEMENTS: int = Field(default_factory=lambda: int(os.getenv("INDEX_ADVISOR_MAX_STATEMENTS", "5000")))
+    INDEX_ADVISOR_WORKLOAD_PATH: Optional[str] = Field(default_factory=lambda: os.getenv("INDEX_ADVISOR_WORKLOAD_PATH"))
+    INDEX_ADVISOR_FLUSH_INTERVAL: float = Field(default_factory=lambda: float(os.getenv("INDEX_ADVISOR_FLUSH_INTERVAL", "5")))
+
+    # Aggregate rollups over sales: rewrite matching queries onto them, and refresh every N seconds (0: only on demand)
+    ROLLUPS_ENABLED: bool = Field(default_factory=lambda: os.getenv("ROLLUPS_ENABLED", "true").lower() == "true")
+    ROLLUP_REFRESH_INTERVAL: float = Field(default_factory=lambda: float(os.getenv("ROLLUP_REFRESH_INTERVAL", "60")))
+    # Seconds an id below a rollup's watermark may stay without a sale before it is taken to be rolled back
+    ROLLUP_GAP_RETENTION: float = Field(default_factory=lambda: float(os.getenv("ROLLUP_GAP_RETENTION", "3600")))
+
+    # Value index over enum-like text columns: hints literals to the SQL generator and repairs them in its SQL.
+    # Columns as table.column (empty: pick low-cardinality text columns), distinct value cap, refresh period
+    VALUE_INDEX_ENABLED: bool = Field(default_factory=lambda: os.getenv("VALUE_INDEX_ENABLED", "true").lower() == "true")
+    VALUE_INDEX_COLUMNS: str = Field(default_factory=lambda: os.getenv(
+        "VALUE_INDEX_COLUMNS",
+        "employees.department,projects.status,sales.product,project_assignments.role,customers.country",
+    ))
+    VALUE_INDEX_MAX_VALUES: int = Field(default_factory=lambda: int(os.getenv("VALUE_INDEX_MAX_VALUES", "1000")))
+    VALUE_INDEX_REFRESH_INTERVAL: float = Field(default_factory=lambda: float(os.getenv("VALUE_INDEX_REFRESH_INTERVAL", "300")))
+    VALUE_INDEX_MIN_SIMILARITY: float = Field(default_factory=lambda: float(os.getenv("VALUE_INDEX_MIN_SIMILARITY", "0.45")))
+    # Literals are replaced only when they normalize to a stored value, or match one at least this closely
+    # and by this margin over the next best value; other near matches are only reported
+    VALUE_INDEX_REPAIR_SIMILARITY: float = Field(default_factory=lambda: float(os.getenv("VALUE_INDEX_REPAIR_SIMILARITY", "0.9")))
+    VALUE_INDEX_REPAIR_MARGIN: float = Field(default_factory=lambda: float(os.getenv("VALUE_INDEX_REPAIR_MARGIN", "0.2")))
+    VALUE_INDEX_PROMPT_VALUES: int = Field(default_factory=lambda: int(os.getenv("VALUE_INDEX_PROMPT_VALUES", "10")))
+
+    # JSON responses at least this large are gzip/brotli compressed when the client accepts it (0 disables)
+    RESPONSE_COMPRESSION_MIN_BYTES: int = Field(default_factory=lambda: int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024")))
+
+    # /ask/batch limits
+    BATCH_MAX_QUESTIONS: int = Field(default_factory=lambda: int(os.getenv("BATCH_MAX_QUESTIONS", "500")))
+    BATCH_MAX_CONCURRENCY: int = Field(default_factory=lambda: int(os.getenv("BATCH_MAX_CONCURRENCY", "8")))
+
+    # Number of result rows sent in the `rows` event of /ask/stream
+    STREAM_PREVIEW_ROWS: int = Field(default_factory=lambda: int(os.getenv("STREAM_PREVIEW_ROWS", "20")))
+
+    # Question-to-SQL cache settings
+    QUERY_CACHE_SIZE: int = Field(default_factory=lambda: int(os.getenv("QUERY_CACHE_SIZE", "1024")))  # 0 disables the cache
+    QUERY_CACHE_TTL: float = Field(default_factory=lambda: float(os.getenv("QUERY_CACHE_TTL", "3600")))
+    QUERY_CACHE_PATH: Optional[str] = Field(default_factory=lambda: os.getenv("QUERY_CACHE_PATH"))  # JSON file for persistence
+    QUERY_CACHE_SAVE_INTERVAL: float = Field(default_factory=lambda: float(os.getenv("QUERY_CACHE_SAVE_INTERVAL", "5")))  # Seconds between writes
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,407 @@
+"""Bulk synthetic data for load testing.
+
+    python src/data_generator.py --scale 2000 --workers 8 --seed 42
+
+Scale 1 has the size of the original demo dataset: 200 customers, 50
+employees, 30 projects, 150 project assignments and 500 sales. Every table
+grows linearly with the scale, so scale 2000 gives 1,000,000 sales.
+
+Rows are generated in fixed-size chunks with numpy, each chunk from its own
+generator seeded by (seed, table, chunk). The data is therefore identical
+for a given seed, scale and `--as-of` date, whatever the worker count.
+Primary keys are assigned up front, so foreign keys are valid without
+reading anything back. On PostgreSQL with psycopg2, every worker loads its
+chunks with `COPY`. Other databases get batched multi-row inserts from the
+parent process.
+
+The data is skewed on purpose:
+- countries and names follow Zipf/census-like weights
+- a minority of customers place most orders
+- sales are handled by the Sales department, lean toward recent dates and
+  never predate the customer's join date
+- amounts are log-normal
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass
+from datetime import date
+import argparse
+import csv
+import io
+import logging
+import multiprocessing
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from model import Base
+from rollups import state_table as rollup_state
+
+logger = logging.getLogger(__name__)
+
+# Rows per table at scale 1, in load order (parents before children)
+BASE_ROWS = {
+    "customers": 200,
+    "employees": 50,
+    "projects": 30,
+    "project_assignments": 150,
+    "sales": 500,
+}
+TABLE_COLUMNS = {
+    "customers": ["customer_id", "name", "email", "country", "join_date"],
+    "employees": ["employee_id", "name", "department", "hire_date", "salary"],
+    "projects": ["project_id", "name", "start_date", "end_date", "budget", "status"],
+    "project_assignments": ["assignment_id", "project_id", "employee_id", "role", "start_date", "end_date"],
+    "sales": ["sale_id", "customer_id", "employee_id", "sale_date", "amount", "product"],
+}
+# Part of every chunk's seed, so tables never share a random stream
+TABLE_STREAMS = {name: i for i, name in enumerate(BASE_ROWS)}
+CHUNK_ROWS = 50_000
+INSERT_BATCH_ROWS = 5_000
+
+DEPARTMENTS = ["Sales", "Engineering", "Support", "Marketing", "HR"]
+DEPARTMENT_WEIGHTS = [0.35, 0.30, 0.15, 0.12, 0.08]
+STATUSES = ["Completed", "In Progress", "Planning", "On Hold"]
+STATUS_WEIGHTS = [0.40, 0.30, 0.20, 0.10]
+ROLES = ["Developer", "Analyst", "Tester", "Designer", "Project Manager"]
+ROLE_WEIGHTS = [0.40, 0.20, 0.15, 0.15, 0.10]
+PRODUCTS = ["Product A", "Product B", "Product C", "Service X", "Service Y"]
+PRODUCT_WEIGHTS = [0.35, 0.25, 0.15, 0.15, 0.10]
+EMAIL_DOMAINS = ["example.com", "example.org", "example.net", "mail.test"]
+
+# Date spans in days before the as-of date, matching the original generator
+CUSTOMER_DAYS = 3 * 365
+EMPLOYEE_DAYS = 5 * 365
+PROJECT_DAYS = 2 * 365
+SALE_DAYS = 2 * 365
+
+
+@dataclass
+class Vocabulary:
+    """Value pools drawn from by every chunk, with their sampling weights."""
+    first_names: np.ndarray
+    first_weights: np.ndarray
+    last_names: np.ndarray
+    last_weights: np.ndarray
+    countries: np.ndarray
+    country_weights: np.ndarray
+    phrase_words: List[np.ndarray]
+
+
+def zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def normalized(weights: Any) -> np.ndarray:
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def build_vocabulary(seed: int) -> Vocabulary:
+    from faker.providers.person.en_US import Provider as PersonProvider
+    from faker.providers.company.en_US import Provider as CompanyProvider
+    from faker.providers.address.en_US import Provider as AddressProvider
+
+    # Country popularity ranks are shuffled by the seed, then Zipf-weighted
+    countries = np.array(AddressProvider.countries)
+    countries = countries[np.random.default_rng([seed, len(TABLE_STREAMS)]).permutation(len(countries))]
+    return Vocabulary(
+        first_names=np.array(list(PersonProvider.first_names)),
+        first_weights=normalized(list(PersonProvider.first_names.values())),
+        last_names=np.array(list(PersonProvider.last_names)),
+        last_weights=normalized(list(PersonProvider.last_names.values())),
+        countries=countries,
+        country_weights=zipf_weights(len(countries)),
+        phrase_words=[np.array(words) for words in CompanyProvider.catch_phrase_words],
+    )
+
+
+@dataclass
+class GenerationPlan:
+    """Everything a worker needs to generate any chunk on its own."""
+    seed: int
+    as_of: date
+    rows: Dict[str, int]
+    vocabulary: Vocabulary
+    # Parent-side arrays the child tables depend on
+    customer_join_days: Optional[np.ndarray] = None
+    sales_employee_ids: Optional[np.ndarray] = None
+    employee_ids: Optional[np.ndarray] = None
+    project_start_days: Optional[np.ndarray] = None
+    project_end_days: Optional[np.ndarray] = None
+    copy_url: Optional[str] = None
+
+
+def chunk_ranges(total: int) -> List[Tuple[int, int]]:
+    """(first id, row count) per chunk; ids start at 1."""
+    return [(start + 1, min(CHUNK_ROWS, total - start)) for start in range(0, total, CHUNK_ROWS)]
+
+
+def chunk_rng(plan: GenerationPlan, table: str, first_id: int) -> np.random.Generator:
+    return np.random.default_rng([plan.seed, TABLE_STREAMS[table], first_id // CHUNK_ROWS])
+
+
+def days_to_dates(as_of: date, days_ago: np.ndarray) -> List[date]:
+    """Dates `days_ago` days before `as_of`, via numpy datetime64."""
+    dates = np.datetime64(as_of, "D") - days_ago.astype("timedelta64[D]")
+    return dates.astype(object).tolist()
+
+
+def person_names(rng: np.random.Generator, vocab: Vocabulary, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    first = rng.choice(vocab.first_names, size=n, p=vocab.first_weights)
+    last = rng.choice(vocab.last_names, size=n, p=vocab.last_weights)
+    return first, last
+
+
+def skewed_ids(rng: np.random.Generator, total: int, n: int, exponent: float = 3.0) -> np.ndarray:
+    """Ids in 1..total drawn with a heavy skew (at exponent 3, 20% of ids get almost 60% of picks).
+
+    Popular ranks are scattered over the id range with a fixed multiplicative
+    permutation so that popularity is not tied to insertion order.
+    """
+    ranks = np.minimum((total * rng.random(n) ** exponent).astype(np.int64), total - 1)
+    step = _coprime_step(total)
+    return (ranks * step) % total + 1
+
+
+def _coprime_step(total: int) -> int:
+    step = 2_654_435_761 % total or 1
+    while np.gcd(step, total) != 1:
+        step += 1
+    return step
+
+
+def generate_chunk(plan: GenerationPlan, table: str, first_id: int, n: int) -> Dict[str, Any]:
+    """Column name -> list of values for rows `first_id` .. `first_id + n - 1` of `table`."""
+    rng = chunk_rng(plan, table, first_id)
+    vocab = plan.vocabulary
+    ids = np.arange(first_id, first_id + n)
+
+    if table == "customers":
+        first, last = person_names(rng, vocab, n)
+        domains = rng.choice(EMAIL_DOMAINS, size=n)
+        emails = np.char.add(np.char.add(np.char.lower(np.char.add(np.char.add(first, "."), last)),
+                                         ids.astype(str)),
+                             np.char.add("@", domains))
+        return {
+            "customer_id": ids.tolist(),
+            "name": np.char.add(np.char.add(first, " "), last).tolist(),
+            "email": emails.tolist(),
+            "country": rng.choice(vocab.countries, size=n, p=vocab.country_weights).tolist(),
+            "join_date": days_to_dates(plan.as_of, plan.customer_join_days[first_id - 1:first_id - 1 + n]),
+        }
+
+    if table == "employees":
+        first, last = person_names(rng, vocab, n)
+        departments = np.array(DEPARTMENTS)[employee_departments(plan, first_id, n)]
+        # Engineering pays more; salaries cluster around a per-department median
+        medians = np.where(departments == "Engineering", 120_000, np.where(departments == "Sales", 90_000, 75_000))
+        salaries = np.clip(rng.lognormal(np.log(medians), 0.25), 40_000, 250_000).round(2)
+        return {
+            "employee_id": ids.tolist(),
+            "name": np.char.add(np.char.add(first, " "), last).tolist(),
+            "department": departments.tolist(),
+            "hire_date": days_to_dates(plan.as_of, rng.integers(0, EMPLOYEE_DAYS, size=n)),
+            "salary": salaries.tolist(),
+        }
+
+    if table == "projects":
+        words = [rng.choice(pool, size=n) for pool in vocab.phrase_words]
+        names = np.char.add(np.char.add(np.char.add(np.char.add(words[0], " "), words[1]), " "), words[2])
+        start = plan.project_start_days[first_id - 1:first_id - 1 + n]
+        end = plan.project_end_days[first_id - 1:first_id - 1 + n]
+        return {
+            "project_id": ids.tolist(),
+            "name": np.char.title(names).tolist(),
+            "start_date": days_to_dates(plan.as_of, start),
+            "end_date": days_to_dates(plan.as_of, end),
+            "budget": np.clip(rng.lognormal(np.log(120_000), 0.8, size=n), 10_000, 2_000_000).round(2).tolist(),
+            "status": rng.choice(STATUSES, size=n, p=STATUS_WEIGHTS).tolist(),
+        }
+
+    if table == "project_assignments":
+        projects = skewed_ids(rng, plan.rows["projects"], n, exponent=1.5)
+        start = plan.project_start_days[projects - 1]
+        end = plan.project_end_days[projects - 1]
+        return {
+            "assignment_id": ids.tolist(),
+            "project_id": projects.tolist(),
+            "employee_id": rng.choice(plan.employee_ids, size=n).tolist(),
+            "role": rng.choice(ROLES, size=n, p=ROLE_WEIGHTS).tolist(),
+            "start_date": days_to_dates(plan.as_of, start),
+            "end_date": days_to_dates(plan.as_of, end),
+        }
+
+    if table == "sales":
+        customers = skewed_ids(rng, plan.rows["customers"], n)
+        # Recent dates are more likely; a sale never predates the customer's join date
+        days_ago = np.minimum((SALE_DAYS * rng.random(n) ** 1.5).astype(np.int64),
+                              plan.customer_join_days[customers - 1])
+        return {
+            "sale_id": ids.tolist(),
+            "customer_id": customers.tolist(),
+            "employee_id": rng.choice(plan.sales_employee_ids, size=n).tolist(),
+            "sale_date": days_to_dates(plan.as_of, days_ago),
+            "amount": np.clip(rng.lognormal(np.log(1_500), 0.9, size=n), 100, 100_000).round(2).tolist(),
+            "product": rng.choice(PRODUCTS, size=n, p=PRODUCT_WEIGHTS).tolist(),
+        }
+
+    raise ValueError(f"Unknown table '{table}'")
+
+
+def employee_departments(plan: GenerationPlan, first_id: int, n: int) -> np.ndarray:
+    """Department index per employee; its own stream so child tables can recompute it cheaply."""
+    rng = np.random.default_rng([plan.seed, len(TABLE_STREAMS) + 1])
+    departments = rng.choice(len(DEPARTMENTS), size=plan.rows["employees"], p=DEPARTMENT_WEIGHTS)
+    departments[0] = 0  # At least one salesperson
+    return departments[first_id - 1:first_id - 1 + n]
+
+
+def plan_parent_arrays(plan: GenerationPlan) -> None:
+    """Fill in the per-row attributes that child tables must agree with."""
+    rng = np.random.default_rng([plan.seed, len(TABLE_STREAMS) + 2])
+    plan.customer_join_days = rng.integers(0, CUSTOMER_DAYS, size=plan.rows["customers"])
+    start = rng.integers(0, PROJECT_DAYS, size=plan.rows["projects"])
+    plan.project_start_days = start
+    plan.project_end_days = start - rng.integers(0, 366, size=plan.rows["projects"])
+    departments = employee_departments(plan, 1, plan.rows["employees"])
+    plan.employee_ids = np.arange(1, plan.rows["employees"] + 1)
+    plan.sales_employee_ids = plan.employee_ids[departments == 0]
+
+
+def to_csv(columns: Dict[str, Any]) -> io.StringIO:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(zip(*columns.values()))
+    buffer.seek(0)
+    return buffer
+
+
+def copy_chunk(engine: Engine, table: str, columns: Dict[str, Any]) -> None:
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", to_csv(columns))
+        raw.commit()
+    finally:
+        raw.close()
+
+
+_worker_plan: Optional[GenerationPlan] = None
+_worker_engine: Optional[Engine] = None
+
+
+def _init_worker(plan: GenerationPlan) -> None:
+    global _worker_plan, _worker_engine
+    _worker_plan = plan
+    _worker_engine = create_engine(plan.copy_url, poolclass=NullPool) if plan.copy_url else None
+
+
+def _run_chunk(task: Tuple[str, int, int]) -> Tuple[str, int, Optional[Dict[str, Any]]]:
+    """Generate one chunk; load it with COPY in COPY mode, otherwise hand it back to the parent."""
+    table, first_id, n = task
+    columns = generate_chunk(_worker_plan, table, first_id, n)
+    if _worker_engine is not None:
+        copy_chunk(_worker_engine, table, columns)
+        return table, n, None
+    return table, n, columns
+
+
+def insert_chunk(engine: Engine, table: str, columns: Dict[str, Any]) -> None:
+    statement = Base.metadata.tables[table].insert()
+    names = list(columns)
+    rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+    with engine.begin() as connection:
+        for start in range(0, len(rows), INSERT_BATCH_ROWS):
+            connection.execute(statement, rows[start:start + INSERT_BATCH_ROWS])
+
+
+def prepare_tables(engine: Engine, truncate: bool) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        populated = [t for t in BASE_ROWS if connection.execute(text(f"SELECT 1 FROM {t} LIMIT 1")).first()]
+        if populated and not truncate:
+            raise RuntimeError(f"Tables already contain data: {', '.join(populated)} (use --truncate)")
+        for table in reversed(list(BASE_ROWS)):
+            connection.execute(text(f"DELETE FROM {table}"))
+        if populated and inspect(connection).has_table(rollup_state.name):
+            # Ids restart, so rollups over the deleted rows must be rebuilt rather than extended
+            connection.execute(rollup_state.delete())
+
+
+def reset_sequences(engine: Engine) -> None:
+    """Point PostgreSQL id sequences past the explicitly inserted ids."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        for table, columns in TABLE_COLUMNS.items():
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{columns[0]}'), "
+                f"COALESCE((SELECT MAX({columns[0]}) FROM {table}), 0) + 1, false)"
+            ))
+
+
+def generate(engine: Engine, scale: float = 1.0, seed: int = 42, workers: int = 1,
+             as_of: Optional[date] = None, truncate: bool = False) -> Dict[str, int]:
+    """Create the schema and load a synthetic dataset; returns the row count per table."""
+    rows = {table: max(1, round(base * scale)) for table, base in BASE_ROWS.items()}
+    plan = GenerationPlan(seed=seed, as_of=as_of or date(2025, 12, 31), rows=rows,
+                          vocabulary=build_vocabulary(seed))
+    plan_parent_arrays(plan)
+    use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+    if use_copy:
+        plan.copy_url = engine.url.render_as_string(hide_password=False)
+
+    prepare_tables(engine, truncate)
+    logger.info(f"Generating {sum(rows.values()):,} rows at scale {scale} with {workers} worker(s) "
+                f"({'COPY' if use_copy else 'batched inserts'})")
+
+    pool = multiprocessing.get_context("spawn").Pool(workers, _init_worker, (plan,)) if workers > 1 else None
+    if pool is None:
+        _init_worker(plan)
+    try:
+        # Parents first: a level's chunks run in parallel, levels run in order
+        for level in (("customers", "employees", "projects"), ("project_assignments", "sales")):
+            started = time.perf_counter()
+            tasks = [(table, first_id, n) for table in level for first_id, n in chunk_ranges(rows[table])]
+            results = pool.imap_unordered(_run_chunk, tasks) if pool is not None else map(_run_chunk, tasks)
+            for table, n, columns in results:
+                if columns is not None:
+                    insert_chunk(engine, table, columns)
+            logger.info(f"Loaded {', '.join(f'{t}={rows[t]:,}' for t in level)} "
+                        f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    reset_sequences(engine)
+    return rows
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load a reproducible synthetic dataset for load testing")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale factor; 1 is the demo dataset, 2000 gives 1,000,000 sales")
+    parser.add_argument("--seed", type=int, default=42, help="Seed; the same seed and scale give the same data")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() - 1),
+                        help="Generator processes (each loads its own chunks on PostgreSQL)")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="Date all generated dates are relative to (default 2025-12-31)")
+    parser.add_argument("--truncate", action="store_true", help="Delete existing rows first")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    rows = generate(engine, scale=args.scale, seed=args.seed, workers=args.workers, as_of=args.as_of,
+                    truncate=args.truncate)
+    logger.info(f"Done: {', '.join(f'{table}={count:,}' for table, count in rows.items())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
-from faker import Faker
-from datetime import datetime, timedelta
-import random
-from model import Base, Customer, Employee, Project, ProjectAssignment, Sale
+from typing import Any, Dict
+import asyncio
+from model import Base
 from config import settings
 import logging
 
@@ -12,20 +13,77 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Database setup with error handling
-try:
-    logger.info(f"Attempting to connect to database with URL: {settings.DATABASE_URL}")
-    engine = create_engine(settings.DATABASE_URL, echo=True)
-    
-    # Test the connection
-    with engine.connect() as connection:
-        connection.execute(text("SELECT 1"))
-        logger.info("Database connection test successful!")
-    
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-except SQLAlchemyError as e:
-    logger.error(f"Database connection error: {str(e)}")
-    raise
+def pool_options(url: str) -> Dict[str, Any]:
+    """Engine keyword arguments for the configured connection pool.
+
+    SQLite gets no size/overflow settings: its in-memory databases use a
+    pool that does not accept them.
+    """
+    options: Dict[str, Any] = {
+        "echo": settings.DB_ECHO,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return options
+
+# Engines connect lazily; nothing is opened until startup warms the pools
+engine = create_engine(settings.DATABASE_URL, **pool_options(settings.DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async drivers used for the request path, keyed by the sync backend name
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    """Convert a sync database URL to the equivalent async driver URL."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for database backend '{parsed.get_backend_name()}'")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+# Async engine for the request path so queries don't block the event loop
+ASYNC_URL = settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL)
+async_engine = create_async_engine(ASYNC_URL, **pool_options(ASYNC_URL))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+async def warm_pools(connections: int) -> None:
+    """Check the database is reachable and open `connections` pooled connections per engine.
+
+    Called once per worker process at startup. Connections inherited from a
+    parent process (pre-fork servers) are dropped first without closing them,
+    so workers never share sockets.
+    """
+    engine.dispose(close=False)
+    await async_engine.dispose(close=False)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        held = []
+        try:
+            for _ in range(max(1, connections)):
+                held.append(await async_engine.connect())
+            await held[0].execute(text("SELECT 1"))
+        finally:
+            # Returned to the pool, not closed
+            await asyncio.gather(*(connection.close() for connection in held))
+    except SQLAlchemyError as e:
+        logger.error(f"Database connection error: {str(e)}")
+        raise
+    logger.info(f"Database reachable; warmed {max(1, connections)} async connection(s)")
+
+async def dispose_engines() -> None:
+    """Close every pooled connection (application shutdown)."""
+    await async_engine.dispose()
+    engine.dispose()
 
 def get_db():
     db = SessionLocal()
@@ -37,6 +95,14 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except SQLAlchemyError as e:
+            logger.error(f"Database session error: {str(e)}")
+            raise
+
 def create_tables():
     try:
         Base.metadata.create_all(bind=engine)
@@ -45,96 +111,10 @@ def create_tables():
         logger.error(f"Error creating tables: {str(e)}")
         raise
 
-def generate_synthetic_data():
-    fake = Faker()
-    db = SessionLocal()
-    try:
-        # Generate Customers (200 records)
-        customers = []
-        for _ in range(200):
-            customer = Customer(
-                name=fake.name(),
-                email=fake.email(),
-                country=fake.country(),
-                join_date=fake.date_between(start_date='-3y', end_date='today')
-            )
-            customers.append(customer)
-        db.add_all(customers)
-        logger.info("Added customer records")
-        
-        # Generate Employees (50 records)
-        departments = ['Sales', 'Marketing', 'Engineering', 'Support', 'HR']
-        employees = []
-        for _ in range(50):
-            employee = Employee(
-                name=fake.name(),
-                department=random.choice(departments),
-                hire_date=fake.date_between(start_date='-5y', end_date='today'),
-                salary=random.uniform(50000, 150000)
-            )
-            employees.append(employee)
-        db.add_all(employees)
-        logger.info("Added employee records")
-        
-        # Generate Projects (30 records)
-        statuses = ['Planning', 'In Progress', 'Completed', 'On Hold']
-        projects = []
-        for _ in range(30):
-            start_date = fake.date_between(start_date='-2y', end_date='today')
-            end_date = fake.date_between(start_date=start_date, end_date=start_date + timedelta(days=365))
-            project = Project(
-                name=fake.catch_phrase(),
-                start_date=start_date,
-                end_date=end_date,
-                budget=random.uniform(10000, 500000),
-                status=random.choice(statuses)
-            )
-            projects.append(project)
-        db.add_all(projects)
-        logger.info("Added project records")
-        
-        # Commit to get IDs
-        db.commit()
-        
-        # Generate Project Assignments (150 records)
-        roles = ['Project Manager', 'Developer', 'Designer', 'Analyst', 'Tester']
-        assignments = []
-        for _ in range(150):
-            project = random.choice(projects)
-            assignment = ProjectAssignment(
-                project_id=project.project_id,
-                employee_id=random.choice(employees).employee_id,
-                role=random.choice(roles),
-                start_date=project.start_date,
-                end_date=project.end_date
-            )
-            assignments.append(assignment)
-        db.add_all(assignments)
-        logger.info("Added project assignment records")
-        
-        # Generate Sales (500 records)
-        products = ['Product A', 'Product B', 'Product C', 'Service X', 'Service Y']
-        sales = []
-        for _ in range(500):
-            sale = Sale(
-                customer_id=random.choice(customers).customer_id,
-                employee_id=random.choice(employees).employee_id,
-                sale_date=fake.date_between(start_date='-2y', end_date='today'),
-                amount=random.uniform(100, 10000),
-                product=random.choice(products)
-            )
-            sales.append(sale)
-        db.add_all(sales)
-        logger.info("Added sales records")
-        
-        db.commit()
-        logger.info("All synthetic data committed successfully!")
-    except SQLAlchemyError as e:
-        logger.error(f"Error generating synthetic data: {str(e)}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+def generate_synthetic_data(scale: float = 1.0, seed: int = 42, workers: int = 1) -> Dict[str, int]:
+    """Load the synthetic dataset; scale 1 is the demo size. See `data_generator.py` for bulk loads."""
+    from data_generator import generate
+    return generate(engine, scale=scale, seed=seed, workers=workers)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,437 @@
+"""Workload-driven index advice for the generated-SQL workload.
+
+    python src/index_advisor.py --workload workload.jsonl --explain [--apply]
+
+The pipeline records every statement it executes with its database time
+(`SQLWorkload`). `IndexAdvisor` parses the statements, tallies the columns
+used in equality and range predicates, join keys, GROUP BY and ORDER BY,
+weighted by observed execution time, and proposes composite indexes:
+equality columns first, then join keys, then one range or ordering column.
+On PostgreSQL with the `hypopg` extension, each proposal can be costed with
+EXPLAIN before and after a hypothetical index exists. Without `hypopg` no
+comparison is made: building a real index, even in a transaction that is
+rolled back, would block writes to the table while it builds.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlglot import exp
+from schema_catalog import SchemaCatalog
+from sql_utils import parse_sql, canonical_sql
+import argparse
+import asyncio
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Widest composite index proposed
+MAX_INDEX_COLUMNS = 3
+# Statements kept per proposal for EXPLAIN comparisons
+SAMPLE_QUERIES = 5
+
+EQUALITY_PREDICATES = (exp.EQ, exp.In, exp.Is)
+RANGE_PREDICATES = (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between, exp.Like)
+
+
+@dataclass
+class WorkloadEntry:
+    sql: str
+    count: int = 0
+    total_ms: float = 0.0
+
+
+class SQLWorkload:
+    """Executed statements keyed by canonical SQL, with execution counts and total database time.
+
+    Bounded to `max_entries` distinct statements (least recently seen are
+    dropped). `record` only queues the execution; parsing and, when `path`
+    is set, appending to that JSON lines file happen in `flush`, which a
+    background task runs in a thread every `flush_interval` seconds and on
+    `stop()`.
+    """
+
+    def __init__(self, max_entries: int = 5000, path: Optional[str] = None, flush_interval: float = 5.0,
+                 max_pending: int = 10000) -> None:
+        self.max_entries = max_entries
+        self.path = path
+        self.flush_interval = flush_interval
+        self._entries: "OrderedDict[str, WorkloadEntry]" = OrderedDict()
+        # Executions not yet applied; the oldest are dropped if flushing falls behind
+        self._pending: deque = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def record(self, sql_query: str, seconds: float) -> None:
+        if self.enabled:
+            self._pending.append((sql_query, seconds))
+
+    def entries(self) -> List[WorkloadEntry]:
+        self.flush()
+        with self._lock:
+            return list(self._entries.values())
+
+    async def start(self) -> None:
+        if self.enabled:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def flush(self) -> None:
+        """Apply queued executions to the entries and append them to the workload log."""
+        with self._flush_lock:
+            records = []
+            while self._pending:
+                records.append(self._pending.popleft())
+            for sql_query, seconds in records:
+                self._add(sql_query, seconds)
+            if self.path and records:
+                lines = "".join(json.dumps({"sql": sql_query, "ms": round(seconds * 1000, 3)}) + "\n"
+                                for sql_query, seconds in records)
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(lines)
+                except OSError as e:
+                    logger.warning(f"Could not append to workload log {self.path}: {str(e)}")
+
+    @classmethod
+    def load(cls, path: str, max_entries: int = 5000) -> "SQLWorkload":
+        """Rebuild a workload from a JSON lines log."""
+        workload = cls(max_entries=max_entries)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    workload._add(record["sql"], record.get("ms", 0.0) / 1000)
+        return workload
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def _add(self, sql_query: str, seconds: float) -> None:
+        tree = parse_sql(sql_query)
+        if tree is None:
+            return
+        key = canonical_sql(tree)
+        with self._lock:
+            entry = self._entries.pop(key, None) or WorkloadEntry(sql=sql_query)
+            entry.count += 1
+            entry.total_ms += seconds * 1000
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@dataclass
+class ColumnUse:
+    table: str
+    column: str
+    kind: str  # equality, range, join, group or order
+
+
+def column_uses(tree: exp.Expression, catalog: SchemaCatalog) -> List[ColumnUse]:
+    """Base-table columns used as predicates, join keys and grouping/ordering keys, per SELECT."""
+    uses: List[ColumnUse] = []
+    for select in tree.find_all(exp.Select):
+        tables = {t.alias_or_name: t.name for t in select.find_all(exp.Table)
+                  if t.find_ancestor(exp.Select) is select and catalog.table(t.name)}
+        if not tables:
+            continue
+
+        def resolve(column: exp.Column) -> Optional[Tuple[str, str]]:
+            if column.table:
+                table = tables.get(column.table)
+                return (table, column.name) if table else None
+            owners = [t for t in set(tables.values()) if catalog.table(t).column(column.name)]
+            return (owners[0], column.name) if len(owners) == 1 else None
+
+        def add(node: exp.Expression, kind: str) -> None:
+            if isinstance(node, exp.Column):
+                resolved = resolve(node)
+                if resolved:
+                    uses.append(ColumnUse(resolved[0], resolved[1], kind))
+
+        predicates = []
+        if select.args.get("where"):
+            predicates.append(select.args["where"].this)
+        for join in select.args.get("joins") or []:
+            if join.args.get("on"):
+                predicates.append(join.args["on"])
+        for predicate in predicates:
+            for node in predicate.find_all(*EQUALITY_PREDICATES, *RANGE_PREDICATES):
+                if node.find_ancestor(exp.Select) is not select:
+                    continue
+                left, right = node.this, node.args.get("expression")
+                if not isinstance(left, exp.Column) and isinstance(right, exp.Column):
+                    left, right = right, left
+                if isinstance(node, exp.EQ) and isinstance(left, exp.Column) and isinstance(right, exp.Column):
+                    add(left, "join")
+                    add(right, "join")
+                else:
+                    add(left, "equality" if isinstance(node, EQUALITY_PREDICATES) else "range")
+        for kind, clause in (("group", select.args.get("group")), ("order", select.args.get("order"))):
+            if clause is not None:
+                for column in clause.find_all(exp.Column):
+                    add(column, kind)
+    return uses
+
+
+@dataclass
+class IndexProposal:
+    table: str
+    columns: Tuple[str, ...]
+    queries: int = 0
+    executions: int = 0
+    total_ms: float = 0.0
+    samples: List[str] = field(default_factory=list)
+    comparisons: Optional[List[Dict[str, Any]]] = None
+    comparison_note: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{'_'.join(self.columns)}"[:63]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "columns": list(self.columns),
+            "name": self.name,
+            "queries": self.queries,
+            "executions": self.executions,
+            "total_ms": round(self.total_ms, 2),
+            "comparisons": self.comparisons,
+            "comparison_note": self.comparison_note,
+        }
+
+
+def candidate_columns(uses: List[ColumnUse], catalog: SchemaCatalog) -> Dict[str, Tuple[str, ...]]:
+    """One index per table for a single statement: equality, then join keys, then a range or ordering column.
+
+    Tables looked up by their whole primary key are skipped, and primary key
+    columns are left out of join keys; the primary key index serves those.
+    """
+    by_table: Dict[str, Dict[str, List[str]]] = {}
+    for use in uses:
+        kinds = by_table.setdefault(use.table, {})
+        if use.column not in kinds.setdefault(use.kind, []):
+            kinds[use.kind].append(use.column)
+    candidates = {}
+    for table, kinds in by_table.items():
+        primary_key = catalog.table(table).primary_key
+        if primary_key and set(primary_key) <= set(kinds.get("equality", [])):
+            continue
+        columns: List[str] = []
+        columns += kinds.get("equality", [])
+        columns += [c for c in kinds.get("join", []) if c not in columns and c not in primary_key]
+        # Only one column after the equality prefix can be used for a range scan or ordering
+        tail = kinds.get("range") or kinds.get("order") or kinds.get("group") or []
+        columns += [c for c in tail[:1] if c not in columns]
+        if columns:
+            candidates[table] = tuple(columns[:MAX_INDEX_COLUMNS])
+    return candidates
+
+
+class IndexAdvisor:
+    """Turns a recorded SQL workload into index proposals and an unused-index report."""
+
+    def __init__(self, engine: Engine, catalog: SchemaCatalog, workload: SQLWorkload) -> None:
+        self.engine = engine
+        self.catalog = catalog
+        self.workload = workload
+
+    def usage(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """table -> column -> {kind: executions, "total_ms": ...} over the workload."""
+        usage: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for entry, uses in self._parsed():
+            for use in {(u.table, u.column, u.kind) for u in uses}:
+                stats = usage.setdefault(use[0], {}).setdefault(use[1], {"total_ms": 0.0})
+                stats[use[2]] = stats.get(use[2], 0) + entry.count
+                stats["total_ms"] = round(stats["total_ms"] + entry.total_ms, 2)
+        return usage
+
+    def propose(self, top: int = 10) -> List[IndexProposal]:
+        proposals: Dict[Tuple[str, Tuple[str, ...]], IndexProposal] = {}
+        for entry, uses in self._parsed():
+            for table, columns in candidate_columns(uses, self.catalog).items():
+                if self._covered(table, columns):
+                    continue
+                proposal = proposals.setdefault((table, columns), IndexProposal(table, columns))
+                proposal.queries += 1
+                proposal.executions += entry.count
+                proposal.total_ms += entry.total_ms
+                if len(proposal.samples) < SAMPLE_QUERIES:
+                    proposal.samples.append(entry.sql)
+
+        # An index on (a, b) also serves queries that only need (a)
+        for key, proposal in sorted(proposals.items(), key=lambda item: len(item[0][1])):
+            wider = next((p for k, p in proposals.items() if k[0] == key[0] and len(k[1]) > len(key[1])
+                          and k[1][:len(key[1])] == key[1]), None)
+            if wider is not None:
+                wider.queries += proposal.queries
+                wider.executions += proposal.executions
+                wider.total_ms += proposal.total_ms
+                wider.samples = (wider.samples + proposal.samples)[:SAMPLE_QUERIES]
+                del proposals[key]
+        ranked = sorted(proposals.values(), key=lambda p: (p.total_ms, p.executions), reverse=True)
+        return ranked[:top]
+
+    def unused_indexes(self) -> List[Dict[str, Any]]:
+        """Secondary indexes whose leading column the workload never filters, joins, groups or orders on."""
+        usage = self.usage()
+        scans = self._index_scans()
+        unused = []
+        for name in self.catalog.table_names():
+            table = self.catalog.table(name)
+            for index in table.indexes:
+                if not index.columns or index.columns[0] in usage.get(name, {}):
+                    continue
+                unused.append({
+                    "table": name,
+                    "name": index.name,
+                    "columns": list(index.columns),
+                    "unique": index.unique,
+                    "idx_scan": scans.get(index.name),
+                })
+        return unused
+
+    def explain(self, proposal: IndexProposal) -> None:
+        """Fill in before/after EXPLAIN total costs for the proposal's sample queries.
+
+        Needs PostgreSQL with `hypopg`; otherwise `comparisons` stays None and
+        `comparison_note` says why. Never builds a real index.
+        """
+        if self.engine.dialect.name != "postgresql":
+            proposal.comparison_note = "cost comparison needs PostgreSQL"
+            return
+        with self.engine.connect() as connection:
+            hypothetical = connection.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'hypopg'"
+            )).first() is not None
+            if not hypothetical:
+                proposal.comparison_note = "cost comparison needs the hypopg extension"
+                return
+            transaction = connection.begin()
+            try:
+                before = [self._cost(connection, sql) for sql in proposal.samples]
+                connection.execute(text("SELECT * FROM hypopg_create_index(:ddl)"),
+                                   {"ddl": self.ddl(proposal, concurrently=False)})
+                after = [self._cost(connection, sql) for sql in proposal.samples]
+            finally:
+                connection.execute(text("SELECT hypopg_reset()"))
+                transaction.rollback()
+        proposal.comparisons = [
+            {"sql": sql, "cost_before": b, "cost_after": a,
+             "improvement": round(1 - a / b, 3) if b and a is not None else None}
+            for sql, b, a in zip(proposal.samples, before, after)
+        ]
+
+    def apply(self, proposal: IndexProposal) -> None:
+        """Create the proposed index (CONCURRENTLY on PostgreSQL, so writes are not blocked)."""
+        postgres = self.engine.dialect.name == "postgresql"
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(self.ddl(proposal, concurrently=postgres)))
+        logger.info(f"Created index {proposal.name}")
+
+    def ddl(self, proposal: IndexProposal, concurrently: bool) -> str:
+        quote = self.engine.dialect.identifier_preparer.quote
+        columns = ", ".join(quote(c) for c in proposal.columns)
+        return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {quote(proposal.name)} "
+                f"ON {quote(proposal.table)} ({columns})")
+
+    def report(self, top: int = 10, explain: bool = False) -> Dict[str, Any]:
+        proposals = self.propose(top)
+        if explain:
+            for proposal in proposals:
+                try:
+                    self.explain(proposal)
+                except Exception as e:
+                    logger.error(f"EXPLAIN comparison failed for {proposal.name}: {str(e)}")
+        return {
+            "statements": len(self.workload.entries()),
+            "proposals": [p.to_dict() for p in proposals],
+            "unused_indexes": self.unused_indexes(),
+            "column_usage": self.usage(),
+        }
+
+    def _parsed(self) -> List[Tuple[WorkloadEntry, List[ColumnUse]]]:
+        parsed = []
+        for entry in self.workload.entries():
+            tree = parse_sql(entry.sql)
+            if tree is not None:
+                parsed.append((entry, column_uses(tree, self.catalog)))
+        return parsed
+
+    def _covered(self, table: str, columns: Tuple[str, ...]) -> bool:
+        """True if an existing index (or the primary key) starts with these columns."""
+        info = self.catalog.table(table)
+        existing = [tuple(info.primary_key)] + [index.columns for index in info.indexes]
+        return any(cols[:len(columns)] == columns for cols in existing)
+
+    def _index_scans(self) -> Dict[str, int]:
+        if self.engine.dialect.name != "postgresql":
+            return {}
+        with self.engine.connect() as connection:
+            rows = connection.execute(text("SELECT indexrelname, idx_scan FROM pg_stat_user_indexes")).all()
+        return {name: scans for name, scans in rows}
+
+    @staticmethod
+    def _cost(connection: Any, sql_query: str) -> Optional[float]:
+        raw = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query}")).scalar()
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+        return plan.get("Total Cost")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Propose indexes for a recorded generated-SQL workload")
+    parser.add_argument("--workload", required=True, help="JSON lines log written via INDEX_ADVISOR_WORKLOAD_PATH")
+    parser.add_argument("--top", type=int, default=10, help="Number of proposals")
+    parser.add_argument("--explain", action="store_true", help="Compare EXPLAIN costs before and after (PostgreSQL)")
+    parser.add_argument("--apply", action="store_true", help="Create the proposed indexes")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    catalog = SchemaCatalog(engine)
+    catalog.load()
+    advisor = IndexAdvisor(engine, catalog, SQLWorkload.load(args.workload))
+    report = advisor.report(top=args.top, explain=args.explain)
+    for proposal in report["proposals"]:
+        costs = [c["improvement"] for c in proposal["comparisons"] or [] if c["improvement"] is not None]
+        gain = f", mean cost reduction {sum(costs) / len(costs):.0%}" if costs else ""
+        print(f"{proposal['name']}: {proposal['table']} ({', '.join(proposal['columns'])}) "
+              f"{proposal['executions']} executions, {proposal['total_ms']} ms{gain}")
+    for index in report["unused_indexes"]:
+        print(f"unused: {index['name']} on {index['table']} ({', '.join(index['columns'])})")
+    if args.apply:
+        for proposal in advisor.propose(args.top):
+            advisor.apply(proposal)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
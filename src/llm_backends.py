@@ -0,0 +1,173 @@
+from typing import List, Dict, Any, Optional, AsyncIterator
+from dataclasses import dataclass
+from prompt_builder import estimate_tokens
+from query_cache import normalize_question
+import asyncio
+import json
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages that call the LLM; used to pick replay fixtures and label metrics
+STAGES = ("tables", "sql", "answer")
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class LLMBackend:
+    """Interface every LLM provider implements for the gateway."""
+
+    async def generate(self, prompt: str, stage: str, question: Optional[str] = None) -> LLMResponse:
+        raise NotImplementedError
+
+    async def generate_stream(self, prompt: str, stage: str,
+                              question: Optional[str] = None) -> AsyncIterator[LLMResponse]:
+        """Yield the response in chunks. Backends without streaming return it in one chunk."""
+        yield await self.generate(prompt, stage, question)
+
+    def close(self) -> None:
+        """Called once when the application shuts down."""
+
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, api_key: Optional[str], model_name: str) -> None:
+        if not api_key:
+            raise ValueError("Environment variable 'GOOGLE_API_KEY' is not set. Please set it in your .env file.")
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _usage(response: Any) -> Dict[str, int]:
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "completion_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        }
+
+    async def generate(self, prompt: str, stage: str, question: Optional[str] = None) -> LLMResponse:
+        response = await self.model.generate_content_async(prompt)
+        return LLMResponse(text=response.text, **self._usage(response))
+
+    async def generate_stream(self, prompt: str, stage: str,
+                              question: Optional[str] = None) -> AsyncIterator[LLMResponse]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            # Usage is cumulative and only complete on the last chunk
+            yield LLMResponse(text=chunk.text or "", **self._usage(chunk))
+
+
+class ReplayBackend(LLMBackend):
+    """Serves recorded question -> tables/SQL/answer fixtures with simulated latency.
+
+    Fixtures are a JSON list of objects with `question`, `tables`, `sql` and
+    `answer`. Latency is fixed per stage, plus optional jitter drawn from a
+    seeded generator so runs are repeatable.
+    """
+
+    def __init__(self, fixtures: List[Dict[str, Any]], latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 seed: int = 0, strict: bool = False) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.strict = strict
+        self._random = random.Random(seed)
+        self.fixtures = {normalize_question(f["question"]): f for f in fixtures}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "ReplayBackend":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def lookup(self, stage: str, question: Optional[str]) -> str:
+        fixture = self.fixtures.get(normalize_question(question or ""))
+        if fixture is None:
+            if self.strict:
+                raise KeyError(f"No replay fixture for question: {question!r}")
+            # Unknown question: let the pipeline fall back to all tables and a trivial query
+            return {"tables": "", "sql": "SELECT 1 AS value", "answer": "No recorded answer."}[stage]
+        value = fixture[stage]
+        return ", ".join(value) if isinstance(value, list) else value
+
+    async def _simulate_latency(self) -> None:
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    async def generate(self, prompt: str, stage: str, question: Optional[str] = None) -> LLMResponse:
+        await self._simulate_latency()
+        text = self.lookup(stage, question)
+        return LLMResponse(text=text, prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(text))
+
+    async def generate_stream(self, prompt: str, stage: str,
+                              question: Optional[str] = None) -> AsyncIterator[LLMResponse]:
+        await self._simulate_latency()
+        text = self.lookup(stage, question)
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            chunk = " ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
+            yield LLMResponse(text=chunk)
+        yield LLMResponse(text="", prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(text))
+
+
+class RecordingBackend(LLMBackend):
+    """Wraps a live backend and records its replies as replay fixtures."""
+
+    def __init__(self, inner: LLMBackend, path: str) -> None:
+        self.inner = inner
+        self.path = path
+        self.recorded: Dict[str, Dict[str, Any]] = {}
+
+    def _record(self, stage: str, question: Optional[str], text: str) -> None:
+        if question is None:
+            return
+        fixture = self.recorded.setdefault(normalize_question(question), {"question": question})
+        fixture[stage] = text.strip()
+
+    async def generate(self, prompt: str, stage: str, question: Optional[str] = None) -> LLMResponse:
+        response = await self.inner.generate(prompt, stage, question)
+        self._record(stage, question, response.text)
+        return response
+
+    async def generate_stream(self, prompt: str, stage: str,
+                              question: Optional[str] = None) -> AsyncIterator[LLMResponse]:
+        chunks = []
+        async for chunk in self.inner.generate_stream(prompt, stage, question):
+            chunks.append(chunk.text)
+            yield chunk
+        self._record(stage, question, "".join(chunks))
+
+    def save(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(list(self.recorded.values()), f, indent=2)
+        logger.info(f"Recorded {len(self.recorded)} fixtures to {self.path}")
+
+    def close(self) -> None:
+        self.save()
+        self.inner.close()
+
+
+def create_backend(settings: Any) -> LLMBackend:
+    """Build the backend selected by `LLM_BACKEND`."""
+    if settings.LLM_BACKEND == "replay":
+        if not settings.LLM_REPLAY_FIXTURES:
+            raise ValueError("LLM_REPLAY_FIXTURES must be set when LLM_BACKEND is 'replay'")
+        return ReplayBackend.from_file(
+            settings.LLM_REPLAY_FIXTURES,
+            latency_ms=settings.LLM_REPLAY_LATENCY_MS,
+            jitter_ms=settings.LLM_REPLAY_JITTER_MS,
+        )
+    if settings.LLM_BACKEND == "gemini":
+        return GeminiBackend(settings.GOOGLE_API_KEY, settings.MODEL_NAME)
+    if settings.LLM_BACKEND == "record":
+        if not settings.LLM_RECORD_FIXTURES:
+            raise ValueError("LLM_RECORD_FIXTURES must be set when LLM_BACKEND is 'record'")
+        return RecordingBackend(GeminiBackend(settings.GOOGLE_API_KEY, settings.MODEL_NAME),
+                                settings.LLM_RECORD_FIXTURES)
+    raise ValueError(f"Unknown LLM_BACKEND '{settings.LLM_BACKEND}'")
@@ -0,0 +1,343 @@
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from collections import deque
+from google.api_core import exceptions as google_exceptions
+from prompt_builder import estimate_tokens
+from llm_backends import LLMBackend, LLMResponse
+from telemetry import Telemetry
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+QUOTA_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class LLMError(Exception):
+    """Base class for errors raised by the LLM gateway."""
+
+
+class LLMQuotaError(LLMError):
+    """The provider kept rejecting requests for quota after all retries."""
+
+
+class LLMUnavailableError(LLMError):
+    """The provider is failing or the circuit breaker is open."""
+
+
+def is_quota_error(e: Exception) -> bool:
+    return isinstance(e, QUOTA_ERRORS) or "quota" in str(e).lower() or "429" in str(e)
+
+
+def is_transient_error(e: Exception) -> bool:
+    return isinstance(e, TRANSIENT_ERRORS)
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` units per second up to `capacity`."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) the difference between estimated and actual usage."""
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and fails fast for `cooldown` seconds."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def admit(self) -> Optional[str]:
+        """Admit one logical call: `closed`, `trial` (the single half-open probe) or None to fail fast."""
+        state = self.state
+        if state == "closed":
+            return "closed"
+        if state == "half_open" and not self._trial_in_flight:
+            # Let a single trial request through
+            self._trial_in_flight = True
+            return "trial"
+        return None
+
+    def release_trial(self) -> None:
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logger.error(f"LLM circuit breaker opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """Single entry point for every LLM call made by the agents.
+
+    Calls wait in a priority queue until both the request-per-minute and
+    token-per-minute buckets allow them, then run with jittered exponential
+    backoff on quota and transient errors. A circuit breaker fails fast
+    while the provider is down.
+    """
+
+    def __init__(self, backend: LLMBackend, requests_per_minute: float = 60, tokens_per_minute: float = 1_000_000,
+                 max_retries: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0, output_token_reserve: int = 512,
+                 telemetry: Optional[Telemetry] = None) -> None:
+        self.backend = backend
+        self.telemetry = telemetry or Telemetry()
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.output_token_reserve = output_token_reserve
+
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._wait_times: deque = deque(maxlen=1000)
+        self.counters: Dict[str, int] = {
+            "requests": 0, "retries": 0, "quota_errors": 0, "transient_errors": 0,
+            "failures": 0, "rejected_open_circuit": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+
+    async def generate(self, prompt: str, priority: int = INTERACTIVE, stage: str = "llm",
+                       question: Optional[str] = None) -> LLMResponse:
+        """Generate a complete response."""
+        estimated = estimate_tokens(prompt) + self.output_token_reserve
+        attempt = 0
+        # The breaker admits the logical call once; its retries keep the same slot
+        trial = self._enter_circuit()
+        try:
+            while True:
+                await self._admit(estimated, priority)
+                started = time.perf_counter()
+                try:
+                    response = await self.backend.generate(prompt, stage, question)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    attempt = await self._handle_failure(e, attempt, trial)
+                    continue
+                self.breaker.record_success()
+                self._record_usage(response, estimated, stage, time.perf_counter() - started)
+                return response
+        except asyncio.CancelledError:
+            # A cancelled half-open trial must not keep the circuit stuck
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+    async def generate_stream(self, prompt: str, priority: int = INTERACTIVE, stage: str = "llm",
+                              question: Optional[str] = None) -> AsyncIterator[str]:
+        """Generate a response incrementally. Retries only happen before the first chunk arrives."""
+        estimated = estimate_tokens(prompt) + self.output_token_reserve
+        attempt = 0
+        trial = self._enter_circuit()
+        try:
+            while True:
+                await self._admit(estimated, priority)
+                started = time.perf_counter()
+                streaming = False
+                usage = LLMResponse(text="")
+                try:
+                    async for chunk in self.backend.generate_stream(prompt, stage, question):
+                        streaming = True
+                        if chunk.prompt_tokens or chunk.completion_tokens:
+                            usage = chunk
+                        if chunk.text:
+                            yield chunk.text
+                except (asyncio.CancelledError, GeneratorExit):
+                    raise
+                except Exception as e:
+                    if streaming:
+                        self.breaker.record_failure()
+                        self.counters["failures"] += 1
+                        raise
+                    attempt = await self._handle_failure(e, attempt, trial)
+                    continue
+                self.breaker.record_success()
+                self._record_usage(usage, estimated, stage, time.perf_counter() - started)
+                return
+        except (asyncio.CancelledError, GeneratorExit):
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2) if waits else 0.0
+
+        return {
+            **self.counters,
+            "circuit_state": self.breaker.state,
+            "queue_depth": sum(1 for w in self._waiters if not w[3].done()),
+            "queue_wait_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(waits[-1] * 1000, 2) if waits else 0.0,
+            },
+        }
+
+    def _enter_circuit(self) -> bool:
+        """Fail fast while the circuit is open; returns whether this call is the half-open trial."""
+        admitted = self.breaker.admit()
+        if admitted is None:
+            self.counters["rejected_open_circuit"] += 1
+            raise LLMUnavailableError("LLM provider unavailable (circuit breaker open)")
+        return admitted == "trial"
+
+    async def _admit(self, tokens: int, priority: int) -> None:
+        wait = await self._acquire(tokens, priority)
+        self._wait_times.append(wait)
+        self.telemetry.observe_llm_wait(wait)
+        self.counters["requests"] += 1
+
+    async def _handle_failure(self, e: Exception, attempt: int, trial: bool = False) -> int:
+        """Sleep before the next attempt, or raise if the error is final."""
+        if is_quota_error(e):
+            self.counters["quota_errors"] += 1
+            final_error = LLMQuotaError
+        elif is_transient_error(e):
+            self.counters["transient_errors"] += 1
+            final_error = LLMUnavailableError
+        else:
+            # Caller errors (bad request, invalid argument) say nothing about provider health
+            if trial:
+                self.breaker.release_trial()
+            raise e
+
+        if attempt >= self.max_retries:
+            self.breaker.record_failure()
+            self.counters["failures"] += 1
+            raise final_error(str(e)) from e
+
+        # Full jitter keeps retries from many requests from synchronizing
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        logger.info(f"LLM call failed ({type(e).__name__}); retry {attempt + 1} in {delay:.2f}s")
+        self.counters["retries"] += 1
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+    def _record_usage(self, response: LLMResponse, estimated: int, stage: str, seconds: float) -> None:
+        prompt_tokens = response.prompt_tokens
+        completion_tokens = response.completion_tokens
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["completion_tokens"] += completion_tokens
+        self.telemetry.observe_llm(stage, seconds, prompt_tokens, completion_tokens)
+        if prompt_tokens or completion_tokens:
+            self.token_bucket.adjust(prompt_tokens + completion_tokens - estimated)
+
+    async def _acquire(self, tokens: int, priority: int) -> float:
+        """Wait for rate limit capacity; returns the time spent queued."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._dispatcher is None or self._dispatcher.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._waiters = []
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        started = time.monotonic()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._wakeup.set()
+        await future
+        return time.monotonic() - started
+
+    async def _dispatch(self) -> None:
+        while True:
+            # Skip waiters whose callers were cancelled
+            while self._waiters and self._waiters[0][3].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, _, tokens, future = self._waiters[0]
+            wait = max(self.request_bucket.time_until(1), self.token_bucket.time_until(tokens))
+            if wait > 0:
+                # Wake early if a higher-priority request arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._waiters)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            future.set_result(None)
@@ -1,11 +1,19 @@
 from fastapi import FastAPI, Request, HTTPException, status
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Literal, Union
+from contextlib import asynccontextmanager
 from agents import MultiAgentSystem
+from database import warm_pools, dispose_engines
+from telemetry import CONTENT_TYPE_LATEST
+from responses import FastJSONResponse, json_response, dumps
+from config import settings
 import uvicorn
+import asyncio
+import io
+import time
 import os
 from pathlib import Path
 import logging
@@ -18,11 +26,33 @@ logger = logging.getLogger(__name__)
 # Get the base directory
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-app = FastAPI(title="Multi-Agent RAG System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker: connect, load the schema and warm the agents before accepting traffic
+    logger.info("Warming database connection pools...")
+    await warm_pools(settings.DB_POOL_WARM)
+    logger.info("Initializing agent system...")
+    # Schema inspection is blocking; keep the loop free while it runs
+    app.agent_system = await asyncio.to_thread(MultiAgentSystem)
+    await app.agent_system.start()
+    try:
+        yield
+    finally:
+        await app.agent_system.stop()
+        await dispose_engines()
+
+app = FastAPI(title="Multi-Agent RAG System", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Set up templates directory
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
+# How often (seconds) an in-flight request checks whether its client went away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Media types of /ask/rows
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
 # Set up static files only if the directory exists
 static_dir = BASE_DIR / "static"
 if static_dir.exists():
@@ -30,13 +60,98 @@ if static_dir.exists():
 
 class Query(BaseModel):
     question: str
+    # Always have the LLM write the answer, even for results a template could state
+    narrative: bool = False
+    # `records` returns query_results as one object per row instead of column names plus row arrays
+    result_format: Literal["columns", "records"] = "columns"
+
+class QueryResults(BaseModel):
+    """Column-oriented rows: `rows[i][j]` is the value of `columns[j]` in row `i`."""
+    columns: List[str]
+    column_types: List[Optional[str]]
+    rows: List[List[Any]]
+
+class IntermediateSteps(BaseModel):
+    model_config = ConfigDict(extra="allow")
 
+    relevant_tables: Optional[List[str]] = None
+    generated_sql: Optional[str] = None
+    query_results: Optional[Union[QueryResults, List[Dict[str, Any]]]] = None
+    cache: Optional[Dict[str, str]] = None
+    routing: Optional[Dict[str, Any]] = None
+    prompt: Optional[Dict[str, Any]] = None
+    guard: Optional[Dict[str, Any]] = None
+    literals: Optional[Dict[str, Any]] = None
+    rollup: Optional[Dict[str, Any]] = None
+    execution: Optional[Dict[str, Any]] = None
+    summary: Optional[Dict[str, Any]] = None
+    answer: Optional[Dict[str, Any]] = None
+    coalesced: List[str] = []
+    timings: Dict[str, float] = {}
+
+# Response schemas document the API; handlers return pre-encoded responses, so rows are never validated
 class QueryResponse(BaseModel):
     answer: Optional[str] = None
     error: Optional[str] = None
     error_type: Optional[str] = None
     original_error: Optional[str] = None
-    intermediate_steps: Dict[str, Any]
+    intermediate_steps: Optional[IntermediateSteps] = None
+
+class BatchQuery(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+    narrative: bool = False
+    result_format: Literal["columns", "records"] = "columns"
+
+class BatchItem(QueryResponse):
+    question: str
+    status_code: int
+    elapsed_ms: float
+    duplicate_of: Optional[int] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+    distinct_questions: int
+    elapsed_ms: float
+
+# Map error types to appropriate HTTP status codes
+ERROR_STATUS_CODES = {
+    "api_quota": status.HTTP_402_PAYMENT_REQUIRED,
+    "api_quota_partial": status.HTTP_206_PARTIAL_CONTENT,
+    "api_unavailable": status.HTTP_503_SERVICE_UNAVAILABLE,
+    "api_unavailable_partial": status.HTTP_206_PARTIAL_CONTENT,
+    "database": status.HTTP_503_SERVICE_UNAVAILABLE,
+    "sql_rejected": status.HTTP_422_UNPROCESSABLE_ENTITY,
+    "unknown": status.HTTP_400_BAD_REQUEST
+}
+
+def shape_results(result: Dict[str, Any], result_format: str) -> Dict[str, Any]:
+    """Apply the requested query_results format; results may be shared between requests, so never mutated."""
+    steps = result.get("intermediate_steps")
+    if result_format != "records" or not steps or not isinstance(steps.get("query_results"), dict):
+        return result
+    payload = steps["query_results"]
+    records = [dict(zip(payload["columns"], row)) for row in payload["rows"]]
+    return {**result, "intermediate_steps": {**steps, "query_results": records}}
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before the pipeline finishes."""
+
+async def run_until_disconnected(request: Request, coro):
+    """Run a coroutine, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        # Covers both disconnects and cancellation of this handler itself
+        if not task.done():
+            task.cancel()
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -46,36 +161,27 @@ async def home(request: Request):
     )
 
 @app.post("/ask", response_model=QueryResponse)
-async def process_query(query: Query):
+async def process_query(query: Query, request: Request):
     try:
         logger.info(f"Received question: {query.question}")
         
-        # Initialize agent system
-        logger.info("Initializing agent system...")
-        if not hasattr(app, "agent_system"):
-            app.agent_system = MultiAgentSystem()
-        
         # Process the query
         logger.info("Processing query through agent system...")
-        result = app.agent_system.process_query(query.question)
+        result = await run_until_disconnected(request, app.agent_system.process_query(query.question, narrative=query.narrative))
+        
+        timings = (result.get("intermediate_steps") or {}).get("timings", {})
+        logger.info(f"Processing complete in {timings.get('total')} ms (error_type={result.get('error_type')})")
         
-        logger.info(f"Processing complete. Result: {result}")
+        result = shape_results(result, query.result_format)
         
         # Handle errors in the result
         if "error" in result:
             logger.error(f"Error in result: {result['error']}")
             error_type = result.get("error_type", "unknown")
             
-            # Map error types to appropriate HTTP status codes
-            status_codes = {
-                "api_quota": status.HTTP_402_PAYMENT_REQUIRED,
-                "api_quota_partial": status.HTTP_206_PARTIAL_CONTENT,
-                "database": status.HTTP_503_SERVICE_UNAVAILABLE,
-                "unknown": status.HTTP_400_BAD_REQUEST
-            }
-            
-            return JSONResponse(
-                status_code=status_codes.get(error_type, status.HTTP_400_BAD_REQUEST),
+            return json_response(
+                request,
+                status_code=ERROR_STATUS_CODES.get(error_type, status.HTTP_400_BAD_REQUEST),
                 content={
                     "error": result["error"],
                     "error_type": error_type,
@@ -84,16 +190,30 @@ async def process_query(query: Query):
                 }
             )
         
-        # Return successful result
-        return JSONResponse(
+        # Return successful result, encoded once without model validation
+        return json_response(
+            request,
             status_code=status.HTTP_200_OK,
             content=result
         )
             
+    except ClientDisconnected:
+        logger.info("Client disconnected; cancelled query processing")
+        return json_response(
+            request,
+            status_code=499,
+            content={
+                "error": "Client closed request",
+                "error_type": "client_disconnected",
+                "original_error": None,
+                "intermediate_steps": None
+            }
+        )
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         logger.error(f"Full error traceback: {traceback.format_exc()}")
-        return JSONResponse(
+        return json_response(
+            request,
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={
                 "error": "Internal server error occurred",
@@ -103,5 +223,186 @@ async def process_query(query: Query):
             }
         )
 
+@app.post("/ask/batch", response_model=BatchResponse)
+async def process_batch(batch: BatchQuery, request: Request):
+    """Answer a list of questions; duplicates are answered once and failures stay per item."""
+    if len(batch.questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"A batch may contain at most {settings.BATCH_MAX_QUESTIONS} questions"
+        )
+    max_concurrency = min(batch.max_concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    logger.info(f"Received batch of {len(batch.questions)} questions (concurrency {max_concurrency})")
+    
+    started = time.perf_counter()
+    try:
+        items = await run_until_disconnected(
+            request, app.agent_system.process_batch(batch.questions, max_concurrency, batch.narrative)
+        )
+    except ClientDisconnected:
+        logger.info("Client disconnected; cancelled batch processing")
+        return json_response(request, status_code=499, content={"error": "Client closed request"})
+    
+    # Built as plain data in the BatchResponse shape; validating every row would dominate large batches
+    results = []
+    for question, item in zip(batch.questions, items):
+        result = shape_results(item["result"], batch.result_format)
+        error_type = result.get("error_type")
+        status_code = ERROR_STATUS_CODES.get(error_type, status.HTTP_400_BAD_REQUEST) if error_type else status.HTTP_200_OK
+        results.append({
+            "question": question,
+            "status_code": status_code,
+            "elapsed_ms": item["elapsed_ms"],
+            "duplicate_of": item["duplicate_of"],
+            "answer": result.get("answer"),
+            "error": result.get("error"),
+            "error_type": error_type,
+            "original_error": result.get("original_error"),
+            "intermediate_steps": result.get("intermediate_steps") or {},
+        })
+    return json_response(request, {
+        "results": results,
+        "distinct_questions": sum(1 for item in items if item["duplicate_of"] is None),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Rate limiter, retry and circuit breaker statistics of the shared LLM gateway."""
+    return app.agent_system.llm.stats()
+
+@app.get("/index/advice")
+async def index_advice(top: int = 10, explain: bool = False):
+    """Index proposals and unused indexes for the SQL this process has executed (read-only; never applies)."""
+    return await asyncio.to_thread(app.agent_system.index_advisor.report, top, explain)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latencies, LLM tokens, DB execution and cache hits."""
+    return Response(content=app.agent_system.telemetry.render(), media_type=CONTENT_TYPE_LATEST)
+
+def format_sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+@app.post("/ask/stream")
+async def stream_query(query: Query):
+    """Streaming variant of /ask: emits each pipeline stage as Server-Sent Events."""
+    logger.info(f"Received streaming question: {query.question}")
+    
+    async def event_stream():
+        try:
+            async for event in app.agent_system.stream_query(query.question, narrative=query.narrative):
+                yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            logger.error(f"Full error traceback: {traceback.format_exc()}")
+            yield format_sse("result", {
+                "error": "Internal server error occurred",
+                "error_type": "server_error",
+                "original_error": str(e),
+                "intermediate_steps": None
+            })
+    
+    # Starlette cancels the generator when the client disconnects
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def ndjson_rows(columns: List[str], events) -> Any:
+    """Header object with the columns, one JSON array per row, then a trailer object with the outcome."""
+    try:
+        yield dumps({"columns": columns}) + b"\n"
+        async for event in events:
+            if event["event"] == "chunk":
+                yield b"".join(dumps(row) + b"\n" for row in event["data"]["rows"])
+            elif event["event"] == "result":
+                data = event["data"]
+                yield dumps({
+                    "error": data.get("error"),
+                    "error_type": data.get("error_type"),
+                    "intermediate_steps": data.get("intermediate_steps"),
+                }) + b"\n"
+    finally:
+        await events.aclose()
+
+async def arrow_rows(columns: List[str], events) -> Any:
+    """Arrow IPC stream with one record batch per cursor chunk; the schema is inferred from the first chunk."""
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = None
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    try:
+        async for event in events:
+            if event["event"] == "chunk":
+                values = list(zip(*event["data"]["rows"]))
+                if writer is None:
+                    batch = pa.RecordBatch.from_arrays([pa.array(v) for v in values], names=columns)
+                    writer = pa.ipc.new_stream(sink, batch.schema)
+                else:
+                    batch = pa.RecordBatch.from_arrays(
+                        [pa.array(v, type=field.type) for v, field in zip(values, writer.schema)], names=columns
+                    )
+                writer.write_batch(batch)
+                yield drain()
+            elif event["event"] == "result" and event["data"].get("error"):
+                # Arrow streams have no error frame; the stream just ends early
+                logger.error(f"Row stream failed: {event['data']['error']}")
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, pa.schema([(c, pa.null()) for c in columns]))
+        writer.close()
+        yield drain()
+    finally:
+        await events.aclose()
+
+@app.post("/ask/rows")
+async def stream_rows(query: Query, request: Request, format: Optional[str] = None):
+    """Answer with rows only, streamed from a server-side cursor as NDJSON or Arrow IPC (no synthesis)."""
+    if format is None:
+        format = "arrow" if ARROW_MEDIA_TYPE in request.headers.get("accept", "") else "ndjson"
+    if format not in ("ndjson", "arrow"):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="format must be 'ndjson' or 'arrow'")
+    if format == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                                detail="Arrow output needs pyarrow installed on the server")
+    logger.info(f"Received row streaming question: {query.question}")
+    
+    # Translate the question before committing to a streaming response, so failures keep their status code
+    events = app.agent_system.stream_query(query.question, rows_only=True)
+    async for event in events:
+        if event["event"] == "columns":
+            columns = event["data"]["columns"]
+            break
+        if event["event"] == "result":
+            await events.aclose()
+            result = event["data"]
+            error_type = result.get("error_type", "unknown")
+            return json_response(
+                request,
+                status_code=ERROR_STATUS_CODES.get(error_type, status.HTTP_400_BAD_REQUEST),
+                content=result
+            )
+    
+    if format == "arrow":
+        return StreamingResponse(arrow_rows(columns, events), media_type=ARROW_MEDIA_TYPE)
+    return StreamingResponse(ndjson_rows(columns, events), media_type=NDJSON_MEDIA_TYPE)
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True, log_level="debug") 
\ No newline at end of file
+    if settings.APP_WORKERS > 1:
+        # Each worker process runs the lifespan and gets its own pools, caches and LLM rate limiter
+        uvicorn.run("main:app", host="127.0.0.1", port=8000, workers=settings.APP_WORKERS, log_level="info")
+    else:
+        uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True, log_level="debug")
\ No newline at end of file
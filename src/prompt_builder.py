@@ -0,0 +1,228 @@
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from schema_catalog import SchemaCatalog, TableInfo, ColumnInfo
+from table_router import TableRouter
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TEXT_TYPES = ("CHAR", "TEXT", "STRING")
+DATE_TYPES = ("DATE", "TIME")
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token count (about four characters per token for English and SQL)."""
+    return math.ceil(len(prompt) / 4)
+
+
+def is_text_column(column: ColumnInfo) -> bool:
+    return any(t in column.type.upper() for t in TEXT_TYPES)
+
+
+def is_date_column(column: ColumnInfo) -> bool:
+    return any(t in column.type.upper() for t in DATE_TYPES)
+
+
+@dataclass
+class ColumnHint:
+    values: Optional[List[str]] = None
+    min_value: Optional[str] = None
+    max_value: Optional[str] = None
+    distinct: Optional[int] = None
+    non_null: Optional[int] = None
+
+
+class ColumnProfiler:
+    """Collects per-column hints (enum-like values, date ranges) and caches them per table.
+
+    Text columns get their distinct and non-null counts, and their values
+    when there are at most `max_values` of them. Profiles are recomputed
+    when the table's catalog entry changes, after `ttl` seconds, or when
+    invalidated.
+    """
+
+    def __init__(self, engine: Engine, max_values: int = 12, ttl: float = 3600.0) -> None:
+        self.engine = engine
+        self.max_values = max_values
+        self.ttl = ttl
+        self._profiles: Dict[str, Tuple[TableInfo, float, Dict[str, ColumnHint]]] = {}
+        self._lock = threading.Lock()
+
+    def profile(self, table: TableInfo) -> Dict[str, ColumnHint]:
+        with self._lock:
+            cached = self._profiles.get(table.name)
+            if cached and cached[0] == table and time.monotonic() - cached[1] < self.ttl:
+                return cached[2]
+        try:
+            hints = self._collect(table)
+        except Exception as e:
+            logger.error(f"Column profiling failed for {table.name}: {str(e)}")
+            hints = {}
+        with self._lock:
+            self._profiles[table.name] = (table, time.monotonic(), hints)
+        return hints
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        with self._lock:
+            if table_name is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(table_name, None)
+
+    @staticmethod
+    def value_columns(table: TableInfo) -> List[str]:
+        """Text columns that are not keys: the ones whose values are collected."""
+        key_columns = set(table.primary_key)
+        for fk in table.foreign_keys:
+            key_columns.update(fk.columns)
+        return [c.name for c in table.columns if is_text_column(c) and c.name not in key_columns]
+
+    def _collect(self, table: TableInfo) -> Dict[str, ColumnHint]:
+        quote = self.engine.dialect.identifier_preparer.quote
+        text_columns = self.value_columns(table)
+        date_columns = [c.name for c in table.columns if is_date_column(c)]
+        if not text_columns and not date_columns:
+            return {}
+
+        hints: Dict[str, ColumnHint] = {}
+        with self.engine.connect() as connection:
+            # One pass for distinct and non-null counts and date ranges
+            selects = []
+            for c in text_columns:
+                selects += [f"COUNT(DISTINCT {quote(c)})", f"COUNT({quote(c)})"]
+            for c in date_columns:
+                selects += [f"MIN({quote(c)})", f"MAX({quote(c)})"]
+            row = connection.execute(text(f"SELECT {', '.join(selects)} FROM {quote(table.name)}")).fetchone()
+
+            offset = 2 * len(text_columns)
+            for i, c in enumerate(date_columns):
+                low, high = row[offset + 2 * i], row[offset + 2 * i + 1]
+                if low is not None:
+                    hints[c] = ColumnHint(min_value=str(low), max_value=str(high))
+
+            for i, c in enumerate(text_columns):
+                n_distinct, n_non_null = row[2 * i], row[2 * i + 1]
+                hint = ColumnHint(distinct=n_distinct, non_null=n_non_null)
+                if n_distinct and n_distinct <= self.max_values:
+                    values = connection.execute(text(
+                        f"SELECT DISTINCT {quote(c)} FROM {quote(table.name)} "
+                        f"WHERE {quote(c)} IS NOT NULL ORDER BY 1"
+                    )).scalars().all()
+                    hint.values = [str(v) for v in values]
+                hints[c] = hint
+        return hints
+
+
+@dataclass
+class SchemaPrompt:
+    text: str
+    tokens: int
+    tables: List[str]
+    join_tables: List[str] = field(default_factory=list)
+    joins: List[str] = field(default_factory=list)
+    detail: str = "full"
+    truncated: bool = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "schema_tokens": self.tokens,
+            "tables": self.tables,
+            "join_tables": self.join_tables,
+            "detail": self.detail,
+            "truncated": self.truncated,
+        }
+
+
+class SchemaPromptBuilder:
+    """Renders a compact schema for the selected tables and the joins between them."""
+
+    # Progressively cheaper renderings tried until the prompt fits the token budget
+    DETAIL_LEVELS = ("full", "no_join_table_hints", "no_hints", "join_table_keys_only")
+
+    def __init__(self, catalog: SchemaCatalog, router: TableRouter, profiler: Optional[ColumnProfiler] = None,
+                 token_budget: int = 2000, max_hint_values: int = 12) -> None:
+        self.catalog = catalog
+        self.router = router
+        self.profiler = profiler
+        self.token_budget = token_budget
+        # The profiler may collect longer value lists (for the value index) than are worth listing
+        self.max_hint_values = max_hint_values
+
+    def build(self, relevant_tables: List[str]) -> SchemaPrompt:
+        tables, join_tables = self.router.expand([t for t in relevant_tables if self.catalog.table(t)])
+        if not tables:
+            tables = self.catalog.table_names()
+        infos = [self.catalog.table(name) for name in tables]
+        hints = {info.name: self.profiler.profile(info) for info in infos} if self.profiler else {}
+        joins = self._joins(infos)
+
+        prompt = None
+        for detail in self.DETAIL_LEVELS:
+            rendered = self._render(infos, join_tables, hints, joins, detail)
+            prompt = SchemaPrompt(
+                text=rendered,
+                tokens=estimate_tokens(rendered),
+                tables=tables,
+                join_tables=join_tables,
+                joins=joins,
+                detail=detail,
+            )
+            if prompt.tokens <= self.token_budget:
+                return prompt
+
+        # Still over budget with the leanest rendering: cut at a line boundary
+        max_chars = self.token_budget * 4
+        cut = prompt.text[:max_chars].rsplit("\n", 1)[0]
+        prompt.text = cut
+        prompt.tokens = estimate_tokens(cut)
+        prompt.truncated = True
+        return prompt
+
+    @staticmethod
+    def _joins(infos: List[TableInfo]) -> List[str]:
+        names = {info.name for info in infos}
+        joins = []
+        for info in infos:
+            for fk in info.foreign_keys:
+                if fk.referred_table in names:
+                    pairs = zip(fk.columns, fk.referred_columns)
+                    joins.append(" AND ".join(f"{info.name}.{a} = {fk.referred_table}.{b}" for a, b in pairs))
+        return joins
+
+    def _render(self, infos: List[TableInfo], join_tables: List[str], hints: Dict[str, Dict[str, ColumnHint]],
+                joins: List[str], detail: str) -> str:
+        blocks = []
+        for info in infos:
+            is_join_table = info.name in join_tables
+            show_hints = detail == "full" or (detail == "no_join_table_hints" and not is_join_table)
+            keys_only = detail == "join_table_keys_only" and is_join_table
+            fk_targets = {}
+            for fk in info.foreign_keys:
+                for a, b in zip(fk.columns, fk.referred_columns):
+                    fk_targets[a] = f"{fk.referred_table}.{b}"
+
+            lines = [f"Table: {info.name}"]
+            for col in info.columns:
+                if keys_only and not col.primary_key and col.name not in fk_targets:
+                    continue
+                line = f"  {col.name} {col.type}"
+                if col.primary_key:
+                    line += " PK"
+                if col.name in fk_targets:
+                    line += f" FK -> {fk_targets[col.name]}"
+                hint = hints.get(info.name, {}).get(col.name) if show_hints else None
+                if hint and hint.values is not None and len(hint.values) <= self.max_hint_values:
+                    line += " values: " + ", ".join(f"'{v}'" for v in hint.values)
+                elif hint and hint.min_value is not None:
+                    line += f" range: {hint.min_value} .. {hint.max_value}"
+                lines.append(line)
+            blocks.append("\n".join(lines))
+
+        if joins:
+            blocks.append("Join paths:\n" + "\n".join(f"  {join}" for join in joins))
+        return "\n\n".join(blocks)
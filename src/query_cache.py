@@ -0,0 +1,225 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3,
+    "apr": 4, "april": 4, "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7,
+    "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9, "oct": 10, "october": 10,
+    "nov": 11, "november": 11, "dec": 12, "december": 12,
+}
+
+NUMBER_WORDS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+    "eleven": "11", "twelve": "12", "twenty": "20", "fifty": "50", "hundred": "100",
+}
+
+_MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+ISO_DATE_RE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+US_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+MONTH_DAY_YEAR_RE = re.compile(rf"\b({_MONTH_PATTERN})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b")
+DAY_MONTH_YEAR_RE = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_PATTERN})\.?,?\s+(\d{{4}})\b")
+MONTH_YEAR_RE = re.compile(rf"\b({_MONTH_PATTERN})\.?,?\s+(\d{{4}})\b")
+NUMBER_RE = re.compile(r"(?<![\w.\-])(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?(?![\w\-])")
+
+
+def _iso(year: str, month: int, day: str) -> str:
+    try:
+        return datetime(int(year), int(month), int(day)).date().isoformat()
+    except ValueError:
+        return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def _normalize_number(match: re.Match) -> str:
+    integer = match.group(1).replace(",", "")
+    fraction = (match.group(2) or "").rstrip("0")
+    integer = integer.lstrip("0") or "0"
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so near-identical phrasings share a cache key.
+
+    Case, whitespace and punctuation are folded, date literals are rewritten
+    to ISO form and number literals to a canonical digit form.
+    """
+    text = unicodedata.normalize("NFKC", question).lower()
+
+    # Dates first, while separators are still present
+    text = ISO_DATE_RE.sub(lambda m: _iso(m.group(1), int(m.group(2)), m.group(3)), text)
+    text = US_DATE_RE.sub(lambda m: _iso(m.group(3), int(m.group(1)), m.group(2)), text)
+    text = MONTH_DAY_YEAR_RE.sub(lambda m: _iso(m.group(3), MONTHS[m.group(1)], m.group(2)), text)
+    text = DAY_MONTH_YEAR_RE.sub(lambda m: _iso(m.group(3), MONTHS[m.group(2)], m.group(1)), text)
+    text = MONTH_YEAR_RE.sub(lambda m: f"{m.group(2)}-{MONTHS[m.group(1)]:02d}", text)
+
+    # Numbers: drop thousands separators and insignificant zeros
+    text = NUMBER_RE.sub(_normalize_number, text)
+
+    # Punctuation: keep characters that are part of date/number literals
+    text = re.sub(r"(?<!\d)[.\-](?!\d)", " ", text)
+    text = re.sub(r"[^\w\s.\-]", " ", text)
+
+    words = [NUMBER_WORDS.get(word, word) for word in text.split()]
+    return " ".join(words)
+
+
+@dataclass
+class CachedQuery:
+    relevant_tables: List[str]
+    sql: str
+    fingerprint: str
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class QueryCache:
+    """Bounded LRU/TTL cache mapping normalized questions to generated SQL.
+
+    Keys include the schema fingerprint, so a schema change makes old entries
+    unreachable; `purge_stale()` drops them eagerly. When `path` is set the
+    cache is loaded from a JSON file and changes are written back off the
+    event loop, at most every `save_interval` seconds and on `stop()`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, path: Optional[str] = None,
+                 save_interval: float = 5.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        if self.path:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(question: str, fingerprint: str) -> str:
+        normalized = normalize_question(question)
+        return hashlib.sha1(f"{fingerprint}|{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, question: str, fingerprint: str) -> Optional[CachedQuery]:
+        if not self.enabled:
+            return None
+        key = self.make_key(question, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def put(self, question: str, fingerprint: str, relevant_tables: List[str], sql: str) -> None:
+        if not self.enabled:
+            return
+        key = self.make_key(question, fingerprint)
+        with self._lock:
+            self._entries[key] = CachedQuery(relevant_tables=list(relevant_tables), sql=sql, fingerprint=fingerprint)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def purge_stale(self, fingerprint: str) -> int:
+        """Drop entries generated against a different schema fingerprint."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.fingerprint != fingerprint]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._dirty = True
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    async def start(self) -> None:
+        if self.path and self.enabled:
+            self._task = asyncio.create_task(self._save_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def flush(self) -> None:
+        """Write the cache to `path` if it changed since the last write."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {key: asdict(entry) for key, entry in self._entries.items()}
+            self._dirty = False
+        if not self._save(data):
+            with self._lock:
+                self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _expired(self, entry: CachedQuery) -> bool:
+        return self.ttl > 0 and time.time() - entry.created_at > self.ttl
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, value in data.items():
+                entry = CachedQuery(**value)
+                if not self._expired(entry):
+                    self._entries[key] = entry
+            logger.info(f"Loaded {len(self._entries)} cached queries from {self.path}")
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Could not load query cache from {self.path}: {str(e)}")
+
+    async def _save_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.save_interval)
+            await asyncio.to_thread(self.flush)
+
+    def _save(self, data: Dict[str, Any]) -> bool:
+        # Write a temporary file and rename it, so a crash never leaves a truncated cache
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.error(f"Could not save query cache to {self.path}: {str(e)}")
+            return False
@@ -0,0 +1,308 @@
+from typing import List, Dict, Any, Optional, Set
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlglot import exp
+from sql_utils import parse_sql, canonical_sql, canonicalize_sql, referenced_tables
+from result_set import ResultSet
+import argparse
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "rag_table_changes"
+
+NOTIFY_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION rag_notify_table_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGER_NAME = "rag_notify_change"
+
+TRIGGERS_SQL = f"""
+SELECT c.relname
+FROM pg_trigger t
+JOIN pg_class c ON c.oid = t.tgrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE t.tgname = '{TRIGGER_NAME}' AND n.nspname = current_schema()
+"""
+
+POLL_SQL = """
+SELECT relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup
+FROM pg_stat_user_tables
+WHERE schemaname = current_schema()
+"""
+
+
+class TableVersions:
+    """Per-table version counters; a bump invalidates every cached result that read the table."""
+
+    def __init__(self) -> None:
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def snapshot(self, tables: Set[str]) -> Dict[str, int]:
+        with self._lock:
+            return {table: self._versions.get(table, 0) for table in tables}
+
+    def bump(self, table: str) -> None:
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def bump_all(self) -> None:
+        with self._lock:
+            for table in self._versions:
+                self._versions[table] += 1
+            # Tables never seen yet have version 0; move everything past it
+            self._versions["*"] = self._versions.get("*", 0) + 1
+
+
+@dataclass
+class CachedResult:
+    result: ResultSet
+    versions: Dict[str, int]
+    size: int
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class ResultCache:
+    """Result-set cache keyed by canonical SQL.
+
+    Each entry records the version of every table it read; an entry is only
+    served while all of those versions are unchanged. Eviction is LRU,
+    bounded by the approximate serialized size of the cached result sets.
+    """
+
+    def __init__(self, versions: TableVersions, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0) -> None:
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, sql_query: str) -> Optional[ResultSet]:
+        key = canonicalize_sql(sql_query) if self.enabled else None
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.result
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def snapshot(self, sql_query: str) -> Optional[Dict[str, int]]:
+        """Versions of the tables a query reads; take it before running the query and pass it to `put`."""
+        tree = parse_sql(sql_query) if self.enabled else None
+        if not isinstance(tree, exp.Query):
+            return None
+        return self.versions.snapshot(referenced_tables(tree) | {"*"})
+
+    def put(self, sql_query: str, result: ResultSet, versions: Optional[Dict[str, int]]) -> bool:
+        """Cache a result set for a query; returns False if the query or result is not cacheable.
+
+        `versions` is the `snapshot` taken before the query ran. If a table
+        was written to since, the result may predate the write and is not
+        cached.
+        """
+        if not self.enabled or versions is None:
+            return False
+        tree = parse_sql(sql_query)
+        # Only plain queries are cacheable
+        if not isinstance(tree, exp.Query):
+            return False
+        size = result.bytes
+        if size > self.max_entry_bytes:
+            return False
+        if self.versions.snapshot(set(versions)) != versions:
+            return False
+
+        key = canonical_sql(tree)
+        entry = CachedResult(result=result, versions=versions, size=size)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+    def _valid(self, entry: CachedResult) -> bool:
+        if self.ttl > 0 and time.monotonic() - entry.created_at > self.ttl:
+            return False
+        return all(self.versions.get(table) == version for table, version in entry.versions.items())
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+
+def install_triggers(engine: Engine, tables: List[str]) -> None:
+    """Create the notify function and a statement-level trigger on each table (an admin step, run once)."""
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as connection:
+        connection.execute(text(NOTIFY_FUNCTION_SQL))
+        for table in tables:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {quote(table)}"))
+            connection.execute(text(
+                f"CREATE TRIGGER {TRIGGER_NAME} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE "
+                f"ON {quote(table)} FOR EACH STATEMENT EXECUTE FUNCTION rag_notify_table_change()"
+            ))
+
+
+def missing_triggers(engine: Engine, tables: List[str]) -> List[str]:
+    """Tables without the change trigger."""
+    with engine.connect() as connection:
+        installed = set(connection.execute(text(TRIGGERS_SQL)).scalars())
+    return [table for table in tables if table not in installed]
+
+
+class TableChangeMonitor:
+    """Bumps table versions when tables are written to.
+
+    `poll` compares pg_stat_user_tables counters every `poll_interval`
+    seconds. `notify` listens on a LISTEN/NOTIFY channel fed by
+    statement-level triggers; the application never creates them, they are
+    installed once with `python src/result_cache.py --install-triggers`, and
+    the monitor falls back to polling when any table lacks one. Both need
+    PostgreSQL; elsewhere only the cache TTL applies.
+    """
+
+    def __init__(self, versions: TableVersions, engine: Engine, tables: List[str],
+                 mode: str = "poll", poll_interval: float = 5.0) -> None:
+        self.versions = versions
+        self.engine = engine
+        self.tables = tables
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        """Whether writes are being detected; table versions are only kept current while they are."""
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self.mode == "off":
+            return
+        if self.engine.dialect.name != "postgresql":
+            logger.info("Table change detection needs PostgreSQL; result cache relies on its TTL only")
+            return
+        if self.mode == "notify":
+            try:
+                missing = await asyncio.to_thread(missing_triggers, self.engine, self.tables)
+            except Exception as e:
+                missing = [f"unknown ({str(e)})"]
+            if missing:
+                logger.warning(f"Change triggers missing on {missing}, falling back to polling; "
+                               f"install them with python src/result_cache.py --install-triggers")
+                self.mode = "poll"
+        loop = self._listen_loop if self.mode == "notify" else self._poll_loop
+        self._task = asyncio.create_task(loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen_loop(self) -> None:
+        import asyncpg
+
+        dsn = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+            except Exception as e:
+                logger.error(f"Change listener could not connect: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(NOTIFY_CHANNEL, lambda _c, _pid, _ch, table: self.versions.bump(table))
+            # Notifications may have been missed while disconnected
+            self.versions.bump_all()
+            try:
+                await closed.wait()
+                logger.error("Change listener connection closed; reconnecting")
+            finally:
+                if not connection.is_closed():
+                    await connection.close()
+
+    async def _poll_loop(self) -> None:
+        previous: Dict[str, tuple] = {}
+        while True:
+            try:
+                counters = await asyncio.to_thread(self._read_counters)
+                for table, value in counters.items():
+                    if table in previous and previous[table] != value:
+                        self.versions.bump(table)
+                previous = counters
+            except Exception as e:
+                logger.error(f"Table change polling failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _read_counters(self) -> Dict[str, tuple]:
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(POLL_SQL)).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def main() -> None:
+    from database import engine
+    from schema_catalog import SchemaCatalog
+    from rollups import ROLLUP_PREFIX
+
+    parser = argparse.ArgumentParser(description="Manage the triggers behind TABLE_CHANGE_DETECTION=notify")
+    parser.add_argument("--install-triggers", action="store_true",
+                        help="Create the notify function and a change trigger on every application table")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    catalog = SchemaCatalog(engine, exclude_prefixes=(ROLLUP_PREFIX,))
+    catalog.load()
+    tables = catalog.table_names()
+    if args.install_triggers:
+        install_triggers(engine, tables)
+        logger.info(f"Installed change triggers on {len(tables)} tables")
+    missing = missing_triggers(engine, tables)
+    print(f"Tables without change triggers: {', '.join(missing) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from typing import List, Dict, Any, Optional, Iterator, Sequence, Tuple
+from datetime import date, datetime
+from itertools import islice
+import json
+
+
+def serialize_date(obj):
+    """Convert date objects to ISO format strings."""
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return obj
+
+
+def json_default(obj: Any) -> Any:
+    """`default` for json.dumps over raw database values."""
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return str(obj)
+
+
+class ResultSet:
+    """Column-oriented query result: names stored once, one list of values per column.
+
+    Rows are added chunk by chunk as they come off the cursor. Once
+    `max_rows` or `max_bytes` (approximate JSON size, 0 disables) would be
+    exceeded, the remaining rows are dropped and `truncated` is set. With
+    `keep_rows=False` only counts and sizes are tracked, for callers that
+    forward each chunk instead of holding the result.
+    """
+
+    def __init__(self, columns: Sequence[str], max_rows: int = 0, max_bytes: int = 0, keep_rows: bool = True) -> None:
+        self.columns = list(columns)
+        self.data: List[List[Any]] = [[] for _ in self.columns]
+        self.types: List[Optional[str]] = [None] * len(self.columns)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.keep_rows = keep_rows
+        self.row_count = 0
+        self.bytes = 0
+        self.truncated = False
+        self.truncated_reason: Optional[str] = None
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def add_chunk(self, rows: Sequence[Sequence[Any]]) -> List[Tuple]:
+        """Add rows up to the caps; returns the rows that were accepted."""
+        if self.truncated or not rows:
+            return []
+        accepted = [tuple(row) for row in rows]
+        reason = None
+        if self.max_rows and self.row_count + len(accepted) > self.max_rows:
+            accepted = accepted[:self.max_rows - self.row_count]
+            reason = "rows"
+
+        size = len(json.dumps(accepted, default=json_default))
+        if self.max_bytes and self.bytes + size > self.max_bytes:
+            # Only the chunk that crosses the cap is measured row by row
+            kept = []
+            for row in accepted:
+                row_size = len(json.dumps(row, default=json_default)) + 1
+                if self.bytes + row_size > self.max_bytes:
+                    break
+                kept.append(row)
+                self.bytes += row_size
+            accepted = kept
+            reason = "bytes"
+        else:
+            self.bytes += size
+
+        self._note_types(accepted)
+        if self.keep_rows:
+            for values, column in zip(zip(*accepted), self.data):
+                column.extend(values)
+        self.row_count += len(accepted)
+        if reason:
+            self.truncated = True
+            self.truncated_reason = reason
+        return accepted
+
+    def _note_types(self, rows: List[Tuple]) -> None:
+        for i, known in enumerate(self.types):
+            if known is None:
+                value = next((row[i] for row in rows if row[i] is not None), None)
+                if value is not None:
+                    self.types[i] = type(value).__name__
+
+    def rows(self, limit: Optional[int] = None) -> Iterator[Tuple]:
+        return islice(zip(*self.data), limit)
+
+    def select(self, indices: Sequence[int]) -> List[Tuple]:
+        return [tuple(column[i] for column in self.data) for i in indices]
+
+    def to_columns(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Compact payload for JSON responses: column names and types once, then one array per row.
+
+        Values are left as the driver returned them (dates, decimals); the
+        response encoder converts them.
+        """
+        return {"columns": self.columns, "column_types": self.types, "rows": list(self.rows(limit))}
+
+    def to_records(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Row-of-dicts view (dates as ISO strings) for JSON responses and prompts."""
+        return [{col: serialize_date(val) for col, val in zip(self.columns, row)} for row in self.rows(limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "row_count": self.row_count,
+            "result_bytes": self.bytes,
+            "columns": self.columns,
+            "column_types": self.types,
+            "truncated": self.truncated,
+            "truncated_reason": self.truncated_reason,
+        }
@@ -0,0 +1,138 @@
+from typing import List, Dict, Any
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from prompt_builder import estimate_tokens
+from result_set import ResultSet, json_default
+import json
+import numpy as np
+
+# Python types summarized as numbers; bool is excluded even though it subclasses int
+NUMBER_TYPES = {int, float, Decimal}
+
+
+@dataclass
+class ResultSummary:
+    text: str
+    tokens: int
+    row_count: int
+    sample_rows: int
+    detail: str = "rows"
+    truncated: bool = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "summary_tokens": self.tokens,
+            "row_count": self.row_count,
+            "sample_rows": self.sample_rows,
+            "detail": self.detail,
+            "truncated": self.truncated,
+        }
+
+
+def _numeric_array(values: np.ndarray, kinds: set) -> np.ndarray:
+    """Integers stay exact while they fit in int64; decimals and floats become float64."""
+    if kinds == {int}:
+        try:
+            return values.astype(np.int64)
+        except OverflowError:
+            pass
+    return values.astype(np.float64)
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, (float, Decimal)):
+        return f"{value:.10g}"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+class ResultSummarizer:
+    """Turns a result set into a compact digest for the synthesis prompt.
+
+    Small results are passed as rows. Larger ones become per-column
+    statistics (non-null counts, min/max/mean, top categories, date ranges)
+    plus a sample of rows: the first ones, since results are often ordered,
+    and the rest spread evenly. Samples are halved until the digest fits
+    `token_budget`.
+    """
+
+    def __init__(self, token_budget: int = 1500, sample_rows: int = 20, top_k: int = 5) -> None:
+        self.token_budget = token_budget
+        self.sample_rows = sample_rows
+        self.top_k = top_k
+
+    def summarize(self, results: ResultSet) -> ResultSummary:
+        header = f"{results.row_count} row(s); columns: {', '.join(results.columns)}"
+        if results.truncated:
+            cap = "row" if results.truncated_reason == "rows" else "size"
+            header += f"\nThe result was cut off at the {cap} limit; more rows matched the query."
+
+        if results.row_count <= self.sample_rows:
+            text = self._render_rows(header, results, list(range(results.row_count)))
+            summary = ResultSummary(text, estimate_tokens(text), results.row_count, results.row_count)
+            if summary.tokens <= self.token_budget:
+                return summary
+
+        stats = self._column_stats(results)
+        sample = min(self.sample_rows, results.row_count)
+        while True:
+            text = self._render_rows(header + "\nColumn statistics:\n" + "\n".join(stats),
+                                     results, self._sample_indices(results.row_count, sample))
+            summary = ResultSummary(text, estimate_tokens(text), results.row_count, sample, detail="statistics")
+            if summary.tokens <= self.token_budget or sample == 0:
+                break
+            sample //= 2
+
+        if summary.tokens > self.token_budget:
+            # Too many columns even without samples: cut at a line boundary
+            cut = summary.text[:self.token_budget * 4].rsplit("\n", 1)[0]
+            summary.text = cut
+            summary.tokens = estimate_tokens(cut)
+            summary.truncated = True
+        return summary
+
+    @staticmethod
+    def _sample_indices(row_count: int, sample: int) -> List[int]:
+        if sample >= row_count:
+            return list(range(row_count))
+        head = (sample + 1) // 2
+        rest = sample - head
+        if rest == 0:
+            return list(range(head))
+        step = (row_count - head) / rest
+        return list(range(head)) + [head + int(i * step) for i in range(rest)]
+
+    @staticmethod
+    def _render_rows(header: str, results: ResultSet, indices: List[int]) -> str:
+        if not indices:
+            return header
+        label = "Rows" if len(indices) == results.row_count else f"Sample rows ({len(indices)} of {results.row_count})"
+        lines = [json.dumps(list(row), default=json_default) for row in results.select(indices)]
+        return f"{header}\n{label}:\n" + "\n".join(lines)
+
+    def _column_stats(self, results: ResultSet) -> List[str]:
+        lines = []
+        for name, values in zip(results.columns, results.data):
+            # fromiter keeps array-valued cells as single objects
+            column = np.fromiter(values, dtype=object, count=len(values))
+            present = column[np.not_equal(column, None)]
+            line = f"- {name}: {len(present)} non-null"
+            if not len(present):
+                lines.append(line)
+                continue
+            kinds = set(map(type, present))
+            if kinds <= NUMBER_TYPES:
+                numbers = _numeric_array(present, kinds)
+                line += (f", min {_format(numbers.min().item())}, max {_format(numbers.max().item())}, "
+                         f"mean {_format(numbers.mean().item())}, sum {_format(numbers.sum().item())}")
+            elif kinds <= {date, datetime}:
+                line += f", from {_format(present.min())} to {_format(present.max())}"
+            else:
+                distinct, counts = np.unique(present.astype(str), return_counts=True)
+                order = np.argsort(-counts, kind="stable")[:self.top_k]
+                top = ", ".join(f"{distinct[i]} ({counts[i]})" for i in order)
+                line += f", {len(distinct)} distinct; most common: {top}"
+            lines.append(line)
+        return lines
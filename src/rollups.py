@@ -0,0 +1,927 @@
+"""Precomputed aggregate rollups over `sales`, and rewriting generated SQL to read them.
+
+    python src/rollups.py --create     # create the rollup tables (once; the application never does)
+    python src/rollups.py --build      # refill every rollup from scratch
+    python src/rollups.py --refresh    # fold in sales added since the last refresh
+    python src/rollups.py --status
+    python src/rollups.py --explain "SELECT ..."
+
+Each rollup is a table of partial aggregates of `sales` (row count and the
+sum, count, min and max of `amount`) grouped by a date grain (month or day)
+and a few dimensions: `product`, `employee_id`, the employee's `department`
+and the customer's `country`. Rollups are refreshed incrementally: sales with
+a `sale_id` above the rollup's high-water mark are aggregated and appended
+as new partial rows, which queries re-aggregate. Partial rows are compacted
+once they outnumber the compacted ones.
+
+An insert can commit after a refresh has moved the watermark past its id.
+Each refresh therefore records the ids at or below the watermark that had
+no sale yet, and folds in sales that show up there later. Such a gap is
+treated as a rolled-back id once it is older than the gap retention. A
+rollup carrying `department` or `country` also stores a digest of the
+employee and customer rows it was built from. It is rebuilt when they no
+longer match.
+
+`plan_rewrite` rewrites an aggregate query over `sales` (optionally joined to
+`employees` and `customers` on their foreign keys) onto the smallest rollup
+that answers it exactly, or explains why it can't. Queries are only
+rewritten onto a rollup that has caught up with `sales` and its dimension
+tables; the request path only reads, and a rollup found behind is caught up
+by the background refresher.
+
+Sales are assumed to be inserted with increasing `sale_id`s and never
+updated or deleted; anything else needs `--build`.
+"""
+from typing import List, Dict, Any, Optional, Tuple, Set, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, timedelta
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, BigInteger, String, Float, Date, DateTime,
+    select, insert, update, delete, func, case, cast, text, and_, or_, inspect,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlglot import exp
+from model import Sale, Employee, Customer
+from result_cache import TableVersions
+from sql_utils import DIALECT, parse_sql
+import argparse
+import asyncio
+import datetime as dt
+import hashlib
+import json
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Tables created here start with this prefix; the schema catalog hides them from the LLM
+ROLLUP_PREFIX = "rollup_"
+# Partial rows tolerated beyond the compacted ones before a compaction
+COMPACT_MIN_ROWS = 1000
+
+FACT = Sale.__table__
+MEASURES = ["row_count", "amount_sum", "amount_count", "amount_min", "amount_max"]
+TABLE_COLUMNS = {table.name: set(table.columns.keys())
+                 for table in (Sale.__table__, Employee.__table__, Customer.__table__)}
+
+
+@dataclass(frozen=True)
+class DimensionTable:
+    key: str        # foreign key on sales and primary key of the dimension table
+    attribute: str  # the one column the rollups carry
+    flag: str       # 1 when the sale has a matching row, for rewriting inner joins
+
+
+DIMENSION_TABLES = {
+    "employees": DimensionTable("employee_id", "department", "has_employee"),
+    "customers": DimensionTable("customer_id", "country", "has_customer"),
+}
+ATTRIBUTE_TABLES = {dim.attribute: name for name, dim in DIMENSION_TABLES.items()}
+DIMENSION_SOURCES = {
+    "product": Sale.__table__.c.product,
+    "employee_id": Sale.__table__.c.employee_id,
+    "department": Employee.__table__.c.department,
+    "country": Customer.__table__.c.country,
+}
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    grain: str  # month or day
+    dimensions: Tuple[str, ...]
+
+    @property
+    def date_column(self) -> str:
+        return "sale_month" if self.grain == "month" else "sale_date"
+
+    @property
+    def flags(self) -> Tuple[str, ...]:
+        return tuple(DIMENSION_TABLES[ATTRIBUTE_TABLES[d]].flag for d in self.dimensions if d in ATTRIBUTE_TABLES)
+
+    @property
+    def dimension_tables(self) -> Tuple[str, ...]:
+        return tuple(ATTRIBUTE_TABLES[d] for d in self.dimensions if d in ATTRIBUTE_TABLES)
+
+    @property
+    def group_columns(self) -> Tuple[str, ...]:
+        return (self.date_column,) + self.dimensions + self.flags
+
+
+# Checked in order; the first rollup that answers a query is used, so coarser ones come first
+ROLLUPS = (
+    Rollup("rollup_sales_month", "month", ("product", "department", "country")),
+    Rollup("rollup_sales_month_employee", "month", ("employee_id", "product")),
+    Rollup("rollup_sales_day", "day", ("product", "department", "country")),
+)
+
+metadata = MetaData()
+
+state_table = Table(
+    "rollup_state", metadata,
+    Column("name", String(100), primary_key=True),
+    Column("watermark", BigInteger, nullable=False),
+    Column("stored_rows", BigInteger, nullable=False),
+    Column("compacted_rows", BigInteger, nullable=False),
+    # Digest of the employee/customer rows the rollup was built from
+    Column("dimensions", String(64)),
+    Column("refreshed_at", DateTime),
+)
+
+# Ids at or below a rollup's watermark that had no sale when it was refreshed
+gap_table = Table(
+    "rollup_gaps", metadata,
+    Column("name", String(100), primary_key=True),
+    Column("low", BigInteger, primary_key=True),
+    Column("high", BigInteger, nullable=False),
+    Column("found_at", DateTime, nullable=False),
+)
+
+
+def _rollup_table(rollup: Rollup) -> Table:
+    columns = [Column(rollup.date_column, Date)]
+    columns += [Column(d, DIMENSION_SOURCES[d].type) for d in rollup.dimensions]
+    columns += [Column(flag, Integer, nullable=False) for flag in rollup.flags]
+    columns += [
+        Column("row_count", BigInteger, nullable=False),
+        Column("amount_sum", Float),
+        Column("amount_count", BigInteger, nullable=False),
+        Column("amount_min", Float),
+        Column("amount_max", Float),
+    ]
+    return Table(rollup.name, metadata, *columns)
+
+
+TABLES = {rollup.name: _rollup_table(rollup) for rollup in ROLLUPS}
+
+
+def create_tables(engine: Engine) -> None:
+    """Create the rollup and bookkeeping tables (an admin step, run once)."""
+    metadata.create_all(engine)
+
+
+def missing_tables(engine: Engine) -> List[str]:
+    """Rollup and bookkeeping tables that do not exist yet."""
+    existing = set(inspect(engine).get_table_names())
+    return [name for name in metadata.tables if name not in existing]
+
+
+class NotRewritable(Exception):
+    """Raised by `plan_rewrite` with the reason a query can't be answered from a rollup."""
+
+
+# ---------------------------------------------------------------------------
+# Query rewriting
+# ---------------------------------------------------------------------------
+
+MONTH_UNITS = {"MONTH", "QUARTER", "YEAR"}
+# TO_CHAR formats (as sqlglot renders them) that only depend on the year and month. Anything else,
+# including week, ISO week and Julian day patterns, needs the day grain
+MONTH_FORMATS = {
+    "%Y", "%y", "%m", "%Y-%m", "%Y%m", "%Y/%m", "%y-%m", "%m/%Y", "%m-%Y", "%m/%y",
+    "Mon", "Month", "Mon %Y", "Month %Y", "%b", "%B", "%b %Y", "%B %Y", "%Y-%b",
+}
+FLIPPED = {exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE}
+
+
+def _date_literal(node: exp.Expression) -> Optional[date]:
+    """The date of a `'YYYY-MM-DD'` or `DATE 'YYYY-MM-DD'` literal."""
+    if isinstance(node, exp.Cast) and node.to.this == exp.DataType.Type.DATE:
+        node = node.this
+    if isinstance(node, exp.Literal) and node.is_string and re.fullmatch(r"\d{4}-\d{2}-\d{2}", node.this):
+        try:
+            return date.fromisoformat(node.this)
+        except ValueError:
+            return None
+    return None
+
+
+def _with_date(node: exp.Expression, value: date) -> exp.Expression:
+    literal = exp.Literal.string(value.isoformat())
+    return exp.cast(literal, exp.DataType.Type.DATE) if isinstance(node, exp.Cast) else literal
+
+
+def _month_end(value: date) -> bool:
+    return (value + timedelta(days=1)).day == 1
+
+
+def _month_bounds(column: exp.Column) -> Optional[List[Tuple[exp.Expression, date]]]:
+    """For a comparison of `column` with dates, the literals to use against the month column.
+
+    Returns None unless the comparison selects whole months: `>=` or `<` a
+    month's first day, `>` or `<=` its last day (compared as that month's
+    first day), or BETWEEN a first and a last day.
+    """
+    parent = column.parent
+    if isinstance(parent, exp.Between) and parent.this is column:
+        low, high = _date_literal(parent.args["low"]), _date_literal(parent.args["high"])
+        if low and high and low.day == 1 and _month_end(high):
+            return [(parent.args["high"], high.replace(day=1))]
+        return None
+    if not isinstance(parent, tuple(FLIPPED)):
+        return None
+    op, other = type(parent), parent.expression
+    if parent.expression is column:
+        op, other = FLIPPED[op], parent.this
+    value = _date_literal(other)
+    if value is None:
+        return None
+    if op in (exp.GTE, exp.LT):
+        return [] if value.day == 1 else None
+    return [(other, value.replace(day=1))] if _month_end(value) else None
+
+
+def _month_compatible(column: exp.Column) -> bool:
+    """Whether this use of the sale date only depends on the year and month."""
+    parent = column.parent
+    if isinstance(parent, (exp.TimestampTrunc, exp.DateTrunc)) and parent.this is column:
+        return parent.text("unit").upper() in MONTH_UNITS
+    if isinstance(parent, exp.Extract) and parent.expression is column:
+        return parent.this.name.upper() in MONTH_UNITS
+    if isinstance(parent, (exp.Year, exp.Month, exp.Quarter)):
+        return True
+    if isinstance(parent, exp.TimeToStr) and parent.this is column:
+        return parent.text("format") in MONTH_FORMATS
+    return _month_bounds(column) is not None
+
+
+def _join_type(join: exp.Join) -> Optional[str]:
+    side, kind = (join.side or "").upper(), (join.kind or "").upper()
+    if join.args.get("method") or join.args.get("using"):
+        return None
+    if not side and kind in ("", "INNER"):
+        return "inner"
+    if side == "LEFT" and kind in ("", "OUTER"):
+        return "left"
+    return None
+
+
+def plan_rewrite(tree: exp.Expression, rollups: Tuple[Rollup, ...] = ROLLUPS) -> Tuple[exp.Expression, Rollup]:
+    """Rewrite a parsed query to read the first of `rollups` that answers it exactly.
+
+    Mutates and returns `tree`, with the rollup used. Raises NotRewritable
+    when no rollup gives the same result.
+    """
+    if not isinstance(tree, exp.Select):
+        raise NotRewritable("not a single SELECT")
+    if tree.args.get("with") or any(s is not tree for s in tree.find_all(exp.Select)) or tree.find(exp.Subquery):
+        raise NotRewritable("uses a subquery or CTE")
+    if tree.find(exp.Window):
+        raise NotRewritable("uses a window function")
+    aggregates = list(tree.find_all(exp.AggFunc))
+    if not aggregates and not tree.args.get("group"):
+        raise NotRewritable("not an aggregate query")
+    for star in tree.find_all(exp.Star):
+        if not isinstance(star.parent, exp.Count):
+            raise NotRewritable("selects *")
+
+    # Tables: sales plus at most one each of employees and customers
+    from_clause = tree.args.get("from_") or tree.args.get("from")
+    joins = tree.args.get("joins") or []
+    entries = [(from_clause.this if from_clause else None, None)] + [(join.this, join) for join in joins]
+    aliases: Dict[str, str] = {}
+    for table, _ in entries:
+        if not isinstance(table, exp.Table) or table.name not in TABLE_COLUMNS or table.args.get("db"):
+            raise NotRewritable(f"reads {table.sql(dialect=DIALECT) if table else 'no table'}")
+        if table.name in aliases.values() or table.alias_or_name in aliases:
+            raise NotRewritable(f"reads {table.name} twice")
+        aliases[table.alias_or_name] = table.name
+    if FACT.name not in aliases.values():
+        raise NotRewritable("does not read sales")
+    fact_alias = next(alias for alias, name in aliases.items() if name == FACT.name)
+    outputs = {projection.alias for projection in tree.expressions if projection.alias}
+
+    def resolve(column: exp.Column) -> Optional[Tuple[str, str]]:
+        """(table, column) of a column reference, or None for an output alias."""
+        if column.is_star:
+            raise NotRewritable("selects *")
+        if column.table:
+            table = aliases.get(column.table)
+            if table is None or column.name not in TABLE_COLUMNS[table]:
+                raise NotRewritable(f"unknown column {column.sql(dialect=DIALECT)}")
+            return table, column.name
+        if column.name in outputs and column.find_ancestor(exp.Order):
+            return None
+        owners = [table for table in aliases.values() if column.name in TABLE_COLUMNS[table]]
+        if len(owners) == 1:
+            return owners[0], column.name
+        if not owners and column.name in outputs:
+            return None
+        raise NotRewritable(f"ambiguous or unknown column {column.name}")
+
+    # Joins: each dimension table is joined to sales on its foreign key
+    dimensions: Dict[str, Dict[str, Any]] = {}
+    for table, join in entries:
+        if table.name == FACT.name:
+            if join is not None and _join_type(join) != "inner":
+                raise NotRewritable("sales is outer-joined")
+            continue
+        dimensions[table.name] = {"alias": table.alias_or_name, "table": table,
+                                  "join": join, "type": "inner" if join is None else _join_type(join)}
+        if dimensions[table.name]["type"] is None:
+            raise NotRewritable(f"unsupported join to {table.name}")
+    conditions = [join.args.get("on") for _, join in entries if join is not None]
+    linked: Set[str] = set()
+    condition_columns: Set[int] = set()
+    for condition in conditions:
+        if not (isinstance(condition, exp.EQ) and isinstance(condition.this, exp.Column)
+                and isinstance(condition.expression, exp.Column)):
+            raise NotRewritable("join condition is not a foreign key equality")
+        sides = {resolve(condition.this), resolve(condition.expression)}
+        table = next((name for name in DIMENSION_TABLES
+                      if sides == {(FACT.name, DIMENSION_TABLES[name].key), (name, DIMENSION_TABLES[name].key)}), None)
+        if table is None or table not in dimensions or table in linked:
+            raise NotRewritable(f"join condition {condition.sql(dialect=DIALECT)} is not a foreign key equality")
+        linked.add(table)
+        condition_columns.update(id(column) for column in condition.find_all(exp.Column))
+        if dimensions[table]["join"] is None:
+            dimensions[table]["condition"] = condition
+    if linked != set(dimensions):
+        raise NotRewritable("a table is joined without a condition")
+
+    # Measures: aggregates of amount (or row counts) become re-aggregations of the partial aggregates
+    measures: List[Tuple[exp.AggFunc, str]] = []
+    for agg in aggregates:
+        if agg.find_ancestor(exp.AggFunc) is not None or isinstance(agg.parent, exp.Filter):
+            raise NotRewritable(f"unsupported aggregate {agg.sql(dialect=DIALECT)}")
+        arg = agg.this
+        target = resolve(arg) if isinstance(arg, exp.Column) else None
+        if isinstance(agg, exp.Count):
+            if isinstance(arg, exp.Star) or target == (FACT.name, "sale_id"):
+                measures.append((agg, "row_count"))
+            elif target == (FACT.name, "amount"):
+                measures.append((agg, "amount_count"))
+            elif not isinstance(arg, exp.Distinct):
+                raise NotRewritable(f"{agg.sql(dialect=DIALECT)} is not computable from a rollup")
+        elif isinstance(agg, (exp.Sum, exp.Avg, exp.Min, exp.Max)) and not isinstance(arg, exp.Distinct):
+            if target == (FACT.name, "amount"):
+                measures.append((agg, agg.key))
+            elif not isinstance(agg, (exp.Min, exp.Max)):
+                raise NotRewritable(f"{agg.sql(dialect=DIALECT)} is not computable from a rollup")
+        else:
+            raise NotRewritable(f"{agg.sql(dialect=DIALECT)} is not computable from a rollup")
+    measure_columns = {id(column) for agg, _ in measures for column in agg.find_all(exp.Column)}
+
+    # Every other column must be a rollup dimension or come from a joined table kept in the query
+    needed: Set[str] = set()
+    date_columns: List[exp.Column] = []
+    fact_columns: List[exp.Column] = []
+    dimension_columns: Dict[str, List[exp.Column]] = {name: [] for name in dimensions}
+    for column in list(tree.find_all(exp.Column)):
+        if id(column) in measure_columns or id(column) in condition_columns:
+            continue
+        resolved = resolve(column)
+        if resolved is None:
+            continue
+        table, name = resolved
+        if table == FACT.name:
+            if name == "sale_date":
+                date_columns.append(column)
+            elif name in DIMENSION_SOURCES and DIMENSION_SOURCES[name].table is FACT:
+                needed.add(name)
+                fact_columns.append(column)
+            else:
+                raise NotRewritable(f"uses sales.{name} outside an aggregate")
+        else:
+            dimension_columns[table].append(column)
+    dropped: Dict[str, DimensionTable] = {}
+    for table, columns in dimension_columns.items():
+        dim = DIMENSION_TABLES[table]
+        if all(column.name == dim.attribute for column in columns):
+            # Only the attribute the rollups carry: the join goes away
+            dropped[table] = dim
+            needed.add(dim.attribute)
+        elif table == "employees":
+            needed.add("employee_id")
+        else:
+            raise NotRewritable(f"uses {table} columns other than {dim.attribute}")
+
+    month = all(_month_compatible(column) for column in date_columns)
+    rollup = next((r for r in rollups if needed <= set(r.dimensions) and (month or r.grain == "day")), None)
+    if rollup is None:
+        raise NotRewritable(f"no rollup groups by {', '.join(sorted(needed)) or 'nothing'} "
+                            f"at {'month' if month else 'day'} grain")
+
+    # Rewrite, keeping the sales alias for the rollup so qualified references stay valid
+    def rollup_column(name: str) -> exp.Column:
+        return exp.column(name, table=fact_alias)
+
+    for agg, measure in measures:
+        if measure in ("row_count", "amount_count"):
+            new = exp.func("COALESCE", exp.func("SUM", rollup_column(measure)), exp.Literal.number(0))
+        elif measure == "sum":
+            new = exp.func("SUM", rollup_column("amount_sum"))
+        elif measure == "avg":
+            new = exp.Paren(this=exp.Div(
+                this=exp.func("SUM", rollup_column("amount_sum")),
+                expression=exp.func("NULLIF", exp.func("SUM", rollup_column("amount_count")), exp.Literal.number(0)),
+            ))
+        else:
+            new = exp.func(measure.upper(), rollup_column(f"amount_{measure}"))
+        if agg.parent is tree:
+            # Keep the output column name PostgreSQL gives the original aggregate
+            new = exp.alias_(new, agg.key)
+        agg.replace(new)
+    for column in date_columns:
+        if rollup.grain == "month":
+            for literal, value in _month_bounds(column) or []:
+                literal.replace(_with_date(literal, value))
+        column.replace(rollup_column(rollup.date_column))
+    for column in fact_columns:
+        column.replace(rollup_column(column.name))
+    for table, columns in dimension_columns.items():
+        for column in columns:
+            if table in dropped:
+                column.replace(rollup_column(column.name))
+            else:
+                column.replace(exp.column(column.name, table=dimensions[table]["alias"]))
+
+    kept = []
+    for table, join in entries[1:] if entries[0][0].name == FACT.name else entries:
+        if table.name == FACT.name or table.name in dropped:
+            continue
+        if join is None:
+            join = exp.Join(this=table.copy(), on=dimensions[table.name]["condition"].copy())
+        kept.append(join)
+    tree.set("from_" if "from_" in tree.args else "from",
+             exp.From(this=exp.to_table(rollup.name).as_(fact_alias)))
+    tree.set("joins", kept or None)
+    for table, dim in dropped.items():
+        if dimensions[table]["type"] == "inner":
+            tree.where(rollup_column(dim.flag).eq(1), copy=False)
+    return tree, rollup
+
+
+@dataclass
+class RollupRewrite:
+    """Outcome of trying to answer one statement from a rollup."""
+    sql: str
+    rollup: Optional[str] = None
+    grain: Optional[str] = None
+    reason: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.rollup is None:
+            return {"applied": False, "reason": self.reason}
+        return {
+            "applied": True,
+            "rollup": self.rollup,
+            "grain": self.grain,
+            "sql": self.sql,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+
+class RollupManager:
+    """Builds, refreshes and compacts the rollup tables, and rewrites queries onto them.
+
+    The tables are created by an admin with `python src/rollups.py
+    --create`; `setup` only builds or catches up rollups at startup and
+    disables rewriting when the tables are missing. All writes happen there
+    and in a background task, which refreshes every `refresh_interval`
+    seconds (0: only on demand) and whenever `rewrite` finds a rollup behind
+    `sales` or its dimension tables. `rewrite` itself only reads: a query is
+    rewritten onto a rollup only if the rollup has caught up, so it never
+    reads stale aggregates, and otherwise runs against `sales` while the
+    refresher catches up.
+
+    Dimension rows are compared with the rollup's digest on every check.
+    When `versions` is kept current by a change monitor, they are only
+    re-read after the employees or customers table was written to. Gaps
+    below the watermark are dropped after `gap_retention` seconds.
+    """
+
+    def __init__(self, engine: Engine, rollups: Tuple[Rollup, ...] = ROLLUPS, enabled: bool = True,
+                 refresh_interval: float = 60.0, gap_retention: float = 3600.0,
+                 versions: Optional[TableVersions] = None) -> None:
+        self.engine = engine
+        self.rollups = rollups
+        self.enabled = enabled
+        self.refresh_interval = refresh_interval
+        self.gap_retention = gap_retention
+        self.versions = versions
+        self.rewrites = 0
+        # Rollups built and usable for rewriting
+        self._ready: Set[str] = set()
+        # Dimension table versions at the last digest match, per rollup
+        self._verified: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def setup(self) -> None:
+        """Build or catch up every rollup; disables rewriting if the tables are missing or on failure."""
+        if not self.enabled:
+            return
+        try:
+            missing = missing_tables(self.engine)
+            if missing:
+                logger.warning(f"Rollup tables missing ({', '.join(missing)}), queries will not be rewritten; "
+                               f"create them with python src/rollups.py --create")
+                self.enabled = False
+                return
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Rollups unavailable, queries will not be rewritten: {str(e)}")
+            self._ready.clear()
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.setup)
+        if self.enabled:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refresh_interval or None)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Rollup refresh failed: {str(e)}")
+
+    def request_refresh(self) -> None:
+        """Wake the background refresher; safe to call from worker threads."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def rewrite(self, sql_query: str) -> RollupRewrite:
+        """Rewrite a statement onto a rollup that is up to date with sales; never writes."""
+        outcome = RollupRewrite(sql=sql_query)
+        tree = parse_sql(sql_query)
+        if tree is None:
+            outcome.reason = "not parseable"
+            return outcome
+        available = tuple(r for r in self.rollups if r.name in self._ready)
+        if not available:
+            outcome.reason = "no rollups built"
+            return outcome
+        try:
+            tree, rollup = plan_rewrite(tree, available)
+        except NotRewritable as e:
+            outcome.reason = str(e)
+            return outcome
+        try:
+            lag = self.lag(rollup)
+        except Exception as e:
+            logger.error(f"Could not check {rollup.name}: {str(e)}")
+            outcome.reason = f"{rollup.name} could not be checked"
+            return outcome
+        if lag is None:
+            self.request_refresh()
+            outcome.reason = f"{rollup.name} needs a rebuild"
+            return outcome
+        if lag > 0:
+            self.request_refresh()
+            outcome.reason = f"{rollup.name} is refreshing"
+            return outcome
+        outcome.sql = tree.sql(dialect=DIALECT)
+        outcome.rollup, outcome.grain = rollup.name, rollup.grain
+        self.rewrites += 1
+        return outcome
+
+    def lag(self, rollup: Rollup) -> Optional[int]:
+        """How many sale ids the rollup is behind: ids past its watermark plus sales committed into its gaps.
+
+        None if it needs a (re)build: it was never built, sales were deleted
+        or the employee/customer rows it was built from changed.
+        """
+        with self.engine.connect() as connection:
+            return self._lag(connection, rollup)
+
+    def refresh(self) -> Dict[str, int]:
+        """Bring every rollup up to date, building missing or stale ones; returns the sales folded into each."""
+        added = {}
+        with self._lock:
+            for rollup in self.rollups:
+                with self.engine.connect() as connection:
+                    lag = self._lag(connection, rollup)
+                    expiring = lag == 0 and self._has_gaps(connection, rollup, self._gap_cutoff())
+                if lag is None:
+                    added[rollup.name] = self._build(rollup)
+                else:
+                    added[rollup.name] = self._append(rollup) if lag > 0 or expiring else 0
+                self._ready.add(rollup.name)
+        return added
+
+    def build(self) -> Dict[str, int]:
+        """Rebuild every rollup from scratch; returns the sales folded into each."""
+        with self._lock:
+            built = {rollup.name: self._build(rollup) for rollup in self.rollups}
+            self._ready.update(built)
+        return built
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self.engine.connect() as connection:
+            high = self._high(connection)
+            states = {row.name: row for row in connection.execute(select(state_table))}
+            gaps = dict(connection.execute(
+                select(gap_table.c.name, func.count()).group_by(gap_table.c.name)
+            ).fetchall())
+            lags = {rollup.name: self._lag(connection, rollup) for rollup in self.rollups}
+        return [{
+            "name": rollup.name,
+            "grain": rollup.grain,
+            "dimensions": list(rollup.dimensions),
+            "rows": states[rollup.name].stored_rows if rollup.name in states else None,
+            "watermark": states[rollup.name].watermark if rollup.name in states else None,
+            "max_sale_id": high,
+            "gaps": gaps.get(rollup.name, 0),
+            "lag": lags[rollup.name],
+            "ready": rollup.name in self._ready,
+        } for rollup in self.rollups]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": sorted(self._ready), "rewrites": self.rewrites}
+
+    # Every write below runs in a transaction that holds the rollup's lock and reads one snapshot,
+    # so concurrent refreshes from several processes never fold the same sales twice, and the
+    # sales folded and the gaps recorded always agree.
+
+    def _build(self, rollup: Rollup) -> int:
+        table = TABLES[rollup.name]
+        with self._locked(rollup) as connection:
+            high = self._high(connection)
+            digest = self._dimension_digest(connection, rollup)
+            connection.execute(delete(table))
+            rows = connection.execute(insert(table).from_select(
+                list(rollup.group_columns) + MEASURES, self._aggregate(rollup, connection, FACT.c.sale_id <= high),
+            )).rowcount
+            now = dt.datetime.now()
+            connection.execute(delete(state_table).where(state_table.c.name == rollup.name))
+            connection.execute(insert(state_table).values(
+                name=rollup.name, watermark=high, stored_rows=rows, compacted_rows=rows, dimensions=digest,
+                refreshed_at=now,
+            ))
+            self._replace_gaps(connection, rollup, [(low, top, now) for low, top in self._missing(connection, 0, high)])
+            sales = connection.execute(select(func.coalesce(func.sum(table.c.row_count), 0))).scalar()
+        self._verified.pop(rollup.name, None)
+        logger.info(f"Built {rollup.name}: {rows} rows from {sales} sales through sale_id {high}")
+        return sales
+
+    def _append(self, rollup: Rollup) -> int:
+        table = TABLES[rollup.name]
+        with self._locked(rollup) as connection:
+            high, watermark = self._positions(connection, rollup)
+            if watermark is None or high < watermark:
+                return 0
+            gaps = connection.execute(
+                select(gap_table.c.low, gap_table.c.high, gap_table.c.found_at)
+                .where(gap_table.c.name == rollup.name).order_by(gap_table.c.low)
+            ).fetchall()
+            pending = and_(FACT.c.sale_id > watermark, FACT.c.sale_id <= high)
+            if gaps:
+                pending = or_(pending, self._in_ranges([(gap.low, gap.high) for gap in gaps]))
+            # A primary key range scan over the new and late sales only
+            sales = connection.execute(select(func.count()).select_from(FACT).where(pending)).scalar()
+
+            # Late sales narrow their gap; gaps past the retention are taken to be rolled-back ids
+            now, cutoff = dt.datetime.now(), self._gap_cutoff()
+            remaining = [(low, top, gap.found_at) for gap in gaps
+                         for low, top in self._missing(connection, gap.low - 1, gap.high)]
+            expired = [gap for gap in remaining if gap[2] < cutoff]
+            remaining = [gap for gap in remaining if gap[2] >= cutoff]
+            remaining += [(low, top, now) for low, top in self._missing(connection, watermark, high)]
+            if expired:
+                logger.info(f"{rollup.name}: dropped {len(expired)} gaps older than {self.gap_retention:.0f}s")
+            if remaining != [tuple(gap) for gap in gaps]:
+                self._replace_gaps(connection, rollup, remaining)
+            if sales == 0 and high == watermark:
+                return 0
+
+            rows = connection.execute(insert(table).from_select(
+                list(rollup.group_columns) + MEASURES, self._aggregate(rollup, connection, pending),
+            )).rowcount
+            state = connection.execute(select(state_table).where(state_table.c.name == rollup.name)).one()
+            connection.execute(update(state_table).where(state_table.c.name == rollup.name).values(
+                watermark=high, stored_rows=state.stored_rows + rows, refreshed_at=now,
+            ))
+            if state.stored_rows + rows > 2 * state.compacted_rows + COMPACT_MIN_ROWS:
+                self._compact(connection, rollup)
+            return sales
+
+    def _compact(self, connection: Connection, rollup: Rollup) -> None:
+        """Merge partial rows of the same group; runs inside the caller's locked transaction."""
+        table = TABLES[rollup.name]
+        groups = [table.c[name] for name in rollup.group_columns]
+        merged = connection.execute(select(
+            *groups,
+            func.sum(table.c.row_count), func.sum(table.c.amount_sum), func.sum(table.c.amount_count),
+            func.min(table.c.amount_min), func.max(table.c.amount_max),
+        ).group_by(*groups)).fetchall()
+        names = list(rollup.group_columns) + MEASURES
+        connection.execute(delete(table))
+        if merged:
+            connection.execute(insert(table), [dict(zip(names, row)) for row in merged])
+        connection.execute(update(state_table).where(state_table.c.name == rollup.name).values(
+            stored_rows=len(merged), compacted_rows=len(merged),
+        ))
+        logger.info(f"Compacted {rollup.name} to {len(merged)} rows")
+
+    @staticmethod
+    def _aggregate(rollup: Rollup, connection: Connection, condition):
+        """Partial aggregates of the sales matching `condition`."""
+        sale, employee, customer = Sale.__table__, Employee.__table__, Customer.__table__
+        if rollup.grain == "day":
+            period = sale.c.sale_date
+        elif connection.dialect.name == "sqlite":
+            period = func.date(sale.c.sale_date, "start of month")
+        else:
+            period = cast(func.date_trunc("month", sale.c.sale_date), Date)
+        groups = [period.label(rollup.date_column)]
+        groups += [DIMENSION_SOURCES[d].label(d) for d in rollup.dimensions]
+        source = sale
+        if "department" in rollup.dimensions:
+            source = source.outerjoin(employee, sale.c.employee_id == employee.c.employee_id)
+            groups.append(case((employee.c.employee_id.is_not(None), 1), else_=0).label("has_employee"))
+        if "country" in rollup.dimensions:
+            source = source.outerjoin(customer, sale.c.customer_id == customer.c.customer_id)
+            groups.append(case((customer.c.customer_id.is_not(None), 1), else_=0).label("has_customer"))
+        return select(
+            *groups,
+            func.count().label("row_count"),
+            func.sum(sale.c.amount).label("amount_sum"),
+            func.count(sale.c.amount).label("amount_count"),
+            func.min(sale.c.amount).label("amount_min"),
+            func.max(sale.c.amount).label("amount_max"),
+        ).select_from(source).where(condition).group_by(*groups)
+
+    def _lag(self, connection: Connection, rollup: Rollup) -> Optional[int]:
+        high, watermark = self._positions(connection, rollup)
+        if watermark is None or high < watermark or not self._dimensions_current(connection, rollup):
+            return None
+        gaps = connection.execute(
+            select(gap_table.c.low, gap_table.c.high).where(gap_table.c.name == rollup.name)
+        ).fetchall()
+        late = connection.execute(select(func.count()).select_from(FACT).where(self._in_ranges(gaps))).scalar() \
+            if gaps else 0
+        return high - watermark + late
+
+    def _dimensions_current(self, connection: Connection, rollup: Rollup) -> bool:
+        """Whether the employee/customer rows still match the ones the rollup was built from."""
+        tables = rollup.dimension_tables
+        if not tables:
+            return True
+        snapshot = None
+        if self.versions is not None:
+            # Taken before reading, so a write during the comparison is seen by the next check
+            snapshot = self.versions.snapshot(set(tables) | {"*"})
+            if self._verified.get(rollup.name) == snapshot:
+                return True
+        stored = connection.execute(
+            select(state_table.c.dimensions).where(state_table.c.name == rollup.name)
+        ).scalar()
+        current = stored == self._dimension_digest(connection, rollup)
+        if current and snapshot is not None:
+            self._verified[rollup.name] = snapshot
+        return current
+
+    @staticmethod
+    def _dimension_digest(connection: Connection, rollup: Rollup) -> Optional[str]:
+        """Digest of the key and attribute of every row of the rollup's dimension tables."""
+        if not rollup.dimension_tables:
+            return None
+        digest = hashlib.sha256()
+        for name in rollup.dimension_tables:
+            dim = DIMENSION_TABLES[name]
+            attribute = DIMENSION_SOURCES[dim.attribute]
+            key = attribute.table.c[dim.key]
+            digest.update(name.encode())
+            for row in connection.execute(select(key, attribute).order_by(key)):
+                digest.update(repr(tuple(row)).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _missing(connection: Connection, low: int, high: int) -> List[Tuple[int, int]]:
+        """Ranges of ids in `low < sale_id <= high` without a sale: inserts not committed yet, or rolled back."""
+        if high <= low:
+            return []
+        in_range = and_(FACT.c.sale_id > low, FACT.c.sale_id <= high)
+        ids = select(
+            FACT.c.sale_id, func.lag(FACT.c.sale_id, 1, low).over(order_by=FACT.c.sale_id).label("previous"),
+        ).where(in_range).subquery()
+        ranges = [(row.previous + 1, row.sale_id - 1) for row in connection.execute(
+            select(ids.c.sale_id, ids.c.previous).where(ids.c.sale_id > ids.c.previous + 1).order_by(ids.c.sale_id)
+        )]
+        last = connection.execute(select(func.coalesce(func.max(FACT.c.sale_id), low)).where(in_range)).scalar()
+        if last < high:
+            ranges.append((last + 1, high))
+        return ranges
+
+    @staticmethod
+    def _in_ranges(ranges) -> Any:
+        return or_(*[FACT.c.sale_id.between(low, high) for low, high in ranges])
+
+    @staticmethod
+    def _replace_gaps(connection: Connection, rollup: Rollup, gaps: List[Tuple[int, int, dt.datetime]]) -> None:
+        connection.execute(delete(gap_table).where(gap_table.c.name == rollup.name))
+        if gaps:
+            connection.execute(insert(gap_table), [
+                {"name": rollup.name, "low": low, "high": high, "found_at": found_at} for low, high, found_at in gaps
+            ])
+
+    @staticmethod
+    def _has_gaps(connection: Connection, rollup: Rollup, before: dt.datetime) -> bool:
+        return connection.execute(select(gap_table.c.low).where(
+            and_(gap_table.c.name == rollup.name, gap_table.c.found_at < before)
+        ).limit(1)).first() is not None
+
+    def _gap_cutoff(self) -> dt.datetime:
+        return dt.datetime.now() - dt.timedelta(seconds=self.gap_retention)
+
+    @staticmethod
+    def _high(connection: Connection) -> int:
+        return connection.execute(select(func.coalesce(func.max(FACT.c.sale_id), 0))).scalar()
+
+    def _positions(self, connection: Connection, rollup: Rollup) -> Tuple[int, Optional[int]]:
+        """Highest sale_id in sales and the rollup's watermark (None if never built)."""
+        watermark = connection.execute(
+            select(state_table.c.watermark).where(state_table.c.name == rollup.name)
+        ).scalar()
+        return self._high(connection), watermark
+
+    @contextmanager
+    def _locked(self, rollup: Rollup) -> Iterator[Connection]:
+        """A transaction holding the rollup's lock whose reads all see one snapshot, taken after the lock."""
+        with self.engine.connect() as connection:
+            if connection.dialect.name != "postgresql":
+                with connection.begin():
+                    # SQLite: any write takes the database's write lock until commit
+                    connection.execute(update(state_table).where(state_table.c.name == rollup.name)
+                                       .values(name=rollup.name))
+                    yield connection
+                return
+            # A session lock taken before the transaction starts, so its snapshot includes every
+            # refresh that committed while this one waited
+            lock = {"name": rollup.name}
+            connection.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), lock)
+            connection.commit()
+            try:
+                with connection.execution_options(isolation_level="REPEATABLE READ").begin():
+                    yield connection
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), lock)
+                connection.commit()
+
+
+def main() -> None:
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Build, refresh and inspect aggregate rollups over sales")
+    parser.add_argument("--create", action="store_true",
+                        help="Create the rollup tables; the application only fills existing ones")
+    parser.add_argument("--build", action="store_true", help="Rebuild every rollup from scratch")
+    parser.add_argument("--refresh", action="store_true", help="Fold in sales added since the last refresh")
+    parser.add_argument("--status", action="store_true", help="Show each rollup's size, watermark and lag")
+    parser.add_argument("--explain", metavar="SQL", help="Show how a query would be rewritten")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.create:
+        create_tables(engine)
+        logger.info(f"Created rollup tables: {', '.join(metadata.tables)}")
+    show_status = args.status or not (args.create or args.build or args.refresh or args.explain)
+    if args.build or args.refresh or show_status:
+        missing = missing_tables(engine)
+        if missing:
+            parser.exit(1, f"Rollup tables missing: {', '.join(missing)}; create them with --create\n")
+
+    manager = RollupManager(engine)
+    if args.build:
+        print(json.dumps(manager.build(), indent=2))
+    if args.refresh:
+        print(json.dumps(manager.refresh(), indent=2))
+    if args.explain:
+        tree = parse_sql(args.explain)
+        try:
+            if tree is None:
+                raise NotRewritable("not parseable")
+            tree, rollup = plan_rewrite(tree)
+            print(f"-- {rollup.name} ({rollup.grain})\n{tree.sql(dialect=DIALECT, pretty=True)}")
+        except NotRewritable as e:
+            print(f"Not rewritten: {e}")
+    if show_status:
+        print(json.dumps(manager.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# One catalog round trip that returns a signature per table covering columns,
+# constraints and indexes. Used on PostgreSQL to detect schema changes cheaply.
+POSTGRES_SIGNATURE_SQL = """
+SELECT c.relname AS table_name,
+       md5(
+           coalesce((SELECT string_agg(a.attname || ':' || format_type(a.atttypid, a.atttypmod) || ':' || a.attnotnull::text,
+                                       ',' ORDER BY a.attnum)
+                     FROM pg_attribute a
+                     WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped), '')
+           || '|' ||
+           coalesce((SELECT string_agg(pg_get_constraintdef(k.oid), ',' ORDER BY k.conname)
+                     FROM pg_constraint k
+                     WHERE k.conrelid = c.oid), '')
+           || '|' ||
+           coalesce((SELECT string_agg(pg_get_indexdef(i.indexrelid), ',' ORDER BY i.indexrelid)
+                     FROM pg_index i
+                     WHERE i.indrelid = c.oid), '')
+       ) AS signature
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()
+"""
+
+
+@dataclass(frozen=True)
+class ColumnInfo:
+    name: str
+    type: str
+    nullable: bool
+    primary_key: bool
+
+
+@dataclass(frozen=True)
+class ForeignKeyInfo:
+    columns: Tuple[str, ...]
+    referred_table: str
+    referred_columns: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class IndexInfo:
+    name: str
+    columns: Tuple[str, ...]
+    unique: bool
+
+
+@dataclass(frozen=True)
+class TableInfo:
+    name: str
+    columns: Tuple[ColumnInfo, ...]
+    primary_key: Tuple[str, ...]
+    foreign_keys: Tuple[ForeignKeyInfo, ...]
+    indexes: Tuple[IndexInfo, ...]
+
+    @property
+    def column_names(self) -> List[str]:
+        return [col.name for col in self.columns]
+
+    def column(self, name: str) -> Optional[ColumnInfo]:
+        for col in self.columns:
+            if col.name == name:
+                return col
+        return None
+
+    def describe(self) -> str:
+        """Render the table in the format the agents' prompts expect."""
+        col_info = [f"{col.name} ({col.type})" for col in self.columns]
+        return f"Table: {self.name}\nColumns: {', '.join(col_info)}"
+
+    def content_hash(self) -> str:
+        """Hash of the reflected structure, used when the dialect has no cheaper signature."""
+        return hashlib.md5(repr(self).encode("utf-8")).hexdigest()
+
+
+class SchemaCatalog:
+    """In-process cache of the database schema.
+
+    The catalog is built once and then kept current by comparing per-table
+    signatures. Only tables whose signature changed are re-inspected.
+    Tables whose names start with one of `exclude_prefixes` (the
+    application's own derived tables) are left out.
+    """
+
+    def __init__(self, engine: Engine, refresh_interval: float = 60.0,
+                 exclude_prefixes: Tuple[str, ...] = ()) -> None:
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.exclude_prefixes = exclude_prefixes
+        self.version = 0
+        self._tables: Dict[str, TableInfo] = {}
+        self._signatures: Dict[str, str] = {}
+        self._fingerprint = ""
+        self._last_checked = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def fingerprint(self) -> str:
+        return self._fingerprint
+
+    @property
+    def tables(self) -> Dict[str, TableInfo]:
+        return dict(self._tables)
+
+    def table_names(self) -> List[str]:
+        return sorted(self._tables)
+
+    def table(self, name: str) -> Optional[TableInfo]:
+        return self._tables.get(name)
+
+    def load(self) -> None:
+        """Inspect every table and build the catalog from scratch."""
+        with self._lock:
+            inspector = inspect(self.engine)
+            tables = {name: self._inspect_table(inspector, name) for name in self._table_names(inspector)}
+            self._tables = tables
+            self._signatures = self._fetch_signatures(tables)
+            self._update_fingerprint()
+            self._last_checked = time.monotonic()
+            logger.info(f"Schema catalog loaded: {len(tables)} tables, fingerprint {self._fingerprint}")
+
+    def ensure_fresh(self) -> List[str]:
+        """Refresh the catalog if the refresh interval has elapsed."""
+        if time.monotonic() - self._last_checked < self.refresh_interval:
+            return []
+        return self.refresh()
+
+    def refresh(self) -> List[str]:
+        """Re-inspect only the tables whose signature changed.
+
+        Returns the names of added, changed or removed tables.
+        """
+        with self._lock:
+            if not self._tables:
+                self.load()
+                return self.table_names()
+
+            signatures = self._fetch_signatures()
+            self._last_checked = time.monotonic()
+            changed = [name for name, sig in signatures.items() if self._signatures.get(name) != sig]
+            removed = [name for name in self._signatures if name not in signatures]
+            if not changed and not removed:
+                return []
+
+            tables = dict(self._tables)
+            for name in removed:
+                tables.pop(name, None)
+            if changed:
+                inspector = inspect(self.engine)
+                for name in changed:
+                    tables[name] = self._inspect_table(inspector, name)
+
+            self._tables = tables
+            self._signatures = signatures
+            self._update_fingerprint()
+            logger.info(f"Schema catalog refreshed tables {sorted(changed + removed)}, fingerprint {self._fingerprint}")
+            return sorted(changed + removed)
+
+    def describe(self, table_names: Optional[List[str]] = None) -> str:
+        """Get schema information for the given tables (all tables by default)."""
+        names = table_names if table_names is not None else self.table_names()
+        return "\n\n".join(self._tables[name].describe() for name in names if name in self._tables)
+
+    def _update_fingerprint(self) -> None:
+        digest = hashlib.sha1()
+        for name in sorted(self._signatures):
+            digest.update(f"{name}:{self._signatures[name]};".encode("utf-8"))
+        self._fingerprint = digest.hexdigest()[:16]
+        self.version += 1
+
+    def _fetch_signatures(self, tables: Optional[Dict[str, TableInfo]] = None) -> Dict[str, str]:
+        """Get a signature per table, using a single catalog query where the dialect allows it."""
+        if self.engine.dialect.name == "postgresql":
+            with self.engine.connect() as connection:
+                rows = connection.execute(text(POSTGRES_SIGNATURE_SQL)).fetchall()
+            return {row[0]: row[1] for row in rows if not row[0].startswith(self.exclude_prefixes)}
+
+        # Other dialects: fall back to hashing the reflected structure
+        if tables is None:
+            inspector = inspect(self.engine)
+            tables = {name: self._inspect_table(inspector, name) for name in self._table_names(inspector)}
+        return {name: table.content_hash() for name, table in tables.items()}
+
+    def _table_names(self, inspector) -> List[str]:
+        return [name for name in inspector.get_table_names() if not name.startswith(self.exclude_prefixes)]
+
+    @staticmethod
+    def _inspect_table(inspector, table_name: str) -> TableInfo:
+        pk = tuple(inspector.get_pk_constraint(table_name).get("constrained_columns") or ())
+        columns = tuple(
+            ColumnInfo(
+                name=col["name"],
+                type=str(col["type"]),
+                nullable=bool(col.get("nullable", True)),
+                primary_key=col["name"] in pk,
+            )
+            for col in inspector.get_columns(table_name)
+        )
+        foreign_keys = tuple(
+            ForeignKeyInfo(
+                columns=tuple(fk["constrained_columns"]),
+                referred_table=fk["referred_table"],
+                referred_columns=tuple(fk["referred_columns"]),
+            )
+            for fk in inspector.get_foreign_keys(table_name)
+        )
+        indexes = tuple(
+            IndexInfo(
+                name=idx["name"],
+                columns=tuple(c for c in idx["column_names"] if c),
+                unique=bool(idx.get("unique")),
+            )
+            for idx in inspector.get_indexes(table_name)
+        )
+        return TableInfo(
+            name=table_name,
+            columns=columns,
+            primary_key=pk,
+            foreign_keys=foreign_keys,
+            indexes=indexes,
+        )
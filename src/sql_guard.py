@@ -0,0 +1,200 @@
+from typing import Dict, Any, Optional, Tuple
+from dataclasses import dataclass, asdict
+from sqlalchemy import text
+from sqlglot import exp
+from sql_utils import DIALECT, parse_sql
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Statements that must never appear anywhere in generated SQL, including inside CTEs
+WRITE_EXPRESSIONS = tuple(
+    getattr(exp, name) for name in ("Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "Command")
+    if hasattr(exp, name)
+)
+
+# Functions with side effects or access outside the database's tables
+DENIED_FUNCTIONS = {
+    "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf", "pg_ls_dir", "pg_ls_logdir",
+    "pg_ls_waldir", "pg_ls_tmpdir", "pg_ls_archive_statusdir", "pg_promote", "pg_switch_wal",
+    "pg_create_restore_point", "pg_notify", "pg_logical_emit_message", "set_config", "nextval",
+    "setval", "query_to_xml", "query_to_xml_and_xmlschema", "query_to_xmlschema", "cursor_to_xml",
+}
+
+# Whole function families: advisory locks, large objects, dblink and sleeps
+DENIED_FUNCTION_PREFIXES = ("pg_advisory", "pg_try_advisory", "lo_", "dblink", "pg_sleep")
+
+
+def is_denied_function(name: str) -> bool:
+    """True for functions generated SQL may not call (server file access included)."""
+    name = name.lower().split(".")[-1]
+    if name in DENIED_FUNCTIONS or name.startswith(DENIED_FUNCTION_PREFIXES):
+        return True
+    return name.startswith("pg_") and "file" in name
+
+
+@dataclass
+class GuardDecision:
+    """What the guard did to one generated statement.
+
+    `action` is `allowed`, `limited` (LIMIT injected or clamped),
+    `downgraded` (LIMIT lowered because the plan was too expensive) or
+    `rejected`. `limit` is the row cap the retriever enforces; the SQL
+    itself asks for one row more so truncation can be detected.
+    """
+    original_sql: str
+    sql: str
+    action: str = "allowed"
+    reason: Optional[str] = None
+    limit: Optional[int] = None
+    estimated_cost: Optional[float] = None
+    estimated_rows: Optional[float] = None
+    peak_rows: Optional[float] = None
+    plan: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("original_sql")
+        if self.sql == self.original_sql:
+            data.pop("sql")
+        return data
+
+
+class SQLRejected(Exception):
+    """Raised when generated SQL is refused before or after planning."""
+
+    def __init__(self, decision: GuardDecision) -> None:
+        super().__init__(decision.reason)
+        self.decision = decision
+
+
+def plan_peak_rows(plan: Dict[str, Any]) -> float:
+    """Largest row estimate of any node in an EXPLAIN (FORMAT JSON) plan."""
+    return max([plan.get("Plan Rows", 0)] + [plan_peak_rows(child) for child in plan.get("Plans", [])])
+
+
+def plan_output_rows(plan: Dict[str, Any]) -> float:
+    """Estimated rows the statement would return without the guard's LIMIT."""
+    if plan.get("Node Type") == "Limit" and plan.get("Plans"):
+        return plan["Plans"][0].get("Plan Rows", 0)
+    return plan.get("Plan Rows", 0)
+
+
+class SQLGuard:
+    """Pre-execution checks for generated SQL.
+
+    `prepare` parses the statement, rejects anything that is not a single
+    read-only query and injects or clamps a LIMIT. `review` runs inside the
+    execution transaction: it makes the transaction read-only with a
+    statement timeout and, on PostgreSQL, uses EXPLAIN estimates to lower
+    the LIMIT or refuse the query.
+    """
+
+    def __init__(self, max_rows: int = 1000, statement_timeout_ms: int = 15000, max_cost: float = 1e6,
+                 max_plan_rows: float = 1e7, downgrade_rows: int = 100) -> None:
+        self.max_rows = max_rows
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_cost = max_cost
+        self.max_plan_rows = max_plan_rows
+        self.downgrade_rows = downgrade_rows
+
+    def prepare(self, sql_query: str) -> GuardDecision:
+        decision = GuardDecision(original_sql=sql_query, sql=sql_query)
+        tree = parse_sql(sql_query)
+        if tree is None:
+            self._reject(decision, "Generated SQL is not a single parseable statement")
+        if not isinstance(tree, exp.Query):
+            self._reject(decision, f"Only SELECT queries are allowed, got {tree.key.upper()}")
+        if tree.find(*WRITE_EXPRESSIONS) is not None:
+            self._reject(decision, "Query contains a data-modifying statement")
+        if tree.find(exp.Into) is not None:
+            self._reject(decision, "SELECT INTO is not allowed")
+        if tree.find(exp.Lock) is not None:
+            self._reject(decision, "Row locking clauses are not allowed")
+        for func in tree.find_all(exp.Func):
+            name = func.name if isinstance(func, exp.Anonymous) else func.sql_name()
+            if is_denied_function(name):
+                self._reject(decision, f"Function {name}() is not allowed")
+
+        if self.max_rows > 0:
+            limited, decision.limit = self._limit(tree, self.max_rows)
+            if limited is not None:
+                decision.sql = limited
+                decision.action = "limited"
+        return decision
+
+    async def review(self, db: Any, decision: GuardDecision, sql: Optional[str] = None) -> str:
+        """Restrict the open transaction and check the plan; may lower the LIMIT or raise SQLRejected.
+
+        `sql` is an equivalent statement to run instead of `decision.sql`
+        (a rollup rewrite); it is the one planned, and a lowered LIMIT is
+        applied to it without touching `decision.sql`. Returns the SQL to run.
+        """
+        sql = sql or decision.sql
+        if db.bind.dialect.name != "postgresql":
+            return sql
+        # Must run before any other statement in the transaction
+        await db.execute(text("SET TRANSACTION READ ONLY"))
+        if self.statement_timeout_ms > 0:
+            await db.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}"))
+        if self.max_cost <= 0 and self.max_plan_rows <= 0:
+            return sql
+
+        await self._explain(db, decision, sql)
+        if self.max_plan_rows > 0 and decision.peak_rows > self.max_plan_rows:
+            self._reject(decision, f"Query plan estimates {decision.peak_rows:,.0f} intermediate rows "
+                                   f"(limit {self.max_plan_rows:,.0f})")
+        if self.max_cost > 0 and decision.estimated_cost > self.max_cost:
+            downgraded, limit = self._limit(parse_sql(sql), self.downgrade_rows)
+            if downgraded is not None:
+                if sql == decision.sql:
+                    decision.sql = downgraded
+                sql = downgraded
+                decision.limit = limit
+                await self._explain(db, decision, sql)
+                if decision.estimated_cost <= self.max_cost:
+                    decision.action = "downgraded"
+                    decision.reason = (f"Plan cost above {self.max_cost:,.0f}; "
+                                       f"result limited to {self.downgrade_rows} rows")
+                    logger.info(decision.reason)
+                    return sql
+            self._reject(decision, f"Query plan cost {decision.estimated_cost:,.0f} exceeds {self.max_cost:,.0f}")
+        return sql
+
+    async def _explain(self, db: Any, decision: GuardDecision, sql: str) -> None:
+        result = await db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        raw = result.scalar()
+        # psycopg/asyncpg may return the JSON already decoded
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+        decision.plan = plan
+        decision.estimated_cost = plan.get("Total Cost", 0.0)
+        decision.estimated_rows = plan_output_rows(plan)
+        decision.peak_rows = plan_peak_rows(plan)
+
+    @staticmethod
+    def _limit(tree: exp.Expression, max_rows: int) -> Tuple[Optional[str], int]:
+        """SQL bounded to `max_rows` (None if already within it) and the resulting row cap.
+
+        Rewritten SQL fetches one row past the cap so the retriever can tell
+        the result was cut off.
+        """
+        limit = tree.args.get("limit")
+        if limit is None:
+            return tree.limit(max_rows + 1).sql(dialect=DIALECT), max_rows
+        if isinstance(limit, exp.Limit) and isinstance(limit.expression, exp.Literal) and limit.expression.is_int:
+            if int(limit.expression.name) <= max_rows:
+                return None, int(limit.expression.name)
+            tree = tree.copy()
+            tree.args["limit"].set("expression", exp.Literal.number(max_rows + 1))
+            return tree.sql(dialect=DIALECT), max_rows
+        # FETCH FIRST, LIMIT ALL or a computed limit: bound the whole query instead
+        wrapped = exp.select("*").from_(tree.subquery("guarded_query")).limit(max_rows + 1)
+        return wrapped.sql(dialect=DIALECT), max_rows
+
+    @staticmethod
+    def _reject(decision: GuardDecision, reason: str) -> None:
+        decision.action = "rejected"
+        decision.reason = reason
+        logger.info(f"Rejected generated SQL: {reason}")
+        raise SQLRejected(decision)
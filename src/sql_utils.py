@@ -0,0 +1,36 @@
+from typing import Optional, Set
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+# Generated SQL targets PostgreSQL
+DIALECT = "postgres"
+
+
+def parse_sql(sql: str) -> Optional[exp.Expression]:
+    """Parse a single SQL statement, returning None when it can't be parsed."""
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=DIALECT) if s is not None]
+    except SqlglotError:
+        return None
+    if len(statements) != 1:
+        return None
+    # Unquoted identifiers are case-insensitive in PostgreSQL; fold them like the server does
+    return normalize_identifiers(statements[0], dialect=DIALECT)
+
+
+def canonical_sql(tree: exp.Expression) -> str:
+    """Render a parsed statement in canonical form so formatting, case and comments don't matter."""
+    return tree.sql(dialect=DIALECT, normalize=True, comments=False)
+
+
+def canonicalize_sql(sql: str) -> Optional[str]:
+    tree = parse_sql(sql)
+    return canonical_sql(tree) if tree is not None else None
+
+
+def referenced_tables(tree: exp.Expression) -> Set[str]:
+    """Names of the base tables a statement reads, excluding CTE names."""
+    ctes = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    return {table.name for table in tree.find_all(exp.Table) if table.name and table.name not in ctes}
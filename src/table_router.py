@@ -0,0 +1,241 @@
+from typing import List, Dict, Any, Optional, Set, Tuple
+from collections import Counter, deque
+from dataclasses import dataclass, field, asdict
+from schema_catalog import SchemaCatalog
+import math
+import re
+
+# Synonyms for the tables and columns in model.py, so questions phrased in
+# business terms still hit the right tables
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    "customers": ["client", "buyer", "purchaser", "account", "signup"],
+    "employees": ["staff", "worker", "salesperson", "rep", "headcount", "people", "team", "hired"],
+    "projects": ["initiative", "program", "deadline"],
+    "project_assignments": ["assigned", "assignment", "allocated", "member", "work", "worked", "working"],
+    "sales": ["revenue", "order", "purchase", "transaction", "sold", "sell", "selling", "bought", "deal"],
+    "amount": ["revenue", "value", "spent", "spend"],
+    "salary": ["pay", "paid", "wage", "compensation", "earn", "earning"],
+    "country": ["nation", "location", "where"],
+    "join_date": ["joined", "signup", "sign", "registered"],
+    "hire_date": ["hired", "tenure"],
+    "budget": ["cost", "funding", "allocation"],
+    "status": ["completed", "active", "planning", "progress", "hold"],
+    "department": ["dept", "division"],
+    "role": ["manager", "developer", "designer", "analyst", "tester"],
+    "product": ["service", "item"],
+}
+
+# Words that carry no table signal in analytics questions
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "by", "for", "to", "from", "with", "and", "or", "is", "are",
+    "was", "were", "be", "been", "do", "does", "did", "have", "has", "had", "we", "our", "us", "me", "my",
+    "i", "you", "it", "its", "that", "this", "these", "those", "there", "their", "what", "which", "who",
+    "whom", "how", "many", "much", "when", "each", "every", "all", "any", "per", "than", "more", "less",
+    "most", "least", "over", "under", "between", "during", "about", "into", "as", "not", "no", "yes",
+    "show", "list", "give", "find", "get", "tell", "display", "return", "please", "can", "could", "would",
+    "top", "bottom", "highest", "lowest", "largest", "smallest", "biggest", "best", "worst", "average",
+    "avg", "total", "sum", "count", "number", "mean", "max", "min", "maximum", "minimum", "distribution",
+    "trend", "grouped", "group", "order", "ordered", "sorted", "rank", "ranked", "compare", "along",
+    "day", "week", "month", "year", "quarter", "daily", "weekly", "monthly", "yearly", "annual", "last",
+    "next", "this", "current", "recent", "ago", "since", "until", "before", "after", "today", "yesterday",
+    "new", "still", "only", "also", "them", "they", "both", "detail", "details", "information", "info",
+    "up", "out",
+}
+# "order" is both a synonym for sales and a sorting word; treat it as a synonym
+STOPWORDS.discard("order")
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split identifiers and words, and apply light stemming."""
+    words = re.split(r"[^a-z0-9]+", text.lower().replace("_", " "))
+    return [_stem(word) for word in words if word and not word.isdigit()]
+
+
+def value_terms(text: str) -> Set[str]:
+    """Terms that look like literal values: quoted text and capitalized words not starting a sentence.
+
+    Values such as "Germany" or 'Widget Pro' name rows, not tables, so the
+    index is not expected to know them.
+    """
+    terms: Set[str] = set()
+    for quoted in re.findall(r"'([^']*)'|\"([^\"]*)\"", text):
+        terms.update(tokenize(" ".join(quoted)))
+    for match in re.finditer(r"\b[A-Z][\w-]*", text):
+        before = text[:match.start()].rstrip()
+        if before and before[-1] not in ".?!:":
+            terms.update(tokenize(match.group()))
+    return terms
+
+
+@dataclass
+class RoutingDecision:
+    tables: List[str]
+    method: str
+    confidence: float
+    scores: Dict[str, float] = field(default_factory=dict)
+    matched_terms: Dict[str, List[str]] = field(default_factory=dict)
+    join_tables: List[str] = field(default_factory=list)
+    fallback_reason: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TableRouter:
+    """BM25 index over table names, column names and synonyms.
+
+    Tables are scored against the question locally; the selection is then
+    expanded along the foreign-key graph so bridging join tables come along.
+    """
+
+    def __init__(self, catalog: SchemaCatalog, synonyms: Optional[Dict[str, List[str]]] = None,
+                 k1: float = 1.5, b: float = 0.75, relative_cutoff: float = 0.25) -> None:
+        self.catalog = catalog
+        self.synonyms = DEFAULT_SYNONYMS if synonyms is None else synonyms
+        self.k1 = k1
+        self.b = b
+        self.relative_cutoff = relative_cutoff
+        self._version = -1
+        self._docs: Dict[str, Counter] = {}
+        self._idf: Dict[str, float] = {}
+        self._avg_len = 0.0
+        self._graph: Dict[str, Set[str]] = {}
+
+    def _ensure_index(self) -> None:
+        if self._version == self.catalog.version:
+            return
+        docs: Dict[str, Counter] = {}
+        graph: Dict[str, Set[str]] = {}
+        for name, table in self.catalog.tables.items():
+            terms: Counter = Counter()
+            # Table name terms count more than column terms
+            for term in tokenize(name) + tokenize(" ".join(self.synonyms.get(name, []))):
+                terms[term] += 3
+            # Key columns mirror other tables' names; the FK expansion covers them instead
+            key_columns = set(table.primary_key)
+            for fk in table.foreign_keys:
+                key_columns.update(fk.columns)
+            for column in table.column_names:
+                if column in key_columns:
+                    continue
+                for term in tokenize(column) + tokenize(" ".join(self.synonyms.get(column, []))):
+                    terms[term] += 1
+            docs[name] = terms
+
+            graph.setdefault(name, set())
+            for fk in table.foreign_keys:
+                graph[name].add(fk.referred_table)
+                graph.setdefault(fk.referred_table, set()).add(name)
+
+        n_docs = len(docs)
+        df: Counter = Counter()
+        for terms in docs.values():
+            df.update(terms.keys())
+        self._idf = {term: math.log(1 + (n_docs - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+        self._avg_len = sum(sum(t.values()) for t in docs.values()) / n_docs if n_docs else 0.0
+        self._docs = docs
+        self._graph = graph
+        self._version = self.catalog.version
+
+    def score(self, query: str) -> Dict[str, float]:
+        """BM25 score of every table for the query."""
+        self._ensure_index()
+        query_terms = [t for t in tokenize(query) if t not in STOPWORDS]
+        scores = {}
+        for name, terms in self._docs.items():
+            doc_len = sum(terms.values())
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term, 0)
+                if tf:
+                    norm = tf + self.k1 * (1 - self.b + self.b * doc_len / self._avg_len)
+                    score += self._idf[term] * tf * (self.k1 + 1) / norm
+            scores[name] = round(score, 4)
+        return scores
+
+    def route(self, query: str) -> RoutingDecision:
+        """Pick tables for the query without calling the LLM."""
+        self._ensure_index()
+        query_terms = [t for t in tokenize(query) if t not in STOPWORDS]
+        scores = self.score(query)
+        top = max(scores.values(), default=0.0)
+        selected = [name for name, score in sorted(scores.items(), key=lambda kv: -kv[1])
+                    if score > 0 and score >= top * self.relative_cutoff]
+
+        matched = {name: sorted({t for t in query_terms if t in self._docs[name]}) for name in selected}
+        vocabulary = set(self._idf)
+        known_terms = [t for t in query_terms if t in vocabulary]
+        # Confidence is the share of informative question terms the index could place;
+        # unknown literal values ("Germany", 'Widget Pro') are left out of the count
+        values = value_terms(query)
+        informative = [t for t in query_terms if t in vocabulary or t not in values]
+        confidence = len(known_terms) / len(informative) if informative and selected else 0.0
+
+        tables, join_tables = self.expand(selected)
+        return RoutingDecision(
+            tables=tables,
+            method="local",
+            confidence=round(confidence, 3),
+            scores=scores,
+            matched_terms=matched,
+            join_tables=join_tables,
+        )
+
+    def expand(self, tables: List[str]) -> Tuple[List[str], List[str]]:
+        """Add the tables on the shortest foreign-key paths connecting the selection."""
+        self._ensure_index()
+        tables = [t for t in tables if t in self._graph]
+        if len(tables) < 2:
+            return tables, []
+        connected = [tables[0]]
+        join_tables: List[str] = []
+        for target in tables[1:]:
+            if target in connected:
+                continue
+            path = self._shortest_path(set(connected), target)
+            for name in path:
+                if name not in connected:
+                    connected.append(name)
+                    if name not in tables:
+                        join_tables.append(name)
+            if target not in connected:
+                connected.append(target)
+        return connected, join_tables
+
+    def _shortest_path(self, sources: Set[str], target: str) -> List[str]:
+        previous: Dict[str, Optional[str]] = {source: None for source in sources}
+        queue = deque(sources)
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return list(reversed(path))
+            for neighbour in self._graph.get(node, ()):
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    queue.append(neighbour)
+        return []
+
+    def validate(self, names: List[str]) -> List[str]:
+        """Map table names from an LLM reply onto catalog tables, dropping unknown names."""
+        by_lower = {name.lower(): name for name in self.catalog.table_names()}
+        valid = []
+        for raw in names:
+            name = raw.strip().strip("`'\"[]. ").lower()
+            name = name.split(".")[-1]
+            if name in by_lower and by_lower[name] not in valid:
+                valid.append(by_lower[name])
+        return valid
@@ -0,0 +1,215 @@
+from typing import Dict, Any, Optional
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BYTE_BUCKETS = (1024, 16 * 1024, 128 * 1024, 1024 ** 2, 8 * 1024 ** 2, 64 * 1024 ** 2)
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def create_tracer_provider(endpoint: str, service_name: str) -> Any:
+    """OTLP/HTTP span exporter to a local collector, or None if the SDK isn't installed."""
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.error("Trace export needs opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http; "
+                     "tracing disabled")
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+    logger.info(f"Exporting traces to {endpoint}")
+    return provider
+
+
+class Span:
+    """Times one unit of work; mirrored as an OpenTelemetry span when tracing is configured.
+
+    Spans are linked to their parent explicitly rather than through the
+    ambient context, so they stay correct across the yields of the
+    streaming pipeline.
+    """
+
+    def __init__(self, name: str, tracer: Any = None, parent: Optional["Span"] = None,
+                 histogram: Optional[Histogram] = None, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.name = name
+        self.parent = parent
+        self.histogram = histogram
+        self.timings: Dict[str, float] = {}
+        self.duration: Optional[float] = None
+        self.started = time.perf_counter()
+        self._otel = None
+        if tracer is not None:
+            from opentelemetry import trace
+
+            context = trace.set_span_in_context(parent._otel) if parent is not None and parent._otel else None
+            self._otel = tracer.start_span(name, context=context)
+        if attributes:
+            self.set(**attributes)
+
+    def set(self, **attributes: Any) -> None:
+        if self._otel is not None:
+            for key, value in attributes.items():
+                if value is not None:
+                    self._otel.set_attribute(f"rag.{key}", value if isinstance(value, (str, bool, int, float))
+                                             else str(value))
+
+    def end(self, error: Optional[str] = None) -> None:
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.started
+        if self.histogram is not None:
+            self.histogram.labels(self.name).observe(self.duration)
+        if self.parent is not None:
+            self.parent.timings[self.name] = round(self.duration * 1000, 2)
+        if self._otel is not None:
+            if error:
+                from opentelemetry.trace import Status, StatusCode
+
+                self._otel.set_status(Status(StatusCode.ERROR, error))
+            self._otel.end()
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end(error=f"{exc_type.__name__}: {exc}" if exc_type is not None else None)
+
+
+class GatewayCollector:
+    """Exports the LLM gateway's own counters and state at scrape time."""
+
+    def __init__(self, gateway: Any) -> None:
+        self.gateway = gateway
+
+    def collect(self):
+        stats = self.gateway.stats()
+        events = CounterMetricFamily("rag_llm_gateway_events", "LLM gateway requests, retries and failures",
+                                     labels=["event"])
+        for event in ("requests", "retries", "quota_errors", "transient_errors", "failures", "rejected_open_circuit"):
+            events.add_metric([event], stats[event])
+        yield events
+        yield GaugeMetricFamily("rag_llm_queue_depth", "LLM calls waiting for rate limit capacity",
+                                value=stats["queue_depth"])
+        yield GaugeMetricFamily("rag_llm_circuit_state", "LLM circuit breaker state (0 closed, 1 half open, 2 open)",
+                                value=CIRCUIT_STATES[stats["circuit_state"]])
+
+
+class Telemetry:
+    """Prometheus metrics and optional trace export for the query pipeline.
+
+    Each instance has its own registry, so several systems (tests,
+    benchmarks) can live in one process without clashing.
+    """
+
+    def __init__(self, trace_endpoint: Optional[str] = None, service_name: str = "multi-agent-rag") -> None:
+        self.registry = CollectorRegistry()
+        self.stage_seconds = Histogram(
+            "rag_stage_duration_seconds", "Duration of each pipeline stage", ["stage"],
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.request_seconds = Histogram(
+            "rag_request_duration_seconds", "End-to-end pipeline duration by outcome", ["outcome"],
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.requests = Counter("rag_requests", "Pipeline runs by outcome", ["outcome"], registry=self.registry)
+        self.llm_seconds = Histogram(
+            "rag_llm_call_duration_seconds", "LLM provider call duration by stage", ["stage"],
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.llm_queue_seconds = Histogram(
+            "rag_llm_queue_wait_seconds", "Time LLM calls waited for rate limit capacity",
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.llm_tokens = Counter(
+            "rag_llm_tokens", "LLM tokens by stage and kind (prompt or completion)", ["stage", "kind"],
+            registry=self.registry,
+        )
+        self.db_seconds = Histogram(
+            "rag_db_query_duration_seconds", "Generated SQL execution time",
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.db_rows = Histogram("rag_db_result_rows", "Rows returned by generated SQL",
+                                 buckets=ROW_BUCKETS, registry=self.registry)
+        self.db_bytes = Histogram("rag_db_result_bytes", "Serialized size of result sets",
+                                  buckets=BYTE_BUCKETS, registry=self.registry)
+        self.cache_lookups = Counter(
+            "rag_cache_lookups", "Cache lookups by cache and outcome", ["cache", "outcome"], registry=self.registry,
+        )
+        self.answers = Counter(
+            "rag_answers", "Answers by path (template or llm) and result shape", ["path", "shape"],
+            registry=self.registry,
+        )
+        self.coalesced = Counter(
+            "rag_coalesced", "Requests and stages that joined an identical in-flight call", ["stage"],
+            registry=self.registry,
+        )
+        self.rollup_rewrites = Counter(
+            "rag_rollup_rewrites", "Executed queries by the rollup they were rewritten onto (none if not rewritten)",
+            ["rollup"], registry=self.registry,
+        )
+        self.literal_repairs = Counter(
+            "rag_literal_repairs", "String literals in generated SQL replaced by a stored column value", ["column"],
+            registry=self.registry,
+        )
+
+        self._provider = create_tracer_provider(trace_endpoint, service_name) if trace_endpoint else None
+        self.tracer = self._provider.get_tracer(__name__) if self._provider is not None else None
+
+    def request(self, **attributes: Any) -> Span:
+        """Root span for one pipeline run; its `timings` collect the stage durations in ms."""
+        return Span("request", self.tracer, attributes=attributes)
+
+    def stage(self, name: str, parent: Span, **attributes: Any) -> Span:
+        return Span(name, self.tracer, parent=parent, histogram=self.stage_seconds, attributes=attributes)
+
+    def observe_request(self, seconds: float, outcome: str) -> None:
+        self.requests.labels(outcome).inc()
+        self.request_seconds.labels(outcome).observe(seconds)
+
+    def observe_llm(self, stage: str, seconds: float, prompt_tokens: int, completion_tokens: int) -> None:
+        self.llm_seconds.labels(stage).observe(seconds)
+        self.llm_tokens.labels(stage, "prompt").inc(prompt_tokens)
+        self.llm_tokens.labels(stage, "completion").inc(completion_tokens)
+
+    def observe_llm_wait(self, seconds: float) -> None:
+        self.llm_queue_seconds.observe(seconds)
+
+    def observe_db(self, seconds: float, rows: int, size: int) -> None:
+        self.db_seconds.observe(seconds)
+        self.db_rows.observe(rows)
+        self.db_bytes.observe(size)
+
+    def count_cache(self, cache: str, outcome: str) -> None:
+        self.cache_lookups.labels(cache, outcome).inc()
+
+    def count_answer(self, path: str, shape: str) -> None:
+        self.answers.labels(path, shape).inc()
+
+    def count_coalesced(self, stage: str) -> None:
+        self.coalesced.labels(stage).inc()
+
+    def count_rollup(self, rollup: str) -> None:
+        self.rollup_rewrites.labels(rollup).inc()
+
+    def count_literal_repair(self, column: str) -> None:
+        self.literal_repairs.labels(column).inc()
+
+    def track_gateway(self, gateway: Any) -> None:
+        self.registry.register(GatewayCollector(gateway))
+
+    def render(self) -> bytes:
+        return generate_latest(self.registry)
+
+    def shutdown(self) -> None:
+        """Flush pending spans to the collector."""
+        if self._provider is not None:
+            self._provider.shutdown()
+
@@ -0,0 +1,396 @@
+"""Index of the values of low-cardinality text columns, for resolving literals in generated SQL.
+
+Generated SQL often filters on a literal the data doesn't hold
+(`country = 'USA'` for 'United States of America', `status = 'in-progress'`
+for 'In Progress'), which returns no rows. `ValueIndex` keeps the distinct
+values of enum-like text columns in memory with a trigram index
+(pg_trgm-style, Jaccard similarity over the padded three-letter grams of
+each word), plus word initials for acronyms. It is used twice per question:
+values resembling the question's words are listed in the SQL generation
+prompt, and string literals compared with an indexed column in the returned
+SQL are checked against the stored values before the SQL runs. A literal is
+only replaced when it equals a stored value after normalization (case,
+spacing, punctuation, accents) or matches one almost exactly and clearly
+better than any other; a literal that merely resembles a value ('Austria'
+and 'Australia') is reported as a suggestion and left alone, since the data
+may simply not hold it.
+
+Values come from `ColumnProfiler`, which samples each table's columns for the
+schema prompt anyway. Refresh is incremental per table: only tables whose
+version changed (or every table once the refresh interval elapses) are
+re-profiled, and only the values added or removed are applied to the index.
+"""
+from typing import List, Dict, Any, Optional, Tuple, Set, Iterable
+from collections import Counter
+from dataclasses import dataclass
+from sqlglot import exp
+from schema_catalog import SchemaCatalog
+from prompt_builder import ColumnProfiler
+from result_cache import TableVersions
+from sql_utils import DIALECT, parse_sql
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Without configured columns, a text column is indexed when its values repeat at least this often on average
+MIN_ROWS_PER_VALUE = 2
+# Similarity credited to a match on word initials ('usa' for 'United States of America')
+ACRONYM_SCORE = 0.9
+# Longest run of question words compared with values
+MAX_PHRASE_WORDS = 4
+# Words skipped when taking initials and never hinted on their own
+MINOR_WORDS = {"a", "an", "the", "of", "and", "or", "in", "on", "at", "by", "for", "to", "de"}
+
+COMPARISONS = (exp.EQ, exp.NEQ)
+
+
+def normalize_value(value: str) -> str:
+    """Lowercase, drop accents and reduce punctuation to single spaces: 'In-Progress' -> 'in progress'."""
+    folded = "".join(c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c))
+    return " ".join(re.split(r"[\W_]+", folded.lower())).strip()
+
+
+def trigrams(normalized: str) -> Set[str]:
+    """Trigrams of each word padded like pg_trgm: two spaces before, one after."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def initials(normalized: str) -> Optional[str]:
+    words = [w for w in normalized.split() if w not in MINOR_WORDS]
+    return "".join(w[0] for w in words) if len(words) > 1 else None
+
+
+@dataclass
+class ValueMatch:
+    table: str
+    column: str
+    value: str
+    score: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"column": f"{self.table}.{self.column}", "value": self.value, "score": round(self.score, 3)}
+
+
+@dataclass
+class LiteralRepair:
+    table: str
+    column: str
+    original: str
+    value: str
+    score: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"column": f"{self.table}.{self.column}", "from": self.original, "to": self.value,
+                "score": round(self.score, 3)}
+
+
+class ColumnValues:
+    """Distinct values of one column with their trigram and initials lookups."""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, str] = {}         # normalized -> stored value
+        self.exact: Set[str] = set()             # every stored spelling
+        self.grams: Dict[str, Set[str]] = {}     # normalized -> its trigrams
+        self.postings: Dict[str, Set[str]] = {}  # trigram -> normalized values containing it
+        self.acronyms: Dict[str, Set[str]] = {}  # initials -> normalized values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def contains(self, value: str) -> bool:
+        return value in self.exact
+
+    def update(self, values: Iterable[str]) -> Tuple[int, int]:
+        """Make the index hold exactly `values`; returns how many were added and removed."""
+        fresh: Dict[str, str] = {}
+        self.exact = set(values)
+        for value in self.exact:
+            key = normalize_value(value)
+            if key:
+                fresh.setdefault(key, value)
+        removed = [key for key in self.values if key not in fresh]
+        for key in removed:
+            self._remove(key)
+        added = 0
+        for key, value in fresh.items():
+            if key not in self.values:
+                self._add(key, value)
+                added += 1
+            else:
+                self.values[key] = value
+        return added, len(removed)
+
+    def lookup(self, term: str, min_score: float, limit: int = 3) -> List[Tuple[str, float]]:
+        """Stored values most similar to `term`, best first."""
+        key = normalize_value(term)
+        if not key:
+            return []
+        if key in self.values:
+            return [(self.values[key], 1.0)]
+        scores: Dict[str, float] = {}
+        for candidate in self.acronyms.get(key.replace(" ", ""), ()):
+            scores[candidate] = ACRONYM_SCORE
+        grams = trigrams(key)
+        shared = Counter(candidate for gram in grams for candidate in self.postings.get(gram, ()))
+        for candidate, n in shared.items():
+            score = n / (len(grams) + len(self.grams[candidate]) - n)
+            if score > scores.get(candidate, 0.0):
+                scores[candidate] = score
+        ranked = sorted(((self.values[c], s) for c, s in scores.items() if s >= min_score),
+                        key=lambda match: (-match[1], match[0]))
+        return ranked[:limit]
+
+    def _add(self, key: str, value: str) -> None:
+        self.values[key] = value
+        self.grams[key] = trigrams(key)
+        for gram in self.grams[key]:
+            self.postings.setdefault(gram, set()).add(key)
+        acronym = initials(key)
+        if acronym:
+            self.acronyms.setdefault(acronym, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        del self.values[key]
+        for gram in self.grams.pop(key):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+        acronym = initials(key)
+        if acronym and acronym in self.acronyms:
+            self.acronyms[acronym].discard(key)
+            if not self.acronyms[acronym]:
+                del self.acronyms[acronym]
+
+
+class ValueIndex:
+    """In-memory value index over enum-like text columns, refreshed incrementally per table.
+
+    `columns` lists the indexed columns as 'table.column'. Without it, text
+    columns the profiler collected values for (at most its `max_values`
+    distinct values) and whose values repeat are indexed. When `versions` is
+    given, a table is re-profiled as soon as its version changes; every
+    table is re-profiled after `refresh_interval` seconds regardless.
+
+    Hints and suggestions need `min_similarity`. A literal is replaced in
+    the SQL only when it normalizes to a stored value, or when its best
+    match scores at least `repair_similarity` and beats the runner-up by
+    `repair_margin`.
+    """
+
+    def __init__(self, catalog: SchemaCatalog, profiler: ColumnProfiler, versions: Optional[TableVersions] = None,
+                 columns: Optional[List[str]] = None, refresh_interval: float = 300.0, min_similarity: float = 0.45,
+                 repair_similarity: float = 0.9, repair_margin: float = 0.2, enabled: bool = True) -> None:
+        self.catalog = catalog
+        self.profiler = profiler
+        self.versions = versions
+        self.configured = [c.strip() for c in columns or [] if c.strip()]
+        self.refresh_interval = refresh_interval
+        self.min_similarity = min_similarity
+        self.repair_similarity = repair_similarity
+        self.repair_margin = repair_margin
+        self.enabled = enabled
+        self._columns: Dict[Tuple[str, str], ColumnValues] = {}
+        self._table_versions: Dict[str, int] = {}
+        self._all_version = 0
+        self._catalog_version = -1
+        self._last_refresh = 0.0
+        self.refreshes = 0
+        self.repairs = 0
+        self._lock = threading.RLock()
+
+    def columns(self) -> List[str]:
+        return sorted(f"{table}.{column}" for table, column in self._columns)
+
+    def ensure_fresh(self) -> List[str]:
+        """Re-profile the tables that changed, or every table once the refresh interval has elapsed."""
+        if not self.enabled:
+            return []
+        if self.catalog.version != self._catalog_version \
+                or time.monotonic() - self._last_refresh >= self.refresh_interval:
+            return self.refresh()
+        if self.versions is None:
+            return []
+        tables = {table for table, _ in self._columns}
+        snapshot = self.versions.snapshot(tables | {"*"})
+        if snapshot.pop("*") != self._all_version:
+            return self.refresh()
+        changed = [t for t in sorted(tables) if snapshot[t] != self._table_versions.get(t, 0)]
+        return self.refresh(changed) if changed else []
+
+    def refresh(self, tables: Optional[List[str]] = None) -> List[str]:
+        """Re-profile the given tables (all candidate tables by default); returns the tables whose values changed."""
+        with self._lock:
+            full = tables is None
+            if full:
+                self._last_refresh = time.monotonic()
+                if self.versions is not None:
+                    self._all_version = self.versions.get("*")
+                tables = sorted({table for table, _ in self._wanted_columns()})
+            changed = []
+            for table in tables:
+                info = self.catalog.table(table)
+                if info is None:
+                    continue
+                if self.versions is not None:
+                    # Read the version first, so a write during profiling triggers another refresh
+                    self._table_versions[table] = self.versions.get(table)
+                self.profiler.invalidate(table)
+                hints = self.profiler.profile(info)
+                for (t, column) in self._wanted_columns():
+                    if t != table:
+                        continue
+                    hint = hints.get(column)
+                    indexed = hint is not None and hint.values is not None and (
+                        self.configured or (hint.non_null or 0) >= MIN_ROWS_PER_VALUE * len(hint.values))
+                    if not indexed:
+                        if (table, column) in self._columns:
+                            del self._columns[(table, column)]
+                            changed.append(table)
+                        if self.configured and hint is not None and (hint.distinct or 0) > self.profiler.max_values:
+                            # A partial index would flag valid literals
+                            logger.warning(f"Value index skips {table}.{column}: {hint.distinct} distinct values")
+                        continue
+                    added, removed = self._columns.setdefault((table, column), ColumnValues()).update(hint.values)
+                    if added or removed:
+                        changed.append(table)
+                        logger.info(f"Value index {table}.{column}: +{added} -{removed} values")
+            if full:
+                self._catalog_version = self.catalog.version
+            self.refreshes += 1
+            return sorted(set(changed))
+
+    def suggest(self, question: str, tables: List[str], limit: int = 10) -> List[ValueMatch]:
+        """Values of the given tables' indexed columns that resemble runs of words in the question."""
+        if not self.enabled:
+            return []
+        words = normalize_value(question).split()
+        phrases = {" ".join(words[i:i + n]) for n in range(1, MAX_PHRASE_WORDS + 1)
+                   for i in range(len(words) - n + 1)
+                   if not all(w in MINOR_WORDS or w.isdigit() for w in words[i:i + n])}
+        best: Dict[Tuple[str, str, str], float] = {}
+        with self._lock:
+            for (table, column), values in self._columns.items():
+                if table not in tables:
+                    continue
+                for phrase in phrases:
+                    for value, score in values.lookup(phrase, self.min_similarity):
+                        key = (table, column, value)
+                        best[key] = max(score, best.get(key, 0.0))
+        matches = [ValueMatch(table, column, value, score) for (table, column, value), score in best.items()]
+        matches.sort(key=lambda m: (-m.score, m.table, m.column, m.value))
+        return matches[:limit]
+
+    @staticmethod
+    def render_hints(matches: List[ValueMatch]) -> str:
+        by_column: Dict[str, List[str]] = {}
+        for match in matches:
+            by_column.setdefault(f"{match.table}.{match.column}", []).append(f"'{match.value}'")
+        return "\n".join(f"  {column}: {', '.join(values)}" for column, values in by_column.items())
+
+    def repair(self, sql_query: str) -> Tuple[str, List[LiteralRepair], List[LiteralRepair]]:
+        """Check string literals compared with indexed columns against the stored values.
+
+        Handles `column = 'x'`, `column <> 'x'` and `column IN ('x', ...)`,
+        including `LOWER(column)`/`UPPER(column)`. Returns the SQL with the
+        safe replacements applied (unchanged when there were none), the
+        replacements, and the suggestions: similar values for literals that
+        were left alone.
+        """
+        if not self.enabled or not self._columns:
+            return sql_query, [], []
+        tree = parse_sql(sql_query)
+        if tree is None:
+            return sql_query, [], []
+        repairs: List[LiteralRepair] = []
+        suggestions: List[LiteralRepair] = []
+        with self._lock:
+            for select in tree.find_all(exp.Select):
+                tables = {t.alias_or_name: t.name for t in select.find_all(exp.Table)
+                          if t.find_ancestor(exp.Select) is select and self.catalog.table(t.name)}
+                if not tables:
+                    continue
+                for node in select.find_all(*COMPARISONS, exp.In):
+                    if node.find_ancestor(exp.Select) is not select:
+                        continue
+                    if isinstance(node, exp.In):
+                        target, literals = node.this, node.expressions
+                    else:
+                        target, right = node.this, node.expression
+                        if isinstance(right, (exp.Column, exp.Lower, exp.Upper)) and isinstance(target, exp.Literal):
+                            target, right = right, target
+                        literals = [right]
+                    case = type(target) if isinstance(target, (exp.Lower, exp.Upper)) else None
+                    column = target.this if case else target
+                    if not isinstance(column, exp.Column):
+                        continue
+                    resolved = self._resolve(column, tables)
+                    if resolved is None:
+                        continue
+                    for literal in literals:
+                        if isinstance(literal, exp.Literal) and literal.is_string:
+                            self._check_literal(resolved, literal, case, repairs, suggestions)
+        if not repairs:
+            return sql_query, [], suggestions
+        self.repairs += len(repairs)
+        return tree.sql(dialect=DIALECT), repairs, suggestions
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "columns": {f"{t}.{c}": len(values) for (t, c), values in sorted(self._columns.items())},
+                "refreshes": self.refreshes,
+                "repairs": self.repairs,
+            }
+
+    def _resolve(self, column: exp.Column, tables: Dict[str, str]) -> Optional[Tuple[str, str]]:
+        if column.table:
+            table = tables.get(column.table)
+            return (table, column.name) if (table, column.name) in self._columns else None
+        owners = [(t, column.name) for t in set(tables.values()) if (t, column.name) in self._columns]
+        return owners[0] if len(owners) == 1 else None
+
+    def _check_literal(self, resolved: Tuple[str, str], literal: exp.Literal, case: Optional[type],
+                       repairs: List[LiteralRepair], suggestions: List[LiteralRepair]) -> None:
+        values = self._columns[resolved]
+        original = literal.this
+        fold = {exp.Lower: str.lower, exp.Upper: str.upper}.get(case, lambda value: value)
+        if case is None and values.contains(original):
+            return
+        matches = values.lookup(original, self.min_similarity)
+        if not matches or fold(matches[0][0]) == original:
+            return
+        value, score = matches[0]
+        runner_up = matches[1][1] if len(matches) > 1 else 0.0
+        match = LiteralRepair(resolved[0], resolved[1], original, value, score)
+        same = normalize_value(original) == normalize_value(value)
+        if same or (score >= self.repair_similarity and score - runner_up >= self.repair_margin):
+            literal.replace(exp.Literal.string(fold(value)))
+            repairs.append(match)
+        else:
+            # Similar is not the same: the data may simply not hold this value
+            suggestions.append(match)
+
+    def _wanted_columns(self) -> List[Tuple[str, str]]:
+        """Configured columns that exist, or every non-key text column of the catalog."""
+        if self.configured:
+            wanted = []
+            for name in self.configured:
+                table, _, column = name.partition(".")
+                info = self.catalog.table(table)
+                if info is None or info.column(column) is None:
+                    logger.warning(f"Value index column {name} is not in the schema")
+                    continue
+                wanted.append((table, column))
+            return wanted
+        return [(info.name, column) for info in self.catalog.tables.values()
+                for column in self.profiler.value_columns(info)]
@@ -0,0 +1,68 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from answer_formatter import AnswerFormatter, format_value, humanize
+from result_set import ResultSet
+
+
+def result_set(columns, rows, **kwargs):
+    results = ResultSet(columns, **kwargs)
+    results.add_chunk(rows)
+    return results
+
+
+@pytest.mark.parametrize("value, text", [
+    (None, "no value"),
+    (True, "yes"),
+    (1234567, "1,234,567"),
+    (2500.0, "2,500"),
+    (Decimal("1234.567"), "1,234.57"),
+    (0.0034, "0.0034"),
+    (Decimal("0.125"), "0.125"),
+    (-0.56789, "-0.568"),
+    (float("nan"), "nan"),
+    (date(2024, 3, 5), "2024-03-05"),
+])
+def test_format_value(value, text):
+    assert format_value(value) == text
+
+
+def test_humanize():
+    assert humanize("customer_count") == "customer count"
+    assert humanize("totalSales") == "total sales"
+
+
+@pytest.fixture
+def formatter():
+    return AnswerFormatter(max_rows=3, max_columns=2)
+
+
+def test_scalar_with_named_column(formatter):
+    answer = formatter.format("What is the conversion rate?", result_set(["conversion_rate"], [(0.0034,)]))
+    assert (answer.shape, answer.text) == ("scalar", "The conversion rate is 0.0034.")
+
+
+def test_scalar_with_generic_label_repeats_the_question(formatter):
+    answer = formatter.format("How many customers? ", result_set(["count"], [(200,)]))
+    assert answer.text == 'The answer to "How many customers?" is 200.'
+
+
+def test_single_row_and_table(formatter):
+    row = formatter.format("q", result_set(["name", "total_sales"], [("Ann", 1500.5)]))
+    assert row.text == "The result is name: Ann, total sales: 1,500.50."
+    table = formatter.format("q", result_set(["country", "n"], [("France", 3), ("Spain", 2)]))
+    assert table.text == "There are 2 results:\n- France: 3\n- Spain: 2"
+
+
+@pytest.mark.parametrize("results, shape", [
+    (result_set(["a"], []), "empty"),
+    (result_set(["a"], [(i,) for i in range(4)]), "complex"),
+    (result_set(["a", "b", "c"], [(1, 2, 3), (4, 5, 6)]), "complex"),
+    (result_set(["a"], [(i,) for i in range(3)], max_rows=2), "complex"),
+])
+def test_classify(formatter, results, shape):
+    assert formatter.classify(results) == shape
+    if shape == "complex":
+        assert formatter.format("q", results) is None
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+main = pytest.importorskip("main")
+from agents import MultiAgentSystem  # noqa: E402
+from query_cache import QueryCache  # noqa: E402
+
+
+class BatchSystem:
+    """Just the parts of MultiAgentSystem that process_batch uses, with a scripted pipeline."""
+
+    process_batch = MultiAgentSystem.process_batch
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.query_cache = QueryCache()
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+
+    async def process_query(self, query, priority, narrative=False):
+        self.calls.append(query)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if "fail" in query:
+            raise RuntimeError("pipeline failed")
+        return {"answer": f"answer to {query}", "intermediate_steps": {}}
+
+
+QUESTIONS = ["How many customers?", "how many customers", "Top product", "fail please", "Top product?"]
+
+
+def test_duplicates_run_once_and_keep_input_order(catalog):
+    system = BatchSystem(catalog)
+    items = asyncio.run(system.process_batch(QUESTIONS, max_concurrency=2))
+    assert sorted(system.calls) == ["How many customers?", "Top product", "fail please"]
+    assert [item["duplicate_of"] for item in items] == [None, 0, None, None, 2]
+    assert items[1]["result"] is items[0]["result"]
+    assert items[4]["result"]["answer"] == "answer to Top product"
+    assert system.peak <= 2
+
+
+def test_a_failing_question_does_not_fail_the_batch(catalog):
+    items = asyncio.run(BatchSystem(catalog).process_batch(QUESTIONS, max_concurrency=8))
+    assert items[3]["result"]["error"] == "pipeline failed"
+    assert items[3]["result"]["error_type"] == "unknown"
+    assert items[0]["result"]["answer"] == "answer to How many customers?"
+
+
+@pytest.fixture
+def client(catalog, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main.app, "agent_system", BatchSystem(catalog), raising=False)
+    monkeypatch.setattr(main.settings, "BATCH_MAX_QUESTIONS", 5)
+    return TestClient(main.app)
+
+
+def test_batch_endpoint(client):
+    response = client.post("/ask/batch", json={"questions": QUESTIONS})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["distinct_questions"] == 3
+    assert [item["status_code"] for item in body["results"]] == [200, 200, 200, 400, 200]
+    assert body["results"][1]["duplicate_of"] == 0
+
+
+def test_batch_size_is_capped(client):
+    response = client.post("/ask/batch", json={"questions": QUESTIONS + ["one more"]})
+    assert response.status_code == 422
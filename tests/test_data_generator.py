@@ -0,0 +1,44 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from data_generator import GenerationPlan, build_vocabulary, generate, generate_chunk, plan_parent_arrays
+
+TABLES = ("customers", "employees", "projects", "project_assignments", "sales")
+
+
+def dump(seed):
+    engine = create_engine("sqlite://")
+    rows = generate(engine, scale=0.2, seed=seed)
+    with engine.connect() as connection:
+        data = {table: connection.execute(text(f"SELECT * FROM {table} ORDER BY 1")).fetchall() for table in TABLES}
+    engine.dispose()
+    return rows, data
+
+
+def test_same_seed_gives_identical_data():
+    rows, data = dump(7)
+    assert rows == {"customers": 40, "employees": 10, "projects": 6, "project_assignments": 30, "sales": 100}
+    assert {table: len(values) for table, values in data.items()} == rows
+    assert dump(7) == (rows, data)
+
+
+def test_different_seed_gives_different_data():
+    assert dump(7)[1]["sales"] != dump(8)[1]["sales"]
+
+
+def test_chunks_do_not_depend_on_generation_order():
+    def plan():
+        plan = GenerationPlan(seed=3, as_of=date(2025, 12, 31), rows={"customers": 20, "employees": 5,
+                              "projects": 3, "project_assignments": 15, "sales": 50}, vocabulary=build_vocabulary(3))
+        plan_parent_arrays(plan)
+        return plan
+
+    first, second = plan(), plan()
+    generate_chunk(second, "customers", 1, 20)
+    a = generate_chunk(first, "sales", 1, 50)
+    b = generate_chunk(second, "sales", 1, 50)
+    assert a.keys() == b.keys()
+    for column in a:
+        assert np.array_equal(np.asarray(a[column]), np.asarray(b[column]))
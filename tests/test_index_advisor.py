@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+
+from index_advisor import IndexAdvisor, SQLWorkload
+
+QUERIES = [
+    ("SELECT * FROM customers WHERE country = 'France' AND join_date > '2024-01-01'", 0.040),
+    ("SELECT name FROM customers WHERE country = 'Germany' AND join_date > '2023-01-01'", 0.030),
+    ("SELECT s.product, SUM(s.amount) FROM sales s JOIN customers c ON s.customer_id = c.customer_id "
+     "WHERE c.country = 'France' GROUP BY s.product", 0.100),
+    ("SELECT * FROM employees WHERE employee_id = 3", 0.001),
+]
+
+
+@pytest.fixture
+def workload():
+    workload = SQLWorkload()
+    for sql, seconds in QUERIES:
+        workload.record(sql, seconds)
+    return workload
+
+
+def test_record_only_queues_until_flushed(tmp_path):
+    path = tmp_path / "workload.jsonl"
+    workload = SQLWorkload(path=str(path))
+    workload.record("SELECT * FROM customers WHERE country = 'France'", 0.01)
+    assert not path.exists()
+    assert [e.count for e in workload.entries()] == [1]
+    assert json.loads(path.read_text()) == {"sql": "SELECT * FROM customers WHERE country = 'France'", "ms": 10.0}
+
+
+def test_equivalent_statements_share_an_entry(workload):
+    workload.record("select *  from customers where country = 'France' and join_date > '2024-01-01'", 0.01)
+    entries = {e.sql: e for e in workload.entries()}
+    assert entries[QUERIES[0][0]].count == 2
+    assert entries[QUERIES[0][0]].total_ms == pytest.approx(50.0)
+
+
+def test_background_flush_and_reload(tmp_path):
+    path = tmp_path / "workload.jsonl"
+
+    async def run():
+        workload = SQLWorkload(path=str(path), flush_interval=3600)
+        await workload.start()
+        for sql, seconds in QUERIES:
+            workload.record(sql, seconds)
+        await workload.stop()
+
+    asyncio.run(run())
+    assert len(path.read_text().splitlines()) == len(QUERIES)
+    assert len(SQLWorkload.load(str(path)).entries()) == len(QUERIES)
+
+
+def test_proposals_put_equality_before_range(engine, catalog, workload):
+    proposals = IndexAdvisor(engine, catalog, workload).propose()
+    best = proposals[0]
+    # (country) from the join query merges into the wider (country, join_date)
+    assert (best.table, best.columns) == ("customers", ("country", "join_date"))
+    assert best.queries == 3
+    assert all(p.table != "employees" for p in proposals)
+
+
+def test_no_cost_comparison_without_hypopg(engine, catalog, workload):
+    report = IndexAdvisor(engine, catalog, workload).report(explain=True)
+    assert report["statements"] == len(QUERIES)
+    proposal = report["proposals"][0]
+    assert proposal["comparisons"] is None
+    assert proposal["comparison_note"] == "cost comparison needs PostgreSQL"
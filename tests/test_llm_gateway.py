@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_backends import LLMBackend, LLMResponse
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailableError
+
+COOLDOWN = 0.05
+
+
+class ScriptedBackend(LLMBackend):
+    """Returns or raises the scripted outcomes in order."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def generate(self, prompt, stage, question=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return LLMResponse(text=outcome)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=3, cooldown=COOLDOWN)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(threshold=2, cooldown=COOLDOWN)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_admits_a_single_trial():
+    breaker = CircuitBreaker(threshold=1, cooldown=COOLDOWN)
+    open_breaker(breaker)
+    time.sleep(COOLDOWN)
+    assert breaker.state == "half_open"
+    assert breaker.admit() == "trial"
+    assert breaker.admit() is None
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.admit() == "closed"
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(threshold=1, cooldown=COOLDOWN)
+    open_breaker(breaker)
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def gateway(backend, threshold=1):
+    return LLMGateway(backend, requests_per_minute=0, tokens_per_minute=0, max_retries=2, backoff_base=0.001,
+                      breaker_threshold=threshold, breaker_cooldown=COOLDOWN)
+
+
+def test_trial_call_keeps_its_slot_across_retries():
+    backend = ScriptedBackend([TimeoutError("slow"), "ok"])
+    llm = gateway(backend)
+    open_breaker(llm.breaker)
+    time.sleep(COOLDOWN)
+    response = asyncio.run(llm.generate("prompt"))
+    assert response.text == "ok"
+    assert backend.calls == 2
+    assert llm.breaker.state == "closed"
+
+
+def test_open_circuit_fails_fast():
+    backend = ScriptedBackend(["ok"])
+    llm = gateway(backend)
+    open_breaker(llm.breaker)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(llm.generate("prompt"))
+    assert backend.calls == 0
+    assert llm.counters["rejected_open_circuit"] == 1
+
+
+def test_caller_errors_leave_the_breaker_alone():
+    backend = ScriptedBackend([ValueError("invalid argument")])
+    llm = gateway(backend, threshold=3)
+    llm.breaker.record_failure()
+    llm.breaker.record_failure()
+    with pytest.raises(ValueError):
+        asyncio.run(llm.generate("prompt"))
+    assert llm.breaker.failures == 2
+
+
+def test_caller_error_on_trial_releases_it():
+    backend = ScriptedBackend([ValueError("invalid argument"), "ok"])
+    llm = gateway(backend)
+    open_breaker(llm.breaker)
+    time.sleep(COOLDOWN)
+    with pytest.raises(ValueError):
+        asyncio.run(llm.generate("prompt"))
+    assert llm.breaker.state == "half_open"
+    assert asyncio.run(llm.generate("prompt")).text == "ok"
+    assert llm.breaker.state == "closed"
+
+
+def test_exhausted_retries_open_the_breaker():
+    backend = ScriptedBackend([TimeoutError("slow")] * 3)
+    llm = gateway(backend)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(llm.generate("prompt"))
+    assert backend.calls == 3
+    assert llm.breaker.state == "open"
@@ -0,0 +1,69 @@
+import pytest
+
+from prompt_builder import ColumnProfiler, SchemaPromptBuilder
+from table_router import TableRouter
+
+
+@pytest.fixture
+def profiler(engine, insert_rows):
+    insert_rows("employees", [{"name": f"E{i}", "department": d, "hire_date": f"2020-0{1 + i % 9}-01"}
+                              for i, d in enumerate(["Sales", "HR", "Engineering"] * 4)])
+    insert_rows("projects", [{"name": f"P{i}", "status": "Planning"} for i in range(3)])
+    return ColumnProfiler(engine, max_values=5)
+
+
+@pytest.fixture
+def builder(catalog, profiler):
+    return SchemaPromptBuilder(catalog, TableRouter(catalog), profiler, token_budget=2000)
+
+
+def test_profiler_collects_values_counts_and_ranges(catalog, profiler):
+    hints = profiler.profile(catalog.table("employees"))
+    assert hints["department"].values == ["Engineering", "HR", "Sales"]
+    assert (hints["department"].distinct, hints["department"].non_null) == (3, 12)
+    # Twelve distinct names exceed max_values: counted, not listed
+    assert hints["name"].values is None and hints["name"].distinct == 12
+    assert (hints["hire_date"].min_value, hints["hire_date"].max_value) == ("2020-01-01", "2020-09-01")
+
+
+def test_profiles_are_cached_until_invalidated(engine, catalog, profiler, insert_rows):
+    employees = catalog.table("employees")
+    profiler.profile(employees)
+    insert_rows("employees", [{"name": "New", "department": "Legal"}])
+    assert "Legal" not in profiler.profile(employees)["department"].values
+    profiler.invalidate("employees")
+    assert "Legal" in profiler.profile(employees)["department"].values
+
+
+def test_value_columns_skip_keys(catalog):
+    assert ColumnProfiler.value_columns(catalog.table("project_assignments")) == ["role"]
+
+
+def test_prompt_has_only_selected_tables_join_tables_and_join_paths(builder):
+    prompt = builder.build(["employees", "projects"])
+    assert prompt.tables == ["employees", "project_assignments", "projects"]
+    assert prompt.join_tables == ["project_assignments"]
+    assert prompt.detail == "full"
+    assert "Table: customers" not in prompt.text
+    assert "  employee_id INTEGER FK -> employees.employee_id" in prompt.text
+    assert "project_assignments.employee_id = employees.employee_id" in prompt.joins
+    assert "department VARCHAR(100) values: 'Engineering', 'HR', 'Sales'" in prompt.text
+
+
+def test_unknown_tables_fall_back_to_the_whole_schema(builder, catalog):
+    assert builder.build(["nope"]).tables == catalog.table_names()
+
+
+def test_detail_is_reduced_to_fit_the_budget(builder):
+    full = builder.build(["employees", "projects"])
+    builder.token_budget = full.tokens - 1
+    reduced = builder.build(["employees", "projects"])
+    assert reduced.detail != "full"
+    assert reduced.tokens <= builder.token_budget
+
+
+def test_prompt_is_cut_when_even_the_leanest_rendering_is_too_large(builder):
+    builder.token_budget = 20
+    prompt = builder.build(["employees", "projects"])
+    assert prompt.truncated
+    assert prompt.tokens <= 20
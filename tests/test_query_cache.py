@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import pytest
+
+from query_cache import QueryCache, normalize_question
+
+
+@pytest.mark.parametrize("a, b", [
+    ("How many customers are there?", "how  many customers are there"),
+    ("Sales on 2024-03-05", "Sales on March 5th, 2024"),
+    ("Sales on 03/05/2024", "sales on 5 march 2024"),
+    ("Sales in Jan 2024", "sales in january, 2024"),
+    ("Orders over 1,000.50", "orders over 1000.5"),
+    ("Top five products", "top 5 products"),
+])
+def test_equivalent_questions_share_a_key(a, b):
+    assert normalize_question(a) == normalize_question(b)
+    assert QueryCache.make_key(a, "f") == QueryCache.make_key(b, "f")
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Sales in 2023", "Sales in 2024"),
+    ("Orders over 1.5", "Orders over 15"),
+    ("customers in France", "customers in Germany"),
+])
+def test_different_questions_do_not_collide(a, b):
+    assert normalize_question(a) != normalize_question(b)
+
+
+def test_schema_fingerprint_is_part_of_the_key():
+    cache = QueryCache()
+    cache.put("How many customers?", "v1", ["customers"], "SELECT COUNT(*) FROM customers")
+    assert cache.get("how many customers", "v1").sql == "SELECT COUNT(*) FROM customers"
+    assert cache.get("how many customers", "v2") is None
+    assert cache.purge_stale("v2") == 1
+
+
+def test_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    for question in ("a", "b", "c"):
+        cache.put(question, "f", [], f"SELECT '{question}'")
+    assert cache.get("a", "f") is None
+    assert cache.get("c", "f") is not None
+
+
+def test_changes_are_saved_in_the_background_and_on_stop(tmp_path):
+    path = tmp_path / "cache.json"
+
+    async def run():
+        cache = QueryCache(path=str(path), save_interval=3600)
+        await cache.start()
+        cache.put("How many customers?", "f", ["customers"], "SELECT COUNT(*) FROM customers")
+        assert not path.exists()
+        await cache.stop()
+
+    asyncio.run(run())
+    assert len(json.loads(path.read_text())) == 1
+    assert QueryCache(path=str(path)).get("how many customers", "f") is not None
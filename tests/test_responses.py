@@ -0,0 +1,60 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from starlette.requests import Request
+
+from config import settings
+from responses import dumps, json_response, negotiate_encoding
+
+
+def make_request(accept_encoding=""):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "POST", "path": "/ask", "headers": headers})
+
+
+def test_dumps_converts_database_values():
+    row = {"amount": Decimal("12.50"), "count": Decimal("3"), "day": date(2024, 3, 5),
+           "at": datetime(2024, 3, 5, 8, 30), "mean": np.float64(1.5), "n": np.int64(7)}
+    assert json.loads(dumps(row)) == {"amount": 12.5, "count": 3, "day": "2024-03-05",
+                                      "at": "2024-03-05T08:30:00", "mean": 1.5, "n": 7}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate", "gzip"),
+    ("GZIP", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_gzip(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_large_bodies_are_compressed(monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_COMPRESSION_MIN_BYTES", 100)
+    content = {"rows": [[i, f"name {i}"] for i in range(100)]}
+    response = json_response(make_request("gzip"), content)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.body)) == content
+
+
+def test_small_bodies_are_sent_as_is(monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_COMPRESSION_MIN_BYTES", 100)
+    response = json_response(make_request("gzip"), {"answer": "ok"})
+    assert "content-encoding" not in response.headers
+    assert json.loads(response.body) == {"answer": "ok"}
+
+
+def test_shape_results_records_without_mutating_the_shared_result():
+    main = pytest.importorskip("main")
+    payload = {"columns": ["name", "total"], "column_types": ["VARCHAR", "FLOAT"], "rows": [["A", 1.0], ["B", 2.0]]}
+    result = {"answer": "x", "intermediate_steps": {"query_results": payload}}
+    shaped = main.shape_results(result, "records")
+    assert shaped["intermediate_steps"]["query_results"] == [{"name": "A", "total": 1.0}, {"name": "B", "total": 2.0}]
+    assert result["intermediate_steps"]["query_results"] is payload
+    assert main.shape_results(result, "columns") is result
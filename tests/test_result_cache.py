@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from result_cache import ResultCache, TableChangeMonitor, TableVersions
+from result_set import ResultSet
+
+SQL = "SELECT name FROM customers WHERE country = 'DE'"
+
+
+def result(*values):
+    results = ResultSet(["name"])
+    results.add_chunk([(value,) for value in values])
+    return results
+
+
+def test_table_versions():
+    versions = TableVersions()
+    assert versions.get("sales") == 0
+    versions.bump("sales")
+    versions.bump("sales")
+    assert versions.snapshot({"sales", "customers"}) == {"sales": 2, "customers": 0}
+    versions.bump_all()
+    assert versions.snapshot({"sales", "customers", "*"}) == {"sales": 3, "customers": 0, "*": 1}
+
+
+def test_put_then_get():
+    cache = ResultCache(TableVersions())
+    cached = result("Ann", "Bob")
+    assert cache.get(SQL) is None
+    assert cache.put(SQL, cached, cache.snapshot(SQL))
+    assert cache.get(SQL) is cached
+    assert cache.stats() == {"entries": 1, "bytes": cached.bytes, "hits": 1, "misses": 1}
+
+
+def test_equivalent_sql_shares_an_entry():
+    cache = ResultCache(TableVersions())
+    cached = result("Ann")
+    cache.put(SQL, cached, cache.snapshot(SQL))
+    assert cache.get("select name\nfrom customers where country='DE';") is cached
+
+
+def test_write_to_a_read_table_invalidates():
+    versions = TableVersions()
+    cache = ResultCache(versions)
+    cache.put(SQL, result("Ann"), cache.snapshot(SQL))
+    versions.bump("sales")
+    assert cache.get(SQL) is not None
+    versions.bump("customers")
+    assert cache.get(SQL) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_bump_all_invalidates_tables_never_seen():
+    versions = TableVersions()
+    cache = ResultCache(versions)
+    cache.put(SQL, result("Ann"), cache.snapshot(SQL))
+    versions.bump_all()
+    assert cache.get(SQL) is None
+
+
+def test_result_older_than_a_write_is_not_cached():
+    versions = TableVersions()
+    cache = ResultCache(versions)
+    snapshot = cache.snapshot(SQL)
+    versions.bump("customers")
+    assert not cache.put(SQL, result("Ann"), snapshot)
+    assert cache.get(SQL) is None
+
+
+def test_only_queries_are_cacheable():
+    cache = ResultCache(TableVersions())
+    assert cache.snapshot("DELETE FROM customers") is None
+    assert not cache.put("DELETE FROM customers", result(), {"customers": 0})
+    assert not cache.put(SQL, result("Ann"), None)
+
+
+def test_lru_eviction_by_size():
+    entry_bytes = result("Ann").bytes
+    cache = ResultCache(TableVersions(), max_bytes=entry_bytes * 8)
+    queries = [f"SELECT name FROM customers WHERE customer_id = {i}" for i in range(3)]
+    for sql in queries[:2]:
+        cache.put(sql, result("Ann"), cache.snapshot(sql))
+    cache.get(queries[0])
+    cache.max_bytes = entry_bytes * 2
+    cache.put(queries[2], result("Ann"), cache.snapshot(queries[2]))
+    assert cache.get(queries[1]) is None
+    assert cache.get(queries[0]) is not None
+    assert cache.get(queries[2]) is not None
+    assert cache.stats()["bytes"] == entry_bytes * 2
+
+
+def test_oversized_results_are_not_cached():
+    cache = ResultCache(TableVersions(), max_bytes=40)
+    assert not cache.put(SQL, result("x" * 20), cache.snapshot(SQL))
+
+
+def test_ttl_expires_entries():
+    cache = ResultCache(TableVersions(), ttl=60)
+    cache.put(SQL, result("Ann"), cache.snapshot(SQL))
+    entry = next(iter(cache._entries.values()))
+    entry.created_at -= 59
+    assert cache.get(SQL) is not None
+    entry.created_at -= 2
+    assert cache.get(SQL) is None
+
+
+def test_disabled_cache():
+    cache = ResultCache(TableVersions(), max_bytes=0)
+    assert cache.snapshot(SQL) is None
+    assert not cache.put(SQL, result("Ann"), {"customers": 0})
+    assert cache.get(SQL) is None
+
+
+@pytest.mark.parametrize("mode", ["poll", "notify"])
+def test_monitor_is_inactive_outside_postgresql(engine, mode):
+    monitor = TableChangeMonitor(TableVersions(), engine, ["customers"], mode=mode)
+
+    async def run():
+        await monitor.start()
+        assert monitor._task is None
+        await monitor.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from result_set import ResultSet
+
+ROWS = [(1, "Ann", date(2024, 1, 2)), (2, "Bob", None), (3, None, date(2024, 3, 4))]
+
+
+def test_rows_are_stored_by_column():
+    results = ResultSet(["id", "name", "joined"])
+    results.add_chunk(ROWS[:2])
+    results.add_chunk(ROWS[2:])
+    assert results.row_count == len(results) == 3
+    assert results.data == [[1, 2, 3], ["Ann", "Bob", None], [date(2024, 1, 2), None, date(2024, 3, 4)]]
+    assert list(results.rows()) == ROWS
+    assert results.select([2, 0]) == [ROWS[2], ROWS[0]]
+    assert results.types == ["int", "str", "date"]
+
+
+def test_payload_views():
+    results = ResultSet(["id", "name", "joined"])
+    results.add_chunk(ROWS)
+    assert results.to_columns(limit=1) == {"columns": ["id", "name", "joined"], "column_types": ["int", "str", "date"],
+                                           "rows": [ROWS[0]]}
+    assert results.to_records(limit=1) == [{"id": 1, "name": "Ann", "joined": "2024-01-02"}]
+
+
+def test_row_cap_truncates():
+    results = ResultSet(["n"], max_rows=5)
+    assert len(results.add_chunk([(i,) for i in range(3)])) == 3
+    assert len(results.add_chunk([(i,) for i in range(3)])) == 2
+    assert results.add_chunk([(9,)]) == []
+    assert results.row_count == 5
+    assert (results.truncated, results.truncated_reason) == (True, "rows")
+
+
+def test_byte_cap_truncates_within_a_chunk():
+    rows = [(i, "x" * 10) for i in range(20)]
+    results = ResultSet(["n", "s"], max_bytes=100)
+    accepted = results.add_chunk(rows)
+    assert 0 < len(accepted) < 20
+    assert results.bytes <= 100
+    assert results.truncated_reason == "bytes"
+
+
+def test_counts_only_without_keeping_rows():
+    results = ResultSet(["amount"], keep_rows=False)
+    results.add_chunk([(Decimal("1.5"),), (Decimal("2"),)])
+    assert results.row_count == 2
+    assert results.data == [[]]
+    assert results.types == ["Decimal"]
+    assert results.bytes == len(json.dumps([["1.5"], ["2"]]))
@@ -0,0 +1,52 @@
+from datetime import date
+from decimal import Decimal
+
+from result_set import ResultSet
+from result_summary import ResultSummarizer
+
+
+def result_set(columns, rows):
+    results = ResultSet(columns)
+    results.add_chunk(rows)
+    return results
+
+
+def stats_lines(results, **kwargs):
+    return ResultSummarizer(**kwargs)._column_stats(results)
+
+
+def test_small_results_are_sent_as_rows():
+    summary = ResultSummarizer(sample_rows=5).summarize(result_set(["name", "n"], [("A", 1), ("B", 2)]))
+    assert summary.detail == "rows"
+    assert summary.text.endswith('Rows:\n["A", 1]\n["B", 2]')
+
+
+def test_numeric_statistics():
+    rows = [(i, Decimal(i) / 4, float(i) if i % 2 else None) for i in range(1, 101)]
+    ints, decimals, floats = stats_lines(result_set(["i", "d", "f"], rows))
+    assert ints == "- i: 100 non-null, min 1, max 100, mean 50.5, sum 5050"
+    assert decimals == "- d: 100 non-null, min 0.25, max 25, mean 12.625, sum 1262.5"
+    assert floats == "- f: 50 non-null, min 1, max 99, mean 50, sum 2500"
+
+
+def test_date_and_category_statistics():
+    rows = [(date(2024, 1, 1 + i % 28), ["France", "Germany", "Spain"][i % 3] if i < 40 else "France", True)
+            for i in range(50)]
+    days, countries, flags = stats_lines(result_set(["day", "country", "flag"], rows), top_k=2)
+    assert days == "- day: 50 non-null, from 2024-01-01 to 2024-01-28"
+    assert countries == "- country: 50 non-null, 3 distinct; most common: France (24), Germany (13)"
+    # Booleans are categories, not numbers
+    assert flags == "- flag: 50 non-null, 1 distinct; most common: True (50)"
+
+
+def test_empty_column():
+    assert stats_lines(result_set(["x"], [(None,), (None,)])) == ["- x: 0 non-null"]
+
+
+def test_large_results_become_statistics_within_budget():
+    rows = [(i, f"name {i}", i * 1.5) for i in range(1000)]
+    summary = ResultSummarizer(token_budget=150, sample_rows=20).summarize(result_set(["id", "name", "amount"], rows))
+    assert summary.detail == "statistics"
+    assert summary.tokens <= 150
+    assert summary.sample_rows < 20
+    assert "Column statistics:\n- id: 1000 non-null, min 0, max 999" in summary.text
@@ -0,0 +1,173 @@
+import pytest
+
+from sqlalchemy import inspect, text
+
+from result_cache import TableVersions
+from rollups import NotRewritable, RollupManager, create_tables, plan_rewrite
+from sql_utils import parse_sql
+
+BY_PRODUCT = "SELECT product, SUM(amount) AS total, COUNT(*) AS n FROM sales GROUP BY product ORDER BY product"
+BY_DEPARTMENT = ("SELECT e.department, SUM(s.amount) AS total FROM sales s JOIN employees e "
+                 "ON s.employee_id = e.employee_id GROUP BY e.department ORDER BY e.department")
+
+
+def rewrite(sql):
+    tree, rollup = plan_rewrite(parse_sql(sql))
+    return tree.sql(), rollup.name
+
+
+@pytest.mark.parametrize("sql, rollup", [
+    ("SELECT product, SUM(amount) FROM sales GROUP BY product", "rollup_sales_month"),
+    ("SELECT TO_CHAR(sale_date, 'YYYY-MM') AS m, SUM(amount) FROM sales GROUP BY 1", "rollup_sales_month"),
+    ("SELECT TO_CHAR(sale_date, 'Mon YYYY') AS m, COUNT(*) FROM sales GROUP BY 1", "rollup_sales_month"),
+    ("SELECT DATE_TRUNC('quarter', sale_date) AS q, AVG(amount) FROM sales GROUP BY 1", "rollup_sales_month"),
+    ("SELECT e.department, SUM(s.amount) FROM sales s JOIN employees e ON s.employee_id = e.employee_id "
+     "GROUP BY e.department", "rollup_sales_month"),
+    ("SELECT employee_id, MAX(amount) FROM sales GROUP BY employee_id", "rollup_sales_month_employee"),
+    ("SELECT sale_date, SUM(amount) FROM sales GROUP BY sale_date", "rollup_sales_day"),
+    ("SELECT TO_CHAR(sale_date, 'YYYY-IW') AS w, SUM(amount) FROM sales GROUP BY 1", "rollup_sales_day"),
+])
+def test_accepted_grains(sql, rollup):
+    rewritten, used = rewrite(sql)
+    assert used == rollup
+    assert f"FROM {rollup}" in rewritten
+
+
+def test_month_range_filter_uses_month_grain():
+    _, used = rewrite("SELECT SUM(amount) FROM sales WHERE sale_date >= '2024-01-01' AND sale_date < '2024-04-01'")
+    assert used == "rollup_sales_month"
+
+
+def test_mid_month_filter_falls_back_to_day_grain():
+    _, used = rewrite("SELECT SUM(amount) FROM sales WHERE sale_date >= '2024-01-15'")
+    assert used == "rollup_sales_day"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT customer_id, SUM(amount) FROM sales GROUP BY customer_id",
+    "SELECT * FROM sales",
+    "SELECT product FROM sales",
+    "SELECT COUNT(DISTINCT customer_id) FROM sales",
+    "SELECT product, SUM(amount) FROM sales WHERE amount > 100 GROUP BY product",
+    "SELECT c.name, SUM(s.amount) FROM sales s JOIN customers c ON s.customer_id = c.customer_id GROUP BY c.name",
+    "SELECT product, SUM(amount) OVER () FROM sales",
+    "SELECT name, COUNT(*) FROM customers GROUP BY name",
+    "SELECT product, SUM(amount) FROM (SELECT * FROM sales) s GROUP BY product",
+])
+def test_rejected_queries(sql):
+    with pytest.raises(NotRewritable):
+        plan_rewrite(parse_sql(sql))
+
+
+@pytest.fixture
+def manager(engine):
+    create_tables(engine)
+    return RollupManager(engine)
+
+
+def sale(sale_id, product="Product A", amount=10.0, month=1):
+    return {"sale_id": sale_id, "customer_id": 1, "employee_id": 1, "sale_date": f"2025-0{month}-15",
+            "amount": amount, "product": product}
+
+
+def assert_rewritten_matches(engine, manager, sql):
+    rewrite = manager.rewrite(sql)
+    assert rewrite.rollup is not None, rewrite.reason
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql(rewrite.sql).fetchall() == connection.exec_driver_sql(sql).fetchall()
+
+
+def test_rollup_answers_match_base_table(engine, insert_rows, manager):
+    insert_rows("customers", [{"customer_id": 1, "name": "A", "country": "France"}])
+    insert_rows("employees", [{"employee_id": 1, "name": "E", "department": "Sales"}])
+    insert_rows("sales", [
+        {"customer_id": 1, "employee_id": 1, "sale_date": f"2025-0{month}-1{day}", "amount": 10.0 * (month + day),
+         "product": product}
+        for month in (1, 2) for day in (1, 2) for product in ("Product A", "Product B")
+    ])
+    manager.setup()
+    assert manager.rewrite(BY_PRODUCT).rollup == "rollup_sales_month"
+    assert_rewritten_matches(engine, manager, BY_PRODUCT)
+
+
+def test_stale_rollup_is_not_used(insert_rows, manager):
+    insert_rows("sales", [sale(1)])
+    manager.setup()
+    insert_rows("sales", [sale(2, "Product B", 7.0, month=2)])
+    rewrite = manager.rewrite(BY_PRODUCT)
+    assert rewrite.rollup is None
+    assert "refreshing" in rewrite.reason
+    manager.refresh()
+    assert manager.rewrite(BY_PRODUCT).rollup is not None
+
+
+def test_setup_never_creates_tables(engine, insert_rows):
+    insert_rows("sales", [sale(1)])
+    manager = RollupManager(engine)
+    manager.setup()
+    assert not manager.enabled
+    assert manager.rewrite(BY_PRODUCT).reason == "no rollups built"
+    assert not inspect(engine).has_table("rollup_state")
+
+
+def test_sale_committed_below_the_watermark_is_folded_in(engine, insert_rows, manager):
+    # Sale 3 was still uncommitted when the rollup caught up to sale 4
+    insert_rows("sales", [sale(1), sale(2, "Product B"), sale(4)])
+    manager.setup()
+    rollup = manager.rollups[0]
+    assert manager.lag(rollup) == 0
+    assert manager.status()[0]["gaps"] == 1
+
+    insert_rows("sales", [sale(3, "Product B", 5.0)])
+    assert manager.lag(rollup) == 1
+    assert "refreshing" in manager.rewrite(BY_PRODUCT).reason
+    assert manager.refresh()[rollup.name] == 1
+    assert manager.lag(rollup) == 0
+    assert manager.status()[0]["gaps"] == 0
+    assert_rewritten_matches(engine, manager, BY_PRODUCT)
+
+
+def test_gaps_expire(insert_rows, engine):
+    create_tables(engine)
+    manager = RollupManager(engine, gap_retention=0)
+    insert_rows("sales", [sale(1), sale(5)])
+    manager.setup()
+    assert manager.status()[0]["gaps"] == 1
+    manager.refresh()
+    assert manager.status()[0]["gaps"] == 0
+
+
+def test_dimension_change_forces_a_rebuild(engine, insert_rows, manager):
+    insert_rows("customers", [{"customer_id": 1, "name": "A", "country": "France"}])
+    insert_rows("employees", [{"employee_id": 1, "name": "E", "department": "Sales"}])
+    insert_rows("sales", [sale(1), sale(2)])
+    manager.setup()
+    assert_rewritten_matches(engine, manager, BY_DEPARTMENT)
+
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE employees SET department = 'Marketing' WHERE employee_id = 1"))
+    rollup = manager.rollups[0]
+    assert manager.lag(rollup) is None
+    assert "needs a rebuild" in manager.rewrite(BY_DEPARTMENT).reason
+    # The employee rollup carries no department
+    assert manager.lag(manager.rollups[1]) == 0
+
+    manager.refresh()
+    assert manager.lag(rollup) == 0
+    assert_rewritten_matches(engine, manager, BY_DEPARTMENT)
+
+
+def test_table_versions_gate_dimension_reads(engine, insert_rows, manager):
+    insert_rows("employees", [{"employee_id": 1, "name": "E", "department": "Sales"}])
+    insert_rows("sales", [sale(1)])
+    manager.versions = TableVersions()
+    manager.setup()
+    rollup = manager.rollups[0]
+    assert manager.lag(rollup) == 0
+
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE employees SET department = 'Marketing' WHERE employee_id = 1"))
+    # Not re-read until the change monitor reports the write
+    assert manager.lag(rollup) == 0
+    manager.versions.bump("employees")
+    assert manager.lag(rollup) is None
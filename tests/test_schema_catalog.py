@@ -0,0 +1,75 @@
+from sqlalchemy import text
+
+from schema_catalog import SchemaCatalog
+
+
+def test_load_reads_tables_keys_and_foreign_keys(catalog):
+    assert catalog.table_names() == ["customers", "employees", "project_assignments", "projects", "sales"]
+    sales = catalog.table("sales")
+    assert sales.primary_key == ("sale_id",)
+    assert {fk.referred_table for fk in sales.foreign_keys} == {"customers", "employees"}
+    assert sales.column("amount") is not None
+    assert catalog.version == 1
+
+
+def test_fingerprint_is_stable_without_schema_changes(engine, catalog):
+    fingerprint = catalog.fingerprint
+    assert catalog.refresh() == []
+    assert catalog.fingerprint == fingerprint
+    assert catalog.version == 1
+
+    # Row changes are not schema changes
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO customers (name, country) VALUES ('A', 'France')"))
+    assert catalog.refresh() == []
+
+    other = SchemaCatalog(engine)
+    other.load()
+    assert other.fingerprint == fingerprint
+
+
+def test_refresh_reinspects_only_changed_tables(engine, catalog):
+    fingerprint = catalog.fingerprint
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE customers ADD COLUMN segment VARCHAR(20)"))
+    assert catalog.refresh() == ["customers"]
+    assert catalog.fingerprint != fingerprint
+    assert catalog.version == 2
+    assert catalog.table("customers").column("segment") is not None
+
+
+def test_refresh_picks_up_added_and_removed_tables(engine, catalog):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE regions (region_id INTEGER PRIMARY KEY, name VARCHAR(50))"))
+    assert catalog.refresh() == ["regions"]
+    assert "regions" in catalog.table_names()
+    fingerprint = catalog.fingerprint
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE regions"))
+    assert catalog.refresh() == ["regions"]
+    assert catalog.table("regions") is None
+    assert catalog.fingerprint != fingerprint
+
+
+def test_excluded_prefixes_are_hidden(engine):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE rollup_test (id INTEGER PRIMARY KEY)"))
+    catalog = SchemaCatalog(engine, exclude_prefixes=("rollup_",))
+    catalog.load()
+    assert catalog.table("rollup_test") is None
+
+
+def test_ensure_fresh_waits_for_the_refresh_interval(engine):
+    catalog = SchemaCatalog(engine, refresh_interval=3600)
+    catalog.load()
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE customers ADD COLUMN segment VARCHAR(20)"))
+    assert catalog.ensure_fresh() == []
+    catalog.refresh_interval = 0
+    assert catalog.ensure_fresh() == ["customers"]
+
+
+def test_describe_renders_prompt_format(catalog):
+    description = catalog.describe(["projects"])
+    assert description.startswith("Table: projects\nColumns: project_id (INTEGER)")
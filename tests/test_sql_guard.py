@@ -0,0 +1,72 @@
+import pytest
+
+from sql_guard import SQLGuard, SQLRejected, is_denied_function
+
+
+@pytest.fixture
+def guard():
+    return SQLGuard(max_rows=100)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT pg_sleep(10)",
+    "SELECT pg_catalog.pg_sleep(10)",
+    "SELECT pg_advisory_xact_lock(1)",
+    "SELECT PG_Try_Advisory_Lock_Shared(1)",
+    "SELECT lo_unlink(1)",
+    "SELECT * FROM dblink('host=x', 'SELECT 1') AS t(a int)",
+    "SELECT pg_read_file('/etc/passwd')",
+    "SELECT set_config('statement_timeout', '0', false)",
+    "SELECT name FROM customers WHERE customer_id = pg_terminate_backend(1)",
+])
+def test_denied_functions_are_rejected(guard, sql):
+    with pytest.raises(SQLRejected) as excinfo:
+        guard.prepare(sql)
+    assert excinfo.value.decision.action == "rejected"
+    assert "is not allowed" in excinfo.value.decision.reason
+
+
+def test_denylist_leaves_ordinary_functions_alone():
+    assert not is_denied_function("lower")
+    assert not is_denied_function("pg_size_pretty")
+    assert is_denied_function("pg_ls_dir")
+    assert is_denied_function("pg_file_write")
+
+
+@pytest.mark.parametrize("sql, reason", [
+    ("SELECT 1; DROP TABLE customers", "single parseable statement"),
+    ("SELECT 1; SELECT 2", "single parseable statement"),
+    ("DELETE FROM customers", "Only SELECT"),
+    ("WITH gone AS (DELETE FROM sales RETURNING *) SELECT * FROM gone", "data-modifying"),
+    ("SELECT * INTO copy FROM customers", "SELECT INTO"),
+    ("SELECT * FROM customers FOR UPDATE", "Row locking"),
+])
+def test_non_read_only_statements_are_rejected(guard, sql, reason):
+    with pytest.raises(SQLRejected, match=reason):
+        guard.prepare(sql)
+
+
+def test_limit_is_injected_one_above_the_cap(guard):
+    decision = guard.prepare("SELECT name FROM customers")
+    assert decision.action == "limited"
+    assert decision.limit == 100
+    assert decision.sql.endswith("LIMIT 101")
+
+
+def test_larger_limit_is_clamped(guard):
+    decision = guard.prepare("SELECT name FROM customers LIMIT 5000")
+    assert decision.action == "limited"
+    assert decision.sql.endswith("LIMIT 101")
+
+
+def test_smaller_limit_is_kept(guard):
+    decision = guard.prepare("SELECT name FROM customers LIMIT 10")
+    assert decision.action == "allowed"
+    assert decision.sql == "SELECT name FROM customers LIMIT 10"
+    assert decision.limit == 10
+
+
+def test_no_limit_without_row_cap():
+    decision = SQLGuard(max_rows=0).prepare("SELECT name FROM customers")
+    assert decision.action == "allowed"
+    assert decision.limit is None
@@ -0,0 +1,46 @@
+import pytest
+
+from table_router import TableRouter, tokenize, value_terms
+
+
+@pytest.fixture
+def router(catalog):
+    return TableRouter(catalog)
+
+
+def test_tokenize_stems_and_drops_numbers():
+    assert tokenize("Customers' join_date in 2024") == ["customer", "join", "date", "in"]
+
+
+def test_value_terms():
+    assert value_terms('Customers in Germany who bought "Widget Pro". Sales in USA') == {"germany", "widget", "pro",
+                                                                                       "usa"}
+
+
+@pytest.mark.parametrize("question, tables", [
+    ("How many customers in Germany?", ["customers"]),
+    ("What is the average salary by department?", ["employees"]),
+    ("Total revenue per product", ["sales"]),
+    ("Which initiatives have the most funding?", ["projects"]),
+])
+def test_routes_to_single_table(router, question, tables):
+    decision = router.route(question)
+    assert decision.tables == tables
+    assert decision.method == "local"
+    assert decision.confidence >= 0.6
+
+
+def test_join_tables_are_added(router):
+    decision = router.route("Which staff were assigned to each initiative?")
+    assert {"employees", "projects"} <= set(decision.tables)
+    assert "project_assignments" in decision.tables
+
+
+def test_unknown_question_has_no_confidence(router):
+    decision = router.route("Who is the best astronaut?")
+    assert decision.tables == []
+    assert decision.confidence == 0.0
+
+
+def test_unknown_common_words_lower_confidence(router):
+    assert router.route("customers with astronaut spaceship").confidence < 0.6
@@ -0,0 +1,78 @@
+import pytest
+
+from prompt_builder import ColumnProfiler
+from result_cache import TableVersions
+from value_index import ValueIndex, normalize_value
+
+COUNTRIES = ["United States of America", "Australia", "Germany", "Côte d'Ivoire", "France"]
+STATUSES = ["Completed", "In Progress", "On Hold", "Planning"]
+PRODUCTS = ["Product A", "Product B", "Product C", "Service X"]
+
+
+@pytest.fixture
+def versions():
+    return TableVersions()
+
+
+@pytest.fixture
+def index(engine, catalog, insert_rows, versions):
+    insert_rows("customers", [{"name": f"C{i}", "country": c} for i, c in enumerate(COUNTRIES * 3)])
+    insert_rows("projects", [{"name": f"P{i}", "status": s} for i, s in enumerate(STATUSES * 3)])
+    insert_rows("sales", [{"customer_id": 1, "employee_id": 1, "amount": 10.0, "product": p} for p in PRODUCTS * 3])
+    index = ValueIndex(catalog, ColumnProfiler(engine, max_values=1000), versions=versions,
+                       columns=["customers.country", "projects.status", "sales.product"])
+    index.ensure_fresh()
+    return index
+
+
+def test_normalize_value():
+    assert normalize_value("In-Progress") == "in progress"
+    assert normalize_value("  Côte  d'Ivoire ") == "cote d ivoire"
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM projects WHERE status = 'in-progress'", "'In Progress'"),
+    ("SELECT * FROM projects WHERE LOWER(status) = 'ON HOLD'", "'on hold'"),
+    ("SELECT * FROM customers c WHERE c.country IN ('cote d ivoire', 'germany')", "'Germany'"),
+    ("SELECT * FROM customers WHERE country = 'USA'", "'United States of America'"),
+])
+def test_normalized_and_acronym_matches_are_repaired(index, sql, expected):
+    repaired, repairs, suggestions = index.repair(sql)
+    assert repairs
+    assert expected in repaired
+    assert not suggestions
+
+
+def test_exact_values_are_left_alone(index):
+    sql = "SELECT * FROM projects WHERE status = 'Planning'"
+    assert index.repair(sql) == (sql, [], [])
+
+
+@pytest.mark.parametrize("sql, literal, suggestion", [
+    # A different value that merely looks similar may be absent from the data on purpose
+    ("SELECT * FROM customers WHERE country = 'Austria'", "Austria", "Australia"),
+    ("SELECT * FROM sales WHERE product = 'Product AB'", "Product AB", "Product A"),
+])
+def test_similar_values_are_only_suggested(index, sql, literal, suggestion):
+    repaired, repairs, suggestions = index.repair(sql)
+    assert repaired == sql
+    assert repairs == []
+    assert suggestions[0].original == literal
+    assert suggestions[0].value == suggestion
+
+
+def test_repair_thresholds_are_configurable(index):
+    index.repair_similarity = 0.0
+    index.repair_margin = 0.0
+    repaired, repairs, _ = index.repair("SELECT * FROM customers WHERE country = 'Austria'")
+    assert "'Australia'" in repaired
+    assert repairs[0].score < 0.9
+
+
+def test_changed_table_is_reprofiled(index, insert_rows, versions):
+    insert_rows("customers", [{"name": f"J{i}", "country": "Japan"} for i in range(3)])
+    assert index.repair("SELECT * FROM customers WHERE country = 'japan'")[1] == []
+    versions.bump("customers")
+    assert index.ensure_fresh() == ["customers"]
+    repaired, repairs, _ = index.repair("SELECT * FROM customers WHERE country = 'japan'")
+    assert "'Japan'" in repaired